@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import click
@@ -5,15 +6,28 @@ from loguru import logger
 from peewee import fn
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
-from tornado.wsgi import WSGIContainer
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
 
 from sand.app import get_flask_app
 from sand.commands.load import load_dataset
+from sand.commands.recode import recode
+from sand.commands.reindex import reindex
 from sand.container import use_container
+from sand.controllers.transformation import init_transform_pool
 from sand.helpers.dependency_injection import use_auto_inject
-from sand.models import Project, SemanticModel, Table, TableRow, Transformation
+from sand.helpers.wsgi import StreamingWSGIContainer
+from sand.models import Project, all_tables
 from sand.models import db as dbconn
 from sand.models import init_db
+from sand.models.base import close_db
+from sand.models.codec import CODECS, CodecName
+from sand.models.columnar import set_column_chunks
+from sand.models.job import fail_interrupted_jobs
+from sand.models.transformation import (
+    restore_interrupted_executions,
+    set_cache_budget,
+)
 
 
 @click.command()
@@ -21,9 +35,7 @@ from sand.models import init_db
 def init(db):
     """Init database"""
     init_db(db)
-    dbconn.create_tables(
-        [Project, Table, TableRow, SemanticModel, Transformation], safe=True
-    )
+    dbconn.create_tables(all_tables, safe=True)
     if Project.select().where(fn.Lower(Project.name) == "default").count() == 0:
         Project(name="Default", description="The default project").save()
 
@@ -41,6 +53,68 @@ def init(db):
     "--certfile", default=None, help="Path to the certificate signing request"
 )
 @click.option("--keyfile", default=None, help="Path to the key file")
+@click.option(
+    "--threads",
+    default=8,
+    help="Number of threads handling requests in a server process (0 to handle requests on the event loop one at a time)",
+)
+@click.option(
+    "--workers",
+    default=1,
+    help="Number of server processes sharing the port (0 to use one per CPU core)",
+)
+@click.option(
+    "--transform-processes",
+    default=0,
+    help="Number of processes per server process running transformations over large tables in parallel (0 to run them in the request thread)",
+)
+@click.option(
+    "--transform-cache-size",
+    default=256,
+    help="Maximum size in MB of the cached outputs of transformations reused when a pipeline is executed again (0 to disable)",
+)
+@click.option(
+    "--max-upload-size",
+    default=0,
+    help="Maximum size in MB of uploaded files (0 for no limit)",
+)
+@click.option(
+    "--db-busy-timeout",
+    default=5000,
+    help="Milliseconds to wait for a database lock before failing",
+)
+@click.option(
+    "--db-synchronous",
+    default="NORMAL",
+    type=click.Choice(["OFF", "NORMAL", "FULL", "EXTRA"], case_sensitive=False),
+    help="SQLite synchronous level",
+)
+@click.option(
+    "--db-mmap-size",
+    default=256 * 1024 * 1024,
+    help="Maximum number of bytes of the database file to memory-map",
+)
+@click.option(
+    "--db-cache-size",
+    default=-64 * 1024,
+    help="SQLite page cache size (negative numbers are in KiB)",
+)
+@click.option(
+    "--db-read-pool-size",
+    default=8,
+    help="Number of read-only connections for heavy read requests (0 to disable)",
+)
+@click.option(
+    "--db-codec",
+    default="json",
+    type=click.Choice(CODECS),
+    help="Codec of table rows and semantic models written to the database",
+)
+@click.option(
+    "--column-chunks",
+    is_flag=True,
+    help="Also store the cells of tables by columns so that column operations do not decode every row",
+)
 def start(
     db: str,
     config: Optional[str],
@@ -48,8 +122,37 @@ def start(
     port: int,
     certfile: str,
     keyfile: str,
+    threads: int,
+    workers: int,
+    transform_processes: int,
+    transform_cache_size: int,
+    max_upload_size: int,
+    db_busy_timeout: int,
+    db_synchronous: str,
+    db_mmap_size: int,
+    db_cache_size: int,
+    db_read_pool_size: int,
+    db_codec: CodecName,
+    column_chunks: bool,
 ):
-    init_db(db)
+    init_db(
+        db,
+        busy_timeout=db_busy_timeout,
+        synchronous=db_synchronous.upper(),  # type: ignore
+        mmap_size=db_mmap_size,
+        cache_size=db_cache_size,
+        read_pool_size=db_read_pool_size,
+        codec=db_codec,
+    )
+    set_cache_budget(transform_cache_size * 1024 * 1024)
+    set_column_chunks(column_chunks)
+    # create the tables added by newer versions of SAND in an existing database
+    dbconn.create_tables(all_tables, safe=True)
+    # jobs of the previous run of the server can not be resumed, and the tables whose
+    # transformations were being executed are restored
+    fail_interrupted_jobs()
+    restore_interrupted_executions()
+    dbconn.close()
 
     if certfile is None or keyfile is None:
         ssl_options = None
@@ -57,17 +160,38 @@ def start(
         ssl_options = {"certfile": certfile, "keyfile": keyfile}
         assert not wsgi
 
+    if not wsgi:
+        sockets = bind_sockets(port, address="0.0.0.0")
+        if workers != 1:
+            # fork before opening the database and the container so that processes do
+            # not share connections or file handles
+            fork_processes(workers)
+
     with use_container(config) as container:
         with use_auto_inject(container):
-            app = get_flask_app()
+            app = get_flask_app(
+                max_upload_size=(
+                    max_upload_size * 1024 * 1024 if max_upload_size > 0 else None
+                )
+            )
 
+            init_transform_pool(transform_processes)
             if wsgi:
                 app.run(host="0.0.0.0", port=port)
             else:
-                logger.info("Start server in non-wsgi mode")
-                http_server = HTTPServer(WSGIContainer(app), ssl_options=ssl_options)
-                http_server.listen(address="0.0.0.0", port=port)
-                IOLoop.instance().start()
+                logger.info(
+                    "Start server in non-wsgi mode with {} threads per process",
+                    threads,
+                )
+                executor = ThreadPoolExecutor(threads) if threads > 0 else None
+                http_server = HTTPServer(
+                    StreamingWSGIContainer(
+                        app, executor=executor, on_response_done=close_db
+                    ),
+                    ssl_options=ssl_options,
+                )
+                http_server.add_sockets(sockets)
+                IOLoop.current().start()
 
 
 @click.command()
@@ -99,6 +223,8 @@ cli.add_command(start)
 cli.add_command(create)
 cli.add_command(remove)
 cli.add_command(load_dataset)
+cli.add_command(reindex)
+cli.add_command(recode)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,24 @@
 import os
+from typing import Optional
 
 from dependency_injector.wiring import Provide, inject
 from flask import jsonify
-from gena import generate_api, generate_app, generate_readonly_api_4dict
+from gena import generate_app, generate_readonly_api_4dict
 from sm.misc.funcs import identity_func
 from werkzeug.exceptions import HTTPException
 
-import sand.deserializer as sand_deser
 import sand.serializer as sand_ser
 from sand.controllers.assistant import assistant_bp
+from sand.controllers.job import job_bp
 from sand.controllers.project import project_bp
 from sand.controllers.search import search_bp
+from sand.controllers.semantic_model import semantic_model_bp
 from sand.controllers.settings import setting_bp
 from sand.controllers.table import table_bp, table_row_bp
 from sand.controllers.transformation import transformation_bp
 from sand.helpers.namespace import NamespaceService
-from sand.models import EntityAR, SemanticModel
+from sand.models import EntityAR
+from sand.models.base import close_db, connect_db
 from sand.models.ontology import OntClassAR, OntPropertyAR
 
 
@@ -25,7 +28,13 @@ def get_flask_app(
     entities: EntityAR = Provide["entities"],
     classes: OntClassAR = Provide["classes"],
     properties: OntPropertyAR = Provide["properties"],
+    max_upload_size: Optional[int] = None,
 ):
+    """Create the app
+
+    Args:
+        max_upload_size: maximum size in bytes of a request (e.g., uploaded tables), None for no limit
+    """
     app = generate_app(
         [
             table_bp,
@@ -35,11 +44,8 @@ def get_flask_app(
             setting_bp,
             search_bp,
             transformation_bp,
-            generate_api(
-                SemanticModel,
-                deserializers={"data": sand_deser.deserialize_graph},
-                batch_serialize=sand_ser.batch_serialize_sms,
-            ),
+            semantic_model_bp,
+            job_bp,
             generate_readonly_api_4dict(
                 "entities",
                 serialize=sand_ser.serialize_entity,
@@ -61,6 +67,10 @@ def get_flask_app(
         os.path.dirname(__file__),
     )
 
+    # each request (thread) uses its own connection
+    app.before_request(connect_db)
+    app.teardown_request(close_db)
+
     @app.errorhandler(HTTPException)
     def handle_exception(e):
         """Return JSON instead of HTML for HTTP errors."""
@@ -74,5 +84,7 @@ def get_flask_app(
             e.code,
         )
 
-    app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # maximum upload of 16 MB
+    # uploaded files are spooled to disk and parsed incrementally (see
+    # `sand.controllers.helpers.upload`), so large uploads do not need to fit in memory
+    app.config["MAX_CONTENT_LENGTH"] = max_upload_size
     return app
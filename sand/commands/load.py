@@ -24,6 +24,8 @@ from sand.models import (
 from sand.models import db as dbconn
 from sand.models import init_db
 from sand.models.ontology import OntClassAR, OntPropertyAR
+from sand.models.column_stats import ColumnProfiler
+from sand.models.table import bulk_insert_rows
 
 
 @click.command(name="load")
@@ -121,7 +123,12 @@ def save_example(project: Project, example: Example[FullTable]):
     mtbl.save()
 
     for row in mrows:
-        row.save()
+        row.table = mtbl
+    profiler = ColumnProfiler(len(mtbl.columns))
+    with profiler.filling(mtbl):
+        bulk_insert_rows(mrows)
+    profiler.update([row.row for row in mrows])
+    profiler.save(mtbl)
 
     for i, sm in enumerate(example.sms):
         # make sure that the semantic model has all columns in the table
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from typing import List, Tuple, Type
+
+import click
+from peewee import Field
+from tqdm.auto import tqdm
+
+from sand.models import SemanticModel, SemanticModelVersion, TableRow
+from sand.models import db as dbconn
+from sand.models import init_db
+from sand.models.base import BaseModel
+from sand.models.codec import CODECS, CodecName
+
+# fields whose values are written with the codec
+ENCODED_FIELDS: List[Tuple[Type[BaseModel], List[Field]]] = [
+    (TableRow, [TableRow.row, TableRow.links]),
+    (SemanticModel, [SemanticModel.data]),
+    (SemanticModelVersion, [SemanticModelVersion.data]),
+]
+
+
+@click.command(name="recode")
+@click.option("-d", "--db", required=True, help="sand database file")
+@click.option(
+    "--codec",
+    required=True,
+    type=click.Choice(CODECS),
+    help="Codec to re-encode the values with",
+)
+@click.option(
+    "--vacuum/--no-vacuum",
+    default=True,
+    help="Whether to vacuum the database afterward to reclaim the free space",
+)
+@click.option("--batch-size", default=500, help="Number of records updated at once")
+def recode(db: str, codec: CodecName, vacuum: bool, batch_size: int):
+    """Re-encode table rows and semantic models of a database with a codec in place. Run
+    `sand start` with the same `--db-codec` so that new values use the codec as well.
+    """
+    init_db(db, codec=codec)
+
+    for model, fields in ENCODED_FIELDS:
+        total = model.select().count()
+        with tqdm(total=total, desc=f"Re-encoding {model.__name__}") as pbar:
+            last_id = 0
+            while True:
+                with dbconn.atomic():
+                    records = list(
+                        model.select(model.id, *fields)
+                        .where(model.id > last_id)
+                        .order_by(model.id)
+                        .limit(batch_size)
+                    )
+                    if len(records) == 0:
+                        break
+                    model.bulk_update(records, fields=fields)
+                last_id = records[-1].id
+                pbar.update(len(records))
+
+    if vacuum:
+        dbconn.execute_sql("VACUUM")
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import click
+from tqdm.auto import tqdm
+
+from sand.models import Project, Table, all_tables
+from sand.models import db as dbconn
+from sand.models import init_db
+from sand.models.cell_link import index_table_links
+from sand.models.cell_search import index_table_search
+from sand.models.cell_text import index_table_texts
+from sand.models.columnar import build_column_chunks
+
+
+@click.command(name="reindex")
+@click.option("-d", "--db", required=True, help="sand database file")
+@click.option("-p", "--project", default=None, help="Only reindex tables of a project")
+@click.option(
+    "--column-chunks",
+    is_flag=True,
+    help="Also build the column chunks of tables (see `sand start --column-chunks`)",
+)
+def reindex(db: str, project: Optional[str], column_chunks: bool):
+    """Rebuild the indices derived from the rows of tables (e.g., cell links, texts, and the full-text search index).
+    Run it once after upgrading a database created by an older version of SAND.
+    """
+    init_db(db)
+    dbconn.create_tables(all_tables, safe=True)
+
+    query = Table.select()
+    if project is not None:
+        query = query.join(Project).where(Project.name == project)
+
+    for table in tqdm(list(query), desc="Reindexing tables"):
+        reindex_table(table, column_chunks)
+
+
+def reindex_table(table: Table, column_chunks: bool = False):
+    with dbconn.atomic():
+        index_table_links(table)
+        index_table_texts(table)
+        index_table_search(table)
+        if column_chunks:
+            build_column_chunks(table)
@@ -16,9 +16,11 @@ from sand.config import AppConfig
 from sand.extension_interface.assistant import IAssistant
 from sand.helpers.service_provider import MultiServiceProvider
 from sand.helpers.tree_utils import TreeStruct
+from sand.models.base import read_only_db
+from sand.models.cell_link import CellCandidateEntity, CellLink
 from sand.models.entity import Entity, EntityAR
 from sand.models.ontology import OntClass, OntClassAR
-from sand.models.table import Link, Table, TableRow
+from sand.models.table import Link, Table, TableRow, TableRows
 
 
 @dataclass
@@ -37,6 +39,7 @@ assistant_bp = Blueprint("assistant", "assistant")
     f"/{assistant_bp.name}/predict/<table_id>",
     methods=["GET"],
 )
+@read_only_db()
 @inject
 def predict_semantic_desc(
     table_id: int,
@@ -46,9 +49,8 @@ def predict_semantic_desc(
     ontprop_ar: OntClassAR = Provide["properties"],
 ):
     table = Table.get_by_id(table_id)
-    rows: List[TableRow] = list(
-        TableRow.select().where(TableRow.table == table).order_by(TableRow.index)
-    )
+    # assistants index and modify the rows (`IAssistant.predict` takes a list)
+    rows = list(TableRows(table))
 
     selected_assistants = {
         name: assistant_service.get(name)
@@ -136,21 +138,30 @@ def gather_column_types(
     if args.column >= len(table.columns):
         raise BadRequest(f"Invalid column {args.column} value")
 
-    rows: List[TableRow] = list(TableRow.select().where(TableRow.table == table))
-    column = str(args.column)
-    ents: Dict[str, Optional[Entity]] = {}
-
     nil_entity_id = appcfg.entity.nil.id
-    for row in rows:
-        for link in row.links.get(column, []):
-            if (
-                link.entity_id is not None
-                and link.entity_id != nil_entity_id
-                and link.entity_id not in ents
-            ):
-                ents[link.entity_id] = entity_ar.get(link.entity_id, None)
-            for can_ent in link.candidate_entities:
-                ents[can_ent.entity_id] = entity_ar.get(can_ent.entity_id, None)
+    entity_ids = {
+        link.entity_id
+        for link in CellLink.select(CellLink.entity_id)
+        .distinct()
+        .where(
+            (CellLink.table == table)
+            & (CellLink.column == args.column)
+            & (CellLink.entity_id.is_null(False))
+            & (CellLink.entity_id != nil_entity_id)
+        )
+    }
+    entity_ids.update(
+        can_ent.entity_id
+        for can_ent in CellCandidateEntity.select(CellCandidateEntity.entity_id)
+        .distinct()
+        .where(
+            (CellCandidateEntity.table == table)
+            & (CellCandidateEntity.column == args.column)
+        )
+    )
+    ents: Dict[str, Optional[Entity]] = {
+        entity_id: entity_ar.get(entity_id, None) for entity_id in entity_ids
+    }
 
     classes: Dict[str, OntClass] = {}
     for ent in ents.values():
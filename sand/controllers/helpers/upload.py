@@ -1,12 +1,31 @@
 from uuid import uuid4
+import codecs
 import csv
+import importlib.util
+import json
+import re
+import shutil
+from contextlib import ExitStack, nullcontext
 from dataclasses import dataclass
-from io import StringIO
-from typing import Dict, List, Literal, Optional, Union, cast
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Union,
+)
 
 import orjson
+from peewee import chunked
+from sand.models.column_stats import ColumnProfiler
+from sand.models.job import Job, update_job_progress
 from sand.models.project import Project
-from sand.models.table import Link, Table, TableRow
+from sand.models.table import Link, Table, TableRow, bulk_insert_rows
 from werkzeug.datastructures import FileStorage
 from sand.models import db
 
@@ -24,16 +43,70 @@ class JSONParserOpts:
     format: Literal["json"] = "json"
 
 
-ParserOpts = Union[CSVParserOpts, JSONParserOpts]
+@dataclass
+class JSONLParserOpts:
+    """Options of JSON Lines files (a JSON object per line)"""
+
+    format: Literal["jsonl"] = "jsonl"
+
+
+@dataclass
+class ParquetParserOpts:
+    format: Literal["parquet"] = "parquet"
+    # names of the columns to read, None to read all columns
+    columns: Optional[List[str]] = None
+    # indices of the row groups to read, None to read all row groups
+    row_groups: Optional[List[int]] = None
+    # number of rows of the record batches read at once
+    batch_size: int = 1000
+
+
+@dataclass
+class ArrowParserOpts:
+    """Options of Arrow IPC files (file or stream format, e.g., feather v2 files)"""
+
+    format: Literal["arrow"] = "arrow"
+    # names of the columns to read, None to read all columns
+    columns: Optional[List[str]] = None
+
+
+ParserOpts = Union[
+    CSVParserOpts, JSONParserOpts, JSONLParserOpts, ParquetParserOpts, ArrowParserOpts
+]
+PARSER_OPTS = {
+    "csv": CSVParserOpts,
+    "json": JSONParserOpts,
+    "jsonl": JSONLParserOpts,
+    "parquet": ParquetParserOpts,
+    "arrow": ArrowParserOpts,
+}
 
 
 @dataclass
 class RawTable:
     name: str
     header: List[str]
-    # each item in the outer list of `rows` and `links` is for a row
-    rows: List[List[Union[str, int, float]]]
-    links: List[Dict[str, List[Link]]]
+    # each item of `rows` and `links` is for a row. They can be iterated more than once
+    # and may be parsed from the uploaded file every time they are iterated (`CSVRows`)
+    rows: Iterable[List[Union[str, int, float]]]
+    # None if the rows do not have links
+    links: Optional[Iterable[Dict[str, List[Link]]]]
+    # number of rows
+    size: int
+
+    def to_preview(self, n_rows: int) -> dict:
+        """Serialize the table with only its first rows"""
+        return {
+            "name": self.name,
+            "header": self.header,
+            "rows": list(islice(self.rows, n_rows)),
+            "links": (
+                list(islice(self.links, n_rows))
+                if self.links is not None
+                else [{} for _ in range(min(n_rows, self.size))]
+            ),
+            "size": self.size,
+        }
 
 
 @dataclass
@@ -42,7 +115,20 @@ class UploadingTable:
     tables: List[RawTable]
 
 
-ALLOWED_EXTENSIONS = {"json", "csv", "tsv"}
+ALLOWED_EXTENSIONS = {
+    "json",
+    "jsonl",
+    "ndjson",
+    "csv",
+    "tsv",
+    "parquet",
+    "arrow",
+    "feather",
+}
+# number of rows of the uploaded tables returned before they are saved
+PREVIEW_SIZE = 100
+# number of rows inserted at once when saving uploaded tables
+UPLOAD_BATCH_SIZE = 1000
 
 
 def get_extension(filename: str) -> Optional[str]:
@@ -52,89 +138,239 @@ def get_extension(filename: str) -> Optional[str]:
     return lst[1].lower()
 
 
-def save_upload(project: Project, raw_tables: List[RawTable]) -> List[Table]:
-    """Save the upload results to the database"""
-    with db.transaction():
-        cursor = Table.select(Table.name).where(
-            (Table.project == project) & (Table.name.in_([x.name for x in raw_tables]))
+def save_upload(
+    project: Project,
+    raw_tables: List[RawTable],
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> List[Table]:
+    """Save the upload results to the database
+
+    By default, the tables are saved in a single transaction. If `on_batch` is given (e.g.,
+    to record the progress of a job), each batch of rows is inserted in its own
+    transaction in which `on_batch` is called with the number of inserted rows, and the
+    saved tables are deleted if it raises or the insertion fails.
+    """
+    with db.transaction() if on_batch is None else nullcontext():
+        with db.atomic():
+            tables = create_tables(project, raw_tables)
+
+        try:
+            for raw_table, table in zip(raw_tables, tables):
+                if raw_table.links is None:
+                    rows = (
+                        TableRow(table=table, index=i, row=row, links={})
+                        for i, row in enumerate(raw_table.rows)
+                    )
+                else:
+                    rows = (
+                        TableRow(table=table, index=i, row=row, links=links)
+                        for i, (row, links) in enumerate(
+                            zip(raw_table.rows, raw_table.links)
+                        )
+                    )
+                # the columns are profiled in the same pass as the insertion
+                profiler = ColumnProfiler(len(raw_table.header))
+                with profiler.filling(table):
+                    for batch in chunked(rows, UPLOAD_BATCH_SIZE):
+                        with db.atomic():
+                            bulk_insert_rows(batch)
+                            if on_batch is not None:
+                                on_batch(len(batch))
+                        profiler.update([row.row for row in batch])
+                profiler.save(table)
+        except:
+            if on_batch is not None:
+                with db.atomic():
+                    for table in tables:
+                        table.delete_instance()
+            raise
+        return tables
+
+
+def create_tables(project: Project, raw_tables: List[RawTable]) -> List[Table]:
+    """Create the (empty) tables of the upload results, renaming the tables whose names
+    are already used in the project
+    """
+    cursor = Table.select(Table.name).where(
+        (Table.project == project) & (Table.name.in_([x.name for x in raw_tables]))
+    )
+    existing_names = {x.name for x in cursor}
+
+    tables = []
+    for raw_table in raw_tables:
+        if raw_table.name not in existing_names:
+            name = raw_table.name
+        else:
+            name = f"{raw_table.name}-{str(uuid4()).replace('-', '')}"
+
+        table = Table(
+            name=name,
+            description="",
+            columns=raw_table.header,
+            project=project,
+            size=raw_table.size,
+            context_values=[],
+            context_tree=[],
         )
-        existing_names = {x.name for x in cursor}
-
-        tables = []
-        for raw_table in raw_tables:
-            if raw_table.name not in existing_names:
-                name = raw_table.name
-            else:
-                name = f"{raw_table.name}-{str(uuid4()).replace('-', '')}"
-
-            table = Table(
-                name=name,
-                description="",
-                columns=raw_table.header,
-                project=project,
-                size=len(raw_table.rows),
-                context_values=[],
-                context_tree=[],
-            )
-            table.save()
-            tables.append(table)
-
-        table_rows = []
-        for raw_table, table in zip(raw_tables, tables):
-            for i, row in enumerate(raw_table.rows):
-                table_rows.append(
-                    TableRow(table=table, index=i, row=row, links=raw_table.links[i])
+        table.save()
+        tables.append(table)
+    return tables
+
+
+def select_tables(
+    tables: List[UploadingTable], selected_tables: List[int]
+) -> List[RawTable]:
+    """Get the selected tables of the upload results (indices of the tables of all
+    files), renaming tables of the same name
+
+    Raises:
+        ValueError: the selected tables are invalid
+    """
+    raw_tables = [raw_table for table in tables for raw_table in table.tables]
+    if (
+        not isinstance(selected_tables, list)
+        or len(selected_tables) == 0
+        or any(
+            not isinstance(x, int) or x < 0 or x >= len(raw_tables)
+            for x in selected_tables
+        )
+    ):
+        raise ValueError("`selected_tables` must be a list of numbers")
+
+    # rename duplicated tables
+    names = {}
+    for i, tbl in enumerate(raw_tables):
+        if tbl.name not in names:
+            names[tbl.name] = [i, 1]
+        else:
+            names[tbl.name][1] += 1
+            raw_tables[names[tbl.name][0]].name = tbl.name + "-1"
+            tbl.name = tbl.name + "-" + str(names[tbl.name][1])
+
+    return [raw_tables[i] for i in selected_tables]
+
+
+def run_upload_job(job: Job) -> dict:
+    """Parse the uploaded files kept by an upload job and save the selected tables,
+    recording the number of parsed and inserted rows in the job.
+
+    Params of the job: `project` (id), `dir` (directory of the uploaded files, removed
+    afterward), `files` (list of `filename`, `path` and `parser_opts` of each file), and
+    `selected_tables`.
+    """
+    try:
+        with ExitStack() as stack:
+            # files are kept open as rows of CSV files are parsed again when saved
+            tables: List[UploadingTable] = []
+            for file in job.params["files"]:
+                if file["parser_opts"] is None:
+                    parser_opts = None
+                else:
+                    parser_opts = PARSER_OPTS[file["parser_opts"]["format"]](
+                        **file["parser_opts"]
+                    )
+                f = stack.enter_context(open(file["path"], "rb"))
+                tables += parse_upload(parser_opts, FileStorage(f, file["filename"]))
+                update_job_progress(
+                    job,
+                    n_parsed=sum(
+                        raw_table.size for table in tables for raw_table in table.tables
+                    ),
                 )
 
-        TableRow.bulk_create(table_rows, batch_size=200)
-        return tables
+            raw_tables = select_tables(tables, job.params["selected_tables"])
+            update_job_progress(
+                job, n_rows=sum(raw_table.size for raw_table in raw_tables)
+            )
 
+            def on_batch(n_rows: int):
+                update_job_progress(job, n_inserted=job.n_inserted + n_rows)
 
-def parse_upload(
-    user_preferred_parser_opts: Optional[ParserOpts], file: FileStorage
-) -> List[UploadingTable]:
-    assert file.filename is not None
+            dbtables = save_upload(
+                Project.get_by_id(job.params["project"]), raw_tables, on_batch
+            )
+        return {"table_ids": [table.id for table in dbtables]}
+    finally:
+        shutil.rmtree(job.params["dir"], ignore_errors=True)
 
-    name = file.filename.rsplit(".", 1)[0]
+
+def get_parser_opts(
+    user_preferred_parser_opts: Optional[ParserOpts], filename: str
+) -> ParserOpts:
+    """Get the options of the parser of a file: the options preferred by the user if any,
+    otherwise the default options of the format of its extension
+
+    Raises:
+        ValueError: the format is not supported, or its parser needs the `arrow` extra
+            that is not installed
+    """
     if user_preferred_parser_opts is not None:
         parser_opts = user_preferred_parser_opts
     else:
-        ext = get_extension(file.filename)
+        ext = get_extension(filename)
         if ext in {"csv", "tsv"}:
             delimiter = "," if ext == "csv" else "\t"
             parser_opts = CSVParserOpts(format="csv", delimiter=delimiter)
         elif ext == "json":
             parser_opts = JSONParserOpts(format="json")
+        elif ext in {"jsonl", "ndjson"}:
+            parser_opts = JSONLParserOpts(format="jsonl")
+        elif ext == "parquet":
+            parser_opts = ParquetParserOpts(format="parquet")
+        elif ext in {"arrow", "feather"}:
+            parser_opts = ArrowParserOpts(format="arrow")
         else:
             raise ValueError(f"Invalid format: {ext}")
 
+    if (
+        isinstance(parser_opts, (ParquetParserOpts, ArrowParserOpts))
+        and not has_pyarrow()
+    ):
+        raise ValueError(
+            "Uploading Parquet or Arrow files requires pyarrow. Install the `arrow` extra with `pip install web-sand[arrow]`"
+        )
+    return parser_opts
+
+
+def parse_upload(
+    user_preferred_parser_opts: Optional[ParserOpts], file: FileStorage
+) -> List[UploadingTable]:
+    assert file.filename is not None
+
+    name = file.filename.rsplit(".", 1)[0]
+    parser_opts = get_parser_opts(user_preferred_parser_opts, file.filename)
     if isinstance(parser_opts, CSVParserOpts):
         return parse_csv_file(name, file, parser_opts)
 
-    if isinstance(parser_opts, JSONParserOpts):
+    if isinstance(parser_opts, (JSONParserOpts, JSONLParserOpts)):
         return parse_json_file(name, file, parser_opts)
 
+    if isinstance(parser_opts, (ParquetParserOpts, ArrowParserOpts)):
+        return parse_arrow_file(name, file, parser_opts)
+
     raise NotImplementedError()
 
 
 def parse_csv_file(name: str, file: FileStorage, parser_opts: CSVParserOpts):
-    reader = csv.reader(StringIO(file.read().decode()), delimiter=parser_opts.delimiter)
-    rows = list(reader)
-
-    n_columns = max(len(row) for row in rows)
+    """Parse a CSV file without loading it into memory: the file is scanned once for the
+    number of rows and columns, and its rows are parsed again when they are iterated
+    (see `CSVRows`).
+    """
+    header = None
+    n_columns = 0
+    n_rows = 0
+    for row in iter_csv_rows(file, parser_opts):
+        if header is None and parser_opts.first_row_is_header:
+            header = row
+        else:
+            n_rows += 1
+        n_columns = max(n_columns, len(row))
 
-    if parser_opts.first_row_is_header:
-        header, rows = rows[0], rows[1:]
-        if len(header) < n_columns:
-            for i in range(len(header), n_columns):
-                header.append(f"")
+    if header is not None:
+        header.extend([""] * (n_columns - len(header)))
     else:
         header = [""] * n_columns
 
-    for row in rows:
-        if len(row) < n_columns:
-            row.extend([""] * (n_columns - len(row)))
-
     return [
         UploadingTable(
             parser_opts=parser_opts,
@@ -142,41 +378,363 @@ def parse_csv_file(name: str, file: FileStorage, parser_opts: CSVParserOpts):
                 RawTable(
                     name=name,
                     header=header,
-                    rows=cast(List[List[Union[str, int, float]]], rows),
-                    links=[{} for _ in rows],
+                    rows=CSVRows(file, parser_opts, n_columns),
+                    links=None,
+                    size=n_rows,
                 )
             ],
         )
     ]
 
 
-def parse_json_file(name: str, file: FileStorage, parser_opts: JSONParserOpts):
-    records = orjson.loads(file.read())
-    if not isinstance(records, list):
-        raise Exception("JSON file must contain a list of rows")
-
-    # now normalize and check the content & construct schema
+def iter_csv_rows(file: FileStorage, parser_opts: CSVParserOpts) -> Iterator[List[str]]:
+    """Parse rows of an uploaded CSV file from its beginning"""
+    return csv.reader(iter_text_lines(file), delimiter=parser_opts.delimiter)
+
+
+def iter_text_lines(file: FileStorage, chunk_size: int = 1024 * 1024) -> Iterator[str]:
+    """Decode the lines of an uploaded UTF-8 file from its beginning, reading it by
+    chunks. Lines keep their line endings as expected by `csv.reader`.
+    """
+    pending = ""
+    for text in iter_text_chunks(file, chunk_size):
+        lines = (pending + text).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if pending != "":
+        yield pending
+
+
+def iter_text_chunks(file: FileStorage, chunk_size: int = 1024 * 1024) -> Iterator[str]:
+    """Decode an uploaded UTF-8 file from its beginning by chunks of (at most)
+    `chunk_size` bytes. Characters split between chunks are decoded in the next chunk.
+    """
+    file.stream.seek(0)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        data = file.stream.read(chunk_size)
+        text = decoder.decode(data, final=len(data) == 0)
+        if text != "":
+            yield text
+        if len(data) == 0:
+            break
+
+
+class CSVRows(Iterable[List[Union[str, int, float]]]):
+    """Rows of an uploaded CSV file (without the header), padded to the same number of
+    columns. They are parsed from the file every time they are iterated, so only the rows
+    being processed are in memory.
+    """
+
+    def __init__(self, file: FileStorage, parser_opts: CSVParserOpts, n_columns: int):
+        self.file = file
+        self.parser_opts = parser_opts
+        self.n_columns = n_columns
+
+    def __iter__(self) -> Iterator[List[Union[str, int, float]]]:
+        rows = iter_csv_rows(self.file, self.parser_opts)
+        if self.parser_opts.first_row_is_header:
+            next(rows, None)
+        for row in rows:
+            if len(row) < self.n_columns:
+                row.extend([""] * (self.n_columns - len(row)))
+            yield row
+
+
+def parse_json_file(
+    name: str, file: FileStorage, parser_opts: Union[JSONParserOpts, JSONLParserOpts]
+):
+    """Parse a JSON file of a list of records or a JSON Lines file without loading it
+    into memory: the records are scanned once to discover the attributes (columns) and
+    check their values, and they are parsed again when the rows are iterated (see
+    `JSONRows`).
+    """
     attrs = {}
-    for record in records:
-        for key, value in record:
+    n_rows = 0
+    for record in iter_json_records(file, parser_opts):
+        if not isinstance(record, dict):
+            raise ValueError(f"Record {n_rows} is not a JSON object")
+        for key, value in record.items():
             if key not in attrs:
                 attrs[key] = len(attrs)
 
             if value is not None and not isinstance(value, (str, int, float)):
-                raise Exception(
+                raise ValueError(
                     f"Invalid value type for attribute {key}. Expect string, number, or null"
                 )
+        n_rows += 1
 
-    rows = []
     header = list(attrs.keys())
-    for record in records:
-        rows.append([record.get(key, None) for key in attrs])
+    return [
+        UploadingTable(
+            parser_opts=parser_opts,
+            tables=[
+                RawTable(
+                    name=name,
+                    header=header,
+                    rows=JSONRows(file, parser_opts, header),
+                    links=None,
+                    size=n_rows,
+                )
+            ],
+        )
+    ]
+
+
+def iter_json_records(
+    file: FileStorage, parser_opts: Union[JSONParserOpts, JSONLParserOpts]
+) -> Iterator[Any]:
+    """Parse records of an uploaded JSON or JSON Lines file from its beginning"""
+    if isinstance(parser_opts, JSONLParserOpts):
+        for line in iter_text_lines(file):
+            if line.strip() != "":
+                yield orjson.loads(line)
+    else:
+        yield from iter_json_array(file)
+
+
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# the longest partial token at the end of a buffer that is reported as an error before
+# the end (e.g., `tru` of true or `\u00` of an escape)
+JSON_MAX_PARTIAL_TOKEN = 6
+
+
+def iter_json_array(file: FileStorage, chunk_size: int = 1024 * 1024) -> Iterator[Any]:
+    """Parse the items of a JSON array in an uploaded file one by one, reading the file
+    by chunks so that only the items being parsed are in memory.
+
+    Raises:
+        ValueError: the file is not a valid JSON array
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter_text_chunks(file, chunk_size)
+    buf = ""
+    pos = 0
+
+    def next_char() -> Optional[str]:
+        """Skip whitespaces and get the next character, None at the end of the file"""
+        nonlocal buf, pos
+        while True:
+            m = JSON_WHITESPACE.match(buf, pos)
+            pos = m.end()
+            if pos < len(buf):
+                return buf[pos]
+            chunk = next(chunks, None)
+            if chunk is None:
+                return None
+            buf = chunk
+            pos = 0
+
+    if next_char() != "[":
+        raise ValueError("JSON file must contain a list of rows")
+    pos += 1
+    if next_char() == "]":
+        pos += 1
+    else:
+        while True:
+            if next_char() is None:
+                raise ValueError("Unexpected end of the JSON file")
+            while True:
+                try:
+                    item, pos = decoder.raw_decode(buf, pos)
+                    break
+                except json.JSONDecodeError as e:
+                    # the item may continue in the next chunks only if the error is at
+                    # the end of the buffer (an unterminated string or a partial token),
+                    # otherwise the item is invalid
+                    if not (
+                        e.pos >= len(buf) - JSON_MAX_PARTIAL_TOKEN
+                        or e.msg.startswith("Unterminated string")
+                    ):
+                        raise ValueError(f"Invalid JSON file: {e}")
+                    # read at least as much as the partial item so that a large item is
+                    # parsed again a logarithmic number of times
+                    parts = [buf[pos:]]
+                    size = 0
+                    while size < max(len(parts[0]), 1):
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        parts.append(chunk)
+                        size += len(chunk)
+                    if size == 0:
+                        raise ValueError(f"Invalid JSON file: {e}")
+                    buf = "".join(parts)
+                    pos = 0
+            yield item
+
+            char = next_char()
+            pos += 1
+            if char == "]":
+                break
+            if char != ",":
+                raise ValueError(
+                    f"Invalid JSON file: expect `,` or `]` after an item, got {char!r}"
+                )
+    if next_char() is not None:
+        raise ValueError("Invalid JSON file: unexpected data after the list of rows")
+
+
+class JSONRows(Iterable[List[Union[str, int, float]]]):
+    """Rows of an uploaded JSON or JSON Lines file, with the values of the records'
+    attributes in the order of the header. They are parsed from the file every time they
+    are iterated, so only the rows being processed are in memory.
+    """
+
+    def __init__(
+        self,
+        file: FileStorage,
+        parser_opts: Union[JSONParserOpts, JSONLParserOpts],
+        header: List[str],
+    ):
+        self.file = file
+        self.parser_opts = parser_opts
+        self.header = header
+
+    def __iter__(self) -> Iterator[List[Union[str, int, float]]]:
+        for record in iter_json_records(self.file, self.parser_opts):
+            yield [record.get(key, None) for key in self.header]
+
+
+def parse_arrow_file(
+    name: str, file: FileStorage, parser_opts: Union[ParquetParserOpts, ArrowParserOpts]
+):
+    """Parse a Parquet or Arrow IPC file. Only the metadata is read here, the rows are
+    read by record batches when they are iterated (see `ArrowRows`).
+    """
+    pa = _get_pyarrow()
+    try:
+        reader = _open_arrow_file(file, parser_opts)
+        schema = reader.schema
+        if isinstance(parser_opts, ParquetParserOpts):
+            metadata = reader.metadata
+            row_groups = parser_opts.row_groups
+            if row_groups is None:
+                row_groups = range(metadata.num_row_groups)
+            size = sum(metadata.row_group(i).num_rows for i in row_groups)
+            schema = schema.to_arrow_schema()
+        else:
+            size = sum(batch.num_rows for batch in _iter_ipc_batches(reader))
+    except (pa.ArrowException, IndexError) as e:
+        raise ValueError(f"Invalid {parser_opts.format} file {file.filename}: {e}")
+
+    header = parser_opts.columns if parser_opts.columns is not None else schema.names
+    for column in header:
+        if column not in schema.names:
+            raise ValueError(f"Column {column} is not in the file {file.filename}")
 
     return [
         UploadingTable(
             parser_opts=parser_opts,
             tables=[
-                RawTable(name=name, header=header, rows=rows, links=[{} for _ in rows])
+                RawTable(
+                    name=name,
+                    header=list(header),
+                    rows=ArrowRows(file, parser_opts, list(header)),
+                    links=None,
+                    size=size,
+                )
             ],
         )
     ]
+
+
+class ArrowRows(Iterable[List[Union[str, int, float]]]):
+    """Rows of an uploaded Parquet or Arrow IPC file, read from the file by record
+    batches every time they are iterated. Each batch is converted column by column:
+    numbers, strings and booleans are converted to Python values by Arrow, other types
+    (e.g., dates, timestamps, decimals) are cast to strings by Arrow, and nested values
+    are serialized as JSON strings.
+    """
+
+    def __init__(
+        self,
+        file: FileStorage,
+        parser_opts: Union[ParquetParserOpts, ArrowParserOpts],
+        columns: List[str],
+    ):
+        self.file = file
+        self.parser_opts = parser_opts
+        self.columns = columns
+
+    def __iter__(self) -> Iterator[List[Union[str, int, float]]]:
+        reader = _open_arrow_file(self.file, self.parser_opts)
+        if isinstance(self.parser_opts, ParquetParserOpts):
+            batches = reader.iter_batches(
+                batch_size=self.parser_opts.batch_size,
+                row_groups=self.parser_opts.row_groups,
+                columns=self.columns,
+            )
+        else:
+            batches = _iter_ipc_batches(reader)
+
+        for batch in batches:
+            columns = [
+                _arrow_column_to_list(batch.column(name)) for name in self.columns
+            ]
+            for row in zip(*columns):
+                yield list(row)
+
+
+def _open_arrow_file(
+    file: FileStorage, parser_opts: Union[ParquetParserOpts, ArrowParserOpts]
+):
+    pa = _get_pyarrow()
+    file.stream.seek(0)
+    if isinstance(parser_opts, ParquetParserOpts):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(file.stream)
+
+    try:
+        return pa.ipc.open_file(file.stream)
+    except pa.ArrowInvalid:
+        # not the file format, try the stream format
+        file.stream.seek(0)
+        return pa.ipc.open_stream(file.stream)
+
+
+def _iter_ipc_batches(reader):
+    """Iterate over record batches of an Arrow IPC file or stream reader"""
+    if hasattr(reader, "num_record_batches"):
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+    else:
+        yield from reader
+
+
+def _arrow_column_to_list(array) -> list:
+    pa = _get_pyarrow()
+    dtype = array.type
+    if (
+        pa.types.is_integer(dtype)
+        or pa.types.is_floating(dtype)
+        or pa.types.is_string(dtype)
+        or pa.types.is_large_string(dtype)
+        or pa.types.is_boolean(dtype)
+        or pa.types.is_null(dtype)
+    ):
+        return array.to_pylist()
+    if pa.types.is_nested(dtype):
+        return [
+            orjson.dumps(value).decode() if value is not None else None
+            for value in array.to_pylist()
+        ]
+    if pa.types.is_dictionary(dtype):
+        return _arrow_column_to_list(array.dictionary_decode())
+    return array.cast(pa.string()).to_pylist()
+
+
+def has_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _get_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "pyarrow is required to upload Parquet or Arrow files. Install the `arrow` extra with `pip install web-sand[arrow]`"
+        )
+    return pyarrow
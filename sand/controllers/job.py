@@ -0,0 +1,94 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from flask import jsonify
+from flask.blueprints import Blueprint
+from loguru import logger
+from werkzeug.exceptions import BadRequest, NotFound
+
+from sand.models.base import close_db, connect_db, db, is_memory_db
+from sand.models.job import Job, JobCancelled
+
+job_bp = Blueprint("jobs", "jobs")
+
+# thread running the jobs of the server process one at a time (SQLite has a single
+# writer anyway), created on the first submitted job
+_job_executor: Optional[ThreadPoolExecutor] = None
+_job_executor_lock = threading.Lock()
+
+
+@job_bp.route(f"/{job_bp.name}/<id>", methods=["GET"])
+def get_job(id: int):
+    """Get the status and progress of a job"""
+    job = Job.get_or_none(Job.id == id)
+    if job is None:
+        raise NotFound(f"Job {id} is not found")
+    return jsonify(job.to_dict())
+
+
+@job_bp.route(f"/{job_bp.name}/<id>/cancel", methods=["POST"])
+def cancel_job(id: int):
+    """Request a job to cancel. The job stops at its next checkpoint and its work is
+    rolled back.
+    """
+    with db.atomic():
+        job = Job.get_or_none(Job.id == id)
+        if job is None:
+            raise NotFound(f"Job {id} is not found")
+        if job.is_finished():
+            raise BadRequest(f"Job {id} has already finished")
+        job.cancel_requested = True
+        job.save(only=[Job.cancel_requested])
+    return jsonify(job.to_dict())
+
+
+def submit_job(job: Job, func: Callable[[Job], Optional[dict]]):
+    """Run a saved job in the background thread. `func` does the work, records its
+    progress with `update_job_progress`, and returns the result of the job.
+
+    Jobs run in the calling thread when the database is in memory as the database is
+    not shared with other threads.
+    """
+    global _job_executor
+    if is_memory_db():
+        run_job(job.id, func)
+        return
+
+    with _job_executor_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(1, thread_name_prefix="sand-job")
+    _job_executor.submit(run_job, job.id, func)
+
+
+def run_job(job_id: int, func: Callable[[Job], Optional[dict]]):
+    """Run a job and record its status"""
+    connect_db()
+    try:
+        job = Job.get_by_id(job_id)
+        if job.cancel_requested:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.save()
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+        job.save(only=[Job.status, Job.started_at])
+        try:
+            job.result = func(job)
+            job.status = "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.error("Job {} failed:\n{}", job_id, traceback.format_exc())
+            job.errors = job.errors + [str(e)]
+            job.status = "failed"
+        job.finished_at = time.time()
+        job.save(
+            only=[Job.result, Job.status, Job.errors, Job.finished_at],
+        )
+    finally:
+        close_db()
@@ -1,3 +1,4 @@
+import os
 import tempfile
 from dataclasses import asdict
 from pathlib import Path
@@ -13,24 +14,40 @@ from werkzeug.exceptions import BadRequest
 
 from sand.controllers.helpers.upload import (
     ALLOWED_EXTENSIONS,
+    ArrowParserOpts,
     CSVParserOpts,
+    JSONLParserOpts,
     JSONParserOpts,
+    PREVIEW_SIZE,
+    ParquetParserOpts,
     UploadingTable,
     get_extension,
+    get_parser_opts,
     parse_upload,
+    run_upload_job,
     save_upload,
+    select_tables,
 )
-from sand.controllers.table import get_friendly_fs_name
-from sand.models import Project
-from sand.models.semantic_model import SemanticModel
-from sand.models.table import Table, TableRow
+from sand.controllers.job import submit_job
+from sand.controllers.table import get_friendly_fs_name, parse_limit
+from sand.models import Job, Project
+from sand.models.base import read_only_db
+from sand.models.cell_search import search_cells
+from sand.models.semantic_model import get_semantic_models
+from sand.models.table import Table, iter_rows
 
 project_bp = generate_api(Project)
 
 deser_CSVParserOpts = get_dataclass_deserializer(CSVParserOpts, {})
 deser_JSONParserOpts = get_dataclass_deserializer(JSONParserOpts, {})
+deser_JSONLParserOpts = get_dataclass_deserializer(JSONLParserOpts, {})
+deser_ParquetParserOpts = get_dataclass_deserializer(ParquetParserOpts, {})
+deser_ArrowParserOpts = get_dataclass_deserializer(ArrowParserOpts, {})
 assert deser_CSVParserOpts is not None
 assert deser_JSONParserOpts is not None
+assert deser_JSONLParserOpts is not None
+assert deser_ParquetParserOpts is not None
+assert deser_ArrowParserOpts is not None
 
 
 @project_bp.route(f"/{project_bp.name}/<id>/upload", methods=["POST"])
@@ -75,15 +92,23 @@ def upload(id: int):
                 parser_opts[file_id] = deser_CSVParserOpts(opts)
             elif opts["format"] == "json":
                 parser_opts[file_id] = deser_JSONParserOpts(opts)
+            elif opts["format"] == "jsonl":
+                parser_opts[file_id] = deser_JSONLParserOpts(opts)
+            elif opts["format"] == "parquet":
+                parser_opts[file_id] = deser_ParquetParserOpts(opts)
+            elif opts["format"] == "arrow":
+                parser_opts[file_id] = deser_ArrowParserOpts(opts)
             else:
                 raise BadRequest(f"Invalid format `{file_id}`.")
     else:
         parser_opts = {}
 
-    # parse the content
-    tables: List[UploadingTable] = []
+    # reject unsupported formats before the files are parsed or saved for a job
     for file_id, file in files.items():
-        tables += parse_upload(parser_opts.get(file_id, None), file)
+        try:
+            get_parser_opts(parser_opts.get(file_id, None), file.filename)
+        except ValueError as e:
+            raise BadRequest(str(e))
 
     if "selected_tables" in request.form:
         # signal that we go ahead with the selected tables and save it to the database
@@ -92,33 +117,51 @@ def upload(id: int):
         except ValueError:
             raise BadRequest("Invalid value for `selected_tables`")
 
-        raw_tables = [raw_table for table in tables for raw_table in table.tables]
-        if (
-            not isinstance(selected_tables, list)
-            or len(selected_tables) == 0
-            or any(
-                not isinstance(x, int) or x < 0 or x >= len(raw_tables)
-                for x in selected_tables
-            )
-        ):
-            raise BadRequest("`selected_tables` must be a list of numbers")
-
         try:
             project = Project.get_by_id(id)
         except:
             raise BadRequest("Project not found")
 
-        # rename duplicated tables
-        names = {}
-        for i, tbl in enumerate(raw_tables):
-            if tbl.name not in names:
-                names[tbl.name] = [i, 1]
-            else:
-                names[tbl.name][1] += 1
-                raw_tables[names[tbl.name][0]].name = tbl.name + "-1"
-                tbl.name = tbl.name + "-" + names[tbl.name][1]
+        if request.form.get("background", "false").lower() == "true":
+            # keep the files as they are removed at the end of the request, and save
+            # the tables in a job so that the request does not wait for it
+            dir = tempfile.mkdtemp(prefix="sand-upload-")
+            params = {
+                "project": project.id,
+                "dir": dir,
+                "files": [],
+                "selected_tables": selected_tables,
+            }
+            for i, (file_id, file) in enumerate(files.items()):
+                path = os.path.join(dir, str(i))
+                file.save(path)
+                opts = parser_opts.get(file_id, None)
+                params["files"].append(
+                    {
+                        "filename": file.filename,
+                        "path": path,
+                        "parser_opts": asdict(opts) if opts is not None else None,
+                    }
+                )
+            job = Job.create(type="upload", params=params)
+            submit_job(job, run_upload_job)
+            return jsonify({"status": "success", "job_id": job.id})
 
-        dbtables = save_upload(project, [raw_tables[i] for i in selected_tables])
+    # parse the content
+    tables: List[UploadingTable] = []
+    for file_id, file in files.items():
+        try:
+            tables += parse_upload(parser_opts.get(file_id, None), file)
+        except ValueError as e:
+            raise BadRequest(str(e))
+
+    if "selected_tables" in request.form:
+        try:
+            raw_tables = select_tables(tables, selected_tables)
+        except ValueError as e:
+            raise BadRequest(str(e))
+
+        dbtables = save_upload(project, raw_tables)
         return jsonify(
             {"status": "success", "table_ids": [table.id for table in dbtables]}
         )
@@ -129,7 +172,9 @@ def upload(id: int):
             "tables": [
                 {
                     "parser_opts": asdict(table.parser_opts),
-                    "tables": [asdict(raw_table) for raw_table in table.tables],
+                    "tables": [
+                        raw_table.to_preview(PREVIEW_SIZE) for raw_table in table.tables
+                    ],
                 }
                 for table in tables
             ],
@@ -137,7 +182,22 @@ def upload(id: int):
     )
 
 
+@project_bp.route(f"/{project_bp.name}/<id>/search", methods=["GET"])
+def search(id: int):
+    """Search cells of tables in the project containing all terms of the `q` query
+    parameter (see `/table/<id>/search`)
+    """
+    project = Project.get_by_id(id)
+    if "q" not in request.args:
+        raise BadRequest("Missing `q` query parameter")
+    limit = parse_limit()
+
+    matches = search_cells(request.args["q"], project=project.id, limit=limit)
+    return jsonify({"matches": [asdict(m) for m in matches]})
+
+
 @project_bp.route(f"/{project_bp.name}/<id>/export", methods=["GET"])
+@read_only_db()
 def export(id: int):
     """Export tables from the project"""
     try:
@@ -147,9 +207,13 @@ def export(id: int):
 
     examples = []
     for tbl in Table.select().where(Table.project == project):
-        tblrows = list(TableRow.select().where(TableRow.table == tbl))
+        records = []
+        links = []
+        for row in iter_rows(tbl):
+            records.append(row.row)
+            links.append(row.links)
         basetbl = I.ColumnBasedTable.from_rows(
-            records=[row.row for row in tblrows],
+            records=records,
             table_id=tbl.name,
             headers=tbl.columns,
             strict=True,
@@ -171,13 +235,11 @@ def export(id: int):
             ),
             links=M.Matrix.default(basetbl.shape(), list),
         )
-        table.links = table.links.map_index(
-            lambda ri, ci: tblrows[ri].links.get(ci, [])
-        )
+        table.links = table.links.map_index(lambda ri, ci: links[ri].get(ci, []))
 
         ex = Example(id=table.table.table_id, sms=[], table=table)
 
-        for sm in SemanticModel.select().where(SemanticModel.table == tbl):
+        for sm in get_semantic_models(tbl):
             ex.sms.append(sm.data)
 
         examples.append(ex)
@@ -0,0 +1,52 @@
+import sm.outputs.semantic_model as O
+from flask import jsonify
+from gena import generate_api
+from werkzeug.exceptions import NotFound
+
+import sand.deserializer as sand_deser
+import sand.serializer as sand_ser
+from sand.models.semantic_model import (
+    SemanticModel,
+    SemanticModelVersion,
+    reconstruct_version,
+)
+
+semantic_model_bp = generate_api(
+    SemanticModel,
+    deserializers={"data": sand_deser.deserialize_graph},
+    batch_serialize=sand_ser.batch_serialize_sms,
+)
+
+
+@semantic_model_bp.route(f"/{semantic_model_bp.name}/<id>/versions", methods=["GET"])
+def get_versions(id: int):
+    """Get the recorded versions of a semantic model"""
+    sm: SemanticModel = SemanticModel.get_by_id(id)
+    query = (
+        SemanticModelVersion.select(SemanticModelVersion.version)
+        .where(SemanticModelVersion.semantic_model == sm)
+        .order_by(SemanticModelVersion.version)
+    )
+    return jsonify({"versions": [r.version for r in query]})
+
+
+@semantic_model_bp.route(
+    f"/{semantic_model_bp.name}/<id>/versions/<version>", methods=["GET"]
+)
+def get_version(id: int, version: int):
+    """Get a version of a semantic model, serialized in the same way as the model"""
+    sm: SemanticModel = SemanticModel.get_by_id(id)
+    try:
+        data = reconstruct_version(sm.id, int(version))
+    except (ValueError, SemanticModelVersion.DoesNotExist):
+        raise NotFound(f"Version {version} of the semantic model {id} is not found")
+
+    return jsonify(
+        {
+            "id": sm.id,
+            "table": sm.table_id,
+            "name": sm.name,
+            "version": int(version),
+            "data": sand_ser.serialize_graph(O.SemanticModel.from_dict(data)),
+        }
+    )
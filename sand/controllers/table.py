@@ -2,14 +2,14 @@ from __future__ import annotations
 
 import csv
 import zipfile
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from functools import lru_cache
 from io import BytesIO, StringIO
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional
 
 import sm.outputs.semantic_model as O
 from dependency_injector.wiring import Provide, inject
-from flask import jsonify, make_response, request
+from flask import Response, jsonify, make_response, request, stream_with_context
 from gena import generate_api
 from gena.deserializer import (
     generate_deserializer,
@@ -22,13 +22,25 @@ from sm.misc.funcs import import_func
 from werkzeug.exceptions import BadRequest, NotFound
 
 from sand.config import AppConfig
+from sand.controllers.job import submit_job
 from sand.deserializer import deser_context_tree
 from sand.extension_interface.export import IExport, OutputFormat
 from sand.helpers.namespace import NamespaceService
 from sand.helpers.service_provider import MultiServiceProvider
 from sand.models import SemanticModel, Table, TableRow
+from sand.models.base import db, read_only_db
+from sand.models.cell_link import CellLink
+from sand.models.cell_search import search_cells
+from sand.models.cell_text import find_rows_by_text
+from sand.models.column_stats import (
+    find_column_stats_job,
+    get_column_stats,
+    run_column_stats_job,
+)
+from sand.models.job import Job
 from sand.models.ontology import OntClassAR, OntPropertyAR
-from sand.models.table import Link
+from sand.models.semantic_model import get_semantic_model, get_semantic_models
+from sand.models.table import Link, TableRows, notify_rows_saved
 
 table_bp = generate_api(
     Table,
@@ -49,22 +61,7 @@ def export_sms(
     ontclass_ar: OntClassAR = Provide["classes"],
     ontprop_ar: OntPropertyAR = Provide["properties"],
 ):
-    subquery = (
-        SemanticModel.select(
-            SemanticModel.id, fn.MAX(SemanticModel.version).alias("version")
-        )
-        .where(SemanticModel.table == id)
-        .group_by(SemanticModel.table, SemanticModel.name)
-        .alias("q1")
-    )
-
-    query = (
-        SemanticModel.select()
-        .where(SemanticModel.table == id)
-        .join(subquery, on=(SemanticModel.id == subquery.c.id))
-    )
-
-    sms: List[O.SemanticModel] = [r.data for r in query]
+    sms: List[O.SemanticModel] = [r.data for r in get_semantic_models(id)]
     for sm in sms:
         for n in sm.iter_nodes():
             if isinstance(n, O.ClassNode):
@@ -95,37 +92,44 @@ def export_sms(
     f"/{table_bp.name}/<id>/export-linked-entities",
     methods=["GET"],
 )
+@read_only_db()
 @inject
 def export_linked_entities(
     id: int, export: MultiServiceProvider[IExport] = Provide["export"]
 ):
     table: Table = Table.get_by_id(id)
-    rows: List[TableRow] = list(TableRow.select().where(TableRow.table == table))
-
-    output = []
-    for ri, row in enumerate(rows):
-        for ci, col in enumerate(row.row):
-            links = row.links.get(str(ci), [])
-            for link in links:
-                output.append(
-                    {
-                        "row": ri,
-                        "col": ci,
-                        "start": link.start,
-                        "end": link.end,
-                        "url": link.url,
-                        "entity": link.entity_id,
-                    }
-                )
-    f = StringIO()
-    writer = csv.writer(
-        f, delimiter=",", quoting=csv.QUOTE_MINIMAL, lineterminator="\n"
-    )
     header = ["row", "col", "start", "end", "url", "entity"]
-    writer.writerow(header)
-    for record in output:
-        writer.writerow([record[h] for h in header])
-    resp = make_response(f.getvalue())
+
+    @stream_with_context
+    def generate():
+        f = StringIO()
+        writer = csv.writer(
+            f, delimiter=",", quoting=csv.QUOTE_MINIMAL, lineterminator="\n"
+        )
+        writer.writerow(header)
+        with read_only_db():
+            query = (
+                CellLink.select(
+                    CellLink.row_index,
+                    CellLink.column,
+                    CellLink.start,
+                    CellLink.end,
+                    CellLink.url,
+                    CellLink.entity_id,
+                )
+                .where(CellLink.table == table)
+                .order_by(CellLink.row_index, CellLink.column, CellLink.link_index)
+                .tuples()
+            )
+            for i, record in enumerate(query.iterator(), start=1):
+                writer.writerow(record)
+                if i % 1000 == 0:
+                    yield f.getvalue()
+                    f.seek(0)
+                    f.truncate()
+        yield f.getvalue()
+
+    resp = Response(generate(), mimetype="text/csv")
     resp.headers["Content-Type"] = "text/csv; charset=utf-8"
     if request.args.get("attachment", "false") == "true":
         resp.headers["Content-Disposition"] = (
@@ -138,6 +142,7 @@ def export_linked_entities(
     f"/{table_bp.name}/<id>/export-full-model",
     methods=["GET"],
 )
+@read_only_db()
 @inject
 def export_full_model(
     id: int, export: MultiServiceProvider[IExport] = Provide["export"]
@@ -145,38 +150,9 @@ def export_full_model(
     # load table
     table: Table = Table.get_by_id(id)
 
-    # load models
-    subquery = (
-        SemanticModel.select(
-            SemanticModel.id, fn.MAX(SemanticModel.version).alias("version")
-        )
-        .where(SemanticModel.table == table)
-        .group_by(SemanticModel.table, SemanticModel.name)
-        .alias("q1")
-    )
-    query = (
-        SemanticModel.select()
-        .where(SemanticModel.table == table)
-        .join(subquery, on=(SemanticModel.id == subquery.c.id))
-    )
-    sms: List[SemanticModel] = list(query)
-
-    if len(sms) == 0:
-        raise BadRequest("Exporting data requires the table to be modeled")
-
-    if "sm" in request.args:
-        sms = [sm for sm in sms if sm.name == request.args["sm"]]
-        if len(sms) == 0:
-            raise BadRequest(
-                f"The semantic model with name {request.args['sm']} is not found"
-            )
-    else:
-        if len(sms) != 1:
-            raise BadRequest(
-                "There are more than one semantic model for this table. Please specify the semantic model you want to export via the 'sm' query parameter"
-            )
-    sm = sms[0]
-    rows: List[TableRow] = list(TableRow.select().where(TableRow.table == table))
+    # load model
+    sm = get_exported_semantic_model(table)
+    rows = TableRows(table)
     export_obj = export.get_default()
     datamodel = export_obj.export_data_model(table, sm.data)
     resources = export_obj.export_extra_resources(table, rows, sm.data)
@@ -204,6 +180,7 @@ def export_full_model(
     f"/{table_bp.name}/<id>/export",
     methods=["GET"],
 )
+@read_only_db()
 @inject
 def export_table_data(
     id: int, export: MultiServiceProvider[IExport] = Provide["export"]
@@ -218,40 +195,11 @@ def export_table_data(
     # load table
     table: Table = Table.get_by_id(id)
 
-    # load models
-    subquery = (
-        SemanticModel.select(
-            SemanticModel.id, fn.MAX(SemanticModel.version).alias("version")
-        )
-        .where(SemanticModel.table == table)
-        .group_by(SemanticModel.table, SemanticModel.name)
-        .alias("q1")
-    )
-    query = (
-        SemanticModel.select()
-        .where(SemanticModel.table == table)
-        .join(subquery, on=(SemanticModel.id == subquery.c.id))
-    )
-    sms: List[SemanticModel] = list(query)
-
-    if len(sms) == 0:
-        raise BadRequest("Exporting data requires the table to be modeled")
-
-    if "sm" in request.args:
-        sms = [sm for sm in sms if sm.name == request.args["sm"]]
-        if len(sms) == 0:
-            raise BadRequest(
-                f"The semantic model with name {request.args['sm']} is not found"
-            )
-    else:
-        if len(sms) != 1:
-            raise BadRequest(
-                "There are more than one semantic model for this table. Please specify the semantic model you want to export via the 'sm' query parameter"
-            )
-    sm = sms[0]
+    # load model
+    sm = get_exported_semantic_model(table)
 
-    # load rows
-    rows: List[TableRow] = list(TableRow.select().where(TableRow.table == table))
+    # rows are streamed from the database when the exporter iterates over them
+    rows = TableRows(table)
 
     try:
         content = export_func.export_data(
@@ -271,6 +219,203 @@ def export_table_data(
     return resp
 
 
+@table_bp.route(
+    f"/{table_bp.name}/<id>/columns/<column>/links",
+    methods=["GET"],
+)
+def get_column_linked_rows(id: int, column: int):
+    """Get indices of rows whose cell in the column links to the entity given in the
+    `entity` query parameter, or whose cell does not link to any entity if `linked=false`.
+    """
+    table: Table = Table.get_by_id(id)
+    column = parse_column(table, column)
+
+    if "entity" in request.args:
+        query = (
+            CellLink.select(CellLink.row_index)
+            .distinct()
+            .where(
+                (CellLink.table == table)
+                & (CellLink.column == column)
+                & (CellLink.entity_id == request.args["entity"])
+            )
+            .order_by(CellLink.row_index)
+        )
+    elif request.args.get("linked", "true") == "false":
+        linked_rows = CellLink.select(CellLink.row_index).where(
+            (CellLink.table == table)
+            & (CellLink.column == column)
+            & (CellLink.entity_id.is_null(False))
+        )
+        query = (
+            TableRow.select(TableRow.index.alias("row_index"))
+            .where((TableRow.table == table) & (TableRow.index.not_in(linked_rows)))
+            .order_by(TableRow.index)
+        )
+    else:
+        raise BadRequest("Expect either `entity` or `linked=false` query parameter")
+
+    return jsonify({"rows": [r.row_index for r in query]})
+
+
+@table_bp.route(
+    f"/{table_bp.name}/<id>/columns/<column>/link-stats",
+    methods=["GET"],
+)
+@inject
+def get_column_link_stats(id: int, column: int, appcfg: AppConfig = Provide["appcfg"]):
+    """Get statistics of the links of a column: number of cells that link to an entity,
+    to the NIL entity, or to nothing, and the most frequent linked entities (at most
+    `limit`, default 100).
+    """
+    table: Table = Table.get_by_id(id)
+    column = parse_column(table, column)
+    limit = parse_limit()
+    nil_entity_id = appcfg.entity.nil.id
+
+    cond = (
+        (CellLink.table == table)
+        & (CellLink.column == column)
+        & (CellLink.entity_id.is_null(False))
+    )
+    n_nil = (
+        CellLink.select(CellLink.row_index)
+        .distinct()
+        .where(cond & (CellLink.entity_id == nil_entity_id))
+        .count()
+    )
+    n_linked_cells = CellLink.select(CellLink.row_index).distinct().where(cond).count()
+    n_rows = TableRow.select().where(TableRow.table == table).count()
+
+    count = fn.COUNT(fn.DISTINCT(CellLink.row_index))
+    query = (
+        CellLink.select(CellLink.entity_id, count.alias("count"))
+        .where(cond & (CellLink.entity_id != nil_entity_id))
+        .group_by(CellLink.entity_id)
+        .order_by(count.desc(), CellLink.entity_id)
+        .limit(limit)
+    )
+
+    return jsonify(
+        {
+            "n_rows": n_rows,
+            "n_linked": n_linked_cells - n_nil,
+            "n_nil": n_nil,
+            "n_unlinked": n_rows - n_linked_cells,
+            "entities": [{"entity_id": r.entity_id, "count": r.count} for r in query],
+        }
+    )
+
+
+@table_bp.route(
+    f"/{table_bp.name}/<id>/column-stats",
+    methods=["GET"],
+)
+def get_table_column_stats(id: int):
+    """Get the profile of each column of the table: its inferred type, the number of
+    empty and (estimated) distinct values, the most frequent values, and the min, max,
+    and histogram of the numeric values. Stats are computed when the rows are uploaded
+    or loaded. After the rows are modified, the stored stats are returned as stale
+    until they are computed again (see `compute_table_column_stats`), `job_id` is the
+    job computing them if any.
+    """
+    table: Table = Table.get_by_id(id)
+    stats, stale = get_column_stats(table)
+    job = find_column_stats_job(table)
+    return jsonify(
+        {
+            "columns": [s.to_dict() for s in stats],
+            "stale": stale,
+            "job_id": job.id if job is not None else None,
+        }
+    )
+
+
+@table_bp.route(
+    f"/{table_bp.name}/<id>/column-stats",
+    methods=["POST"],
+)
+def compute_table_column_stats(id: int):
+    """Start a job computing the stats of the columns of the table again, unless one is
+    already pending or running. Returns the id of the job.
+    """
+    table: Table = Table.get_by_id(id)
+    # the write lock is taken before looking for the job, so concurrent requests
+    # wait for each other and do not start duplicated jobs
+    with db.atomic("IMMEDIATE"):
+        job = find_column_stats_job(table)
+        is_new_job = job is None
+        if job is None:
+            job = Job.create(type="column_stats", params={"table": table.id})
+    if is_new_job:
+        submit_job(job, run_column_stats_job)
+    return jsonify({"job_id": job.id})
+
+
+@table_bp.route(
+    f"/{table_bp.name}/<id>/search",
+    methods=["GET"],
+)
+def search_table(id: int):
+    """Search cells of the table containing all terms of the `q` query parameter (the
+    last term is matched as a prefix). Returns at most `limit` (default 100) matches with
+    the matched terms highlighted.
+    """
+    table: Table = Table.get_by_id(id)
+    if "q" not in request.args:
+        raise BadRequest("Missing `q` query parameter")
+    limit = parse_limit()
+
+    matches = search_cells(request.args["q"], table=table.id, limit=limit)
+    return jsonify({"matches": [asdict(m) for m in matches]})
+
+
+def get_exported_semantic_model(table: Table) -> SemanticModel:
+    """Get the semantic model of the table to export, which is given by the `sm` query
+    parameter or the only model of the table. Only the data of the chosen model is loaded.
+    """
+    if "sm" in request.args:
+        sm = get_semantic_model(table, request.args["sm"])
+        if sm is not None:
+            return sm
+        if len(get_semantic_models(table, with_data=False, limit=1)) == 0:
+            raise BadRequest("Exporting data requires the table to be modeled")
+        raise BadRequest(
+            f"The semantic model with name {request.args['sm']} is not found"
+        )
+
+    sms = get_semantic_models(table, with_data=False, limit=2)
+    if len(sms) == 0:
+        raise BadRequest("Exporting data requires the table to be modeled")
+    if len(sms) != 1:
+        raise BadRequest(
+            "There are more than one semantic model for this table. Please specify the semantic model you want to export via the 'sm' query parameter"
+        )
+    return SemanticModel.get_by_id(sms[0].id)
+
+
+def parse_column(table: Table, column: str | int) -> int:
+    try:
+        column = int(column)
+    except ValueError:
+        raise BadRequest(f"Column {column} is not an integer")
+    if column < 0 or column >= len(table.columns):
+        raise BadRequest(f"Invalid column {column} value")
+    return column
+
+
+def parse_limit(default: int = 100) -> int:
+    """Get the positive integer `limit` query parameter of the request"""
+    limit = request.args.get("limit", str(default))
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise BadRequest(f"Limit {limit} is not an integer")
+    if limit <= 0:
+        raise BadRequest(f"Invalid limit {limit} value")
+    return limit
+
+
 @lru_cache
 @inject
 def get_export(
@@ -279,7 +424,13 @@ def get_export(
     return import_func(appcfg.export.get_func(name))()
 
 
-table_row_bp = generate_api(TableRow)
+table_row_bp = generate_api(
+    TableRow,
+    deserializers=dict(
+        links=get_deserializer_from_type(Dict[str, List[Link]], {}),
+        **generate_deserializer(TableRow, known_field_deserializers={"links"}),
+    ),
+)
 deser_list_links = get_deserializer_from_type(List[Link], {})
 assert deser_list_links is not None
 
@@ -349,7 +500,7 @@ def update_cell_link(id: int, column: int):
     else:
         row.links[str(column)] = deser_list_links(request_json["links"])
 
-    row.save()
+    row.save(only=[TableRow.links])
     return jsonify({"success": True})
 
 
@@ -364,29 +515,38 @@ def update_column_links():
     if args.column >= len(table.columns):
         raise BadRequest(f"Invalid column {args.column} value")
 
-    rows: List[TableRow] = list(TableRow.select().where(TableRow.table == table))
     str_column = str(args.column)
-    for row in rows:
-        if str(row.row[args.column]) != args.text:
-            continue
-
-        if str_column not in row.links:
-            row.links[str_column] = [
-                Link(
-                    start=0,
-                    end=len(str(row.row[args.column])),
-                    url=None,
-                    entity_id=args.entity_id,
-                    candidate_entities=[],
+    with db.atomic():
+        # find the matched rows using the text index, then update their links in bulk
+        row_ids = find_rows_by_text(table, args.column, args.text)
+        for i in range(0, len(row_ids), 500):
+            rows: List[TableRow] = [
+                row
+                for row in TableRow.select().where(
+                    TableRow.id.in_(row_ids[i : i + 500])
                 )
+                if str(row.row[args.column]) == args.text
             ]
-        else:
-            db_link = row.links[str_column][0]
-            db_link.start = 0
-            db_link.end = len(str(row.row[args.column]))
-            db_link.entity_id = args.entity_id
-
-        row.save()
+            for row in rows:
+                if str_column not in row.links:
+                    row.links[str_column] = [
+                        Link(
+                            start=0,
+                            end=len(args.text),
+                            url=None,
+                            entity_id=args.entity_id,
+                            candidate_entities=[],
+                        )
+                    ]
+                else:
+                    db_link = row.links[str_column][0]
+                    db_link.start = 0
+                    db_link.end = len(args.text)
+                    db_link.entity_id = args.entity_id
+
+            if len(rows) > 0:
+                TableRow.bulk_update(rows, fields=[TableRow.links])
+                notify_rows_saved(rows, {"links"})
     return jsonify({"success": True})
 
 
@@ -1,18 +1,52 @@
+import ast
+import bisect
+import hashlib
+import heapq
+import multiprocessing
 import sys
+import threading
+import time
 import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from types import CodeType, FrameType, FunctionType
 from typing import Dict, List, Callable, Any, Union, Iterable, Tuple, Optional, Literal
+from typing import Deque, Generator, Iterator
 from typing_extensions import NotRequired, TypedDict
 from dataclasses import dataclass
 
-from flask import jsonify, request
+from flask import Response, json, jsonify, request, stream_with_context
 from flask.blueprints import Blueprint
 from RestrictedPython import compile_restricted_function, safe_globals
+from RestrictedPython.Eval import default_guarded_getiter
+from RestrictedPython.Guards import guarded_iter_unpack_sequence
+import orjson
+from peewee import chunked
 from werkzeug.exceptions import BadRequest
 
-from sand.models.table import Link, Table, TableRow
+from sand.helpers.native_ops import NativeTransform, compile_native
+from sand.models.base import db
+from sand.models.columnar import column_fingerprints
+from sand.models.table import (
+    Link,
+    Table,
+    TableRow,
+    iter_rows,
+    notify_rows_saved,
+    sample_rows,
+)
+from sand.models.transformation import (
+    cache_chunk,
+    evict_cached_outputs,
+    get_cache_budget,
+    get_cached_chunks,
+    get_cached_outputs,
+    restore_undo,
+    uncache_outputs,
+)
 from gena.deserializer import get_dataclass_deserializer
 from gena import generate_api
-from sand.models import Transformation
+from sand.models import Transformation, TransformationUndo
 
 transformation_bp = generate_api(Transformation)
 
@@ -25,6 +59,16 @@ class Context:
     row: List[Union[str, float]]
 
 
+@dataclass
+class BatchContext:
+    """Context dataclass to access the rows of the cells that are being transformed in
+    the batch mode: `index[i]` and `rows[i]` are the index and the row of the i-th cell.
+    """
+
+    index: List[int]
+    rows: List[List[Union[str, float]]]
+
+
 @dataclass
 class TransformRequestPayload:
     """Request Payload dataclass to validate the request obtained from the API call"""
@@ -37,6 +81,19 @@ class TransformRequestPayload:
     tolerance: int
     rows: Optional[int] = None
     outputpath: Optional[Union[str, List[str]]] = None
+    # how the rows are chosen when `rows` is given: the first rows, or a random or
+    # stratified sample of the table (see `sample_rows`)
+    sample: Literal["head", "random", "stratified"] = "head"
+    seed: Optional[int] = None
+    # stop transforming after this number of milliseconds and return partial results
+    deadline_ms: Optional[int] = None
+    # evaluate the function once per distinct value of the cells if it does not use the
+    # context of the cells (see `transform_distinct`)
+    distinct: bool = False
+    # return a profile of the transform (see `TransformProfiler`), with the time spent on
+    # each line of the code if `profile_lines`
+    profile: bool = False
+    profile_lines: bool = False
 
 
 transform_request_deserializer = get_dataclass_deserializer(TransformRequestPayload, {})
@@ -70,7 +127,7 @@ def transform_map(
     transform_func: Callable[[Any, Context], Any],
     data: Iterable[Tuple[ItemIndex, Item, Context]],
     tolerance: int,
-) -> List[Tdata]:
+) -> Iterator[Tdata]:
     """Implements map transform, performs map operation over each cell, for a given column
 
     Args:
@@ -78,10 +135,9 @@ def transform_map(
         data: iterable with Column data and context object
         tolerance: contains the API request data
 
-    Returns:
-        list of Tdata objects, data transformed after applying map transform
+    Yields:
+        Tdata objects, data transformed after applying map transform
     """
-    transformed_data = []
     for path, value, context in data:
         value = value[0]
         tdata = Tdata(path=path, value=value)
@@ -92,17 +148,16 @@ def transform_map(
             tdata["error"] = filter_traceback_errors()
             tolerance -= 1
             if tolerance == 0:
-                transformed_data.append(tdata)
-                return transformed_data
-        transformed_data.append(tdata)
-    return transformed_data
+                yield tdata
+                return
+        yield tdata
 
 
 def transform_filter(
     transform_func: Callable[[Any, Context], Any],
     data: Iterable[Tuple[ItemIndex, Item, Context]],
     tolerance: int,
-) -> List[Tdata]:
+) -> Iterator[Tdata]:
     """Implements filter transform, performs filter operation over each cell, for a given column
 
     Args:
@@ -110,13 +165,12 @@ def transform_filter(
         data: iterable with Column data and context object
         tolerance: contains the API request data
 
-    Returns:
-        list of Tdata objects, data transformed after applying filter transform
+    Yields:
+        Tdata objects, data transformed after applying filter transform
 
     Raises:
         BadRequest: An error occurred when the transform_func on execution, does not return a boolean
     """
-    transformed_data = []
     for path, value, context in data:
         value = value[0]
         tdata = Tdata(path=path, value=value)
@@ -129,17 +183,16 @@ def transform_filter(
             tdata["error"] = filter_traceback_errors()
             tolerance -= 1
             if tolerance == 0:
-                transformed_data.append(tdata)
-                return transformed_data
-        transformed_data.append(tdata)
-    return transformed_data
+                yield tdata
+                return
+        yield tdata
 
 
 def transform_split(
     transform_func: Callable[[Any, Context], Any],
     data: Iterable[Tuple[ItemIndex, Item, Context]],
     tolerance: int,
-) -> List[Tdata]:
+) -> Iterator[Tdata]:
     """Implements split transform, performs split operation over each cell, for a given column
 
     Args:
@@ -147,13 +200,12 @@ def transform_split(
         data: iterable with Column data and context object
         tolerance: contains the API request data
 
-    Returns:
-        list of Tdata objects, data transformed after applying split transform
+    Yields:
+        Tdata objects, data transformed after applying split transform
 
     Raises:
         BadRequest: An error occurred when transform_func on execution, does not return a list
     """
-    transformed_data = []
     for path, value, context in data:
         value = value[0]
         tdata = Tdata(path=path, value=value)
@@ -166,17 +218,16 @@ def transform_split(
             tdata["error"] = filter_traceback_errors()
             tolerance -= 1
             if tolerance == 0:
-                transformed_data.append(tdata)
-                return transformed_data
-        transformed_data.append(tdata)
-    return transformed_data
+                yield tdata
+                return
+        yield tdata
 
 
 def transform_concatenate(
     transform_func: Callable[[Any, Context], Any],
     data: Iterable[Tuple[ItemIndex, Item, Context]],
     tolerance: int,
-) -> List:
+) -> Iterator[Tdata]:
     """Implements concatenate transform, performs concatenate operation over each cell, for a given column
 
     Args:
@@ -184,10 +235,9 @@ def transform_concatenate(
         data: iterable with Column data and context object
         tolerance: contains the API request data
 
-    Returns:
-        list of Tdata objects, data transformed after applying concatenate transform
+    Yields:
+        Tdata objects, data transformed after applying concatenate transform
     """
-    transformed_data = []
     for path, value, context in data:
         tdata = Tdata(path=path, value=value)
         try:
@@ -197,10 +247,143 @@ def transform_concatenate(
             tdata["error"] = filter_traceback_errors()
             tolerance -= 1
             if tolerance == 0:
-                transformed_data.append(tdata)
-                return transformed_data
-        transformed_data.append(tdata)
-    return transformed_data
+                yield tdata
+                return
+        yield tdata
+
+
+# modes of the transforms: `restrictedpython` calls the function `(value, context)` for
+# each cell, `restrictedpython-batch` calls the function `(values, context)` for each
+# batch of cells (see `transform_batch`), and `native` applies built-in operators
+# described by a JSON spec outside of the sandbox (see `sand.helpers.native_ops`)
+TRANSFORM_MODES = ["restrictedpython", "restrictedpython-batch", "native"]
+
+# number of cells passed to a transform function at once in the batch and native modes
+BATCH_SIZE = 1024
+
+
+def transform_batch(
+    transform_func: Callable[[List[Any], BatchContext], List[Any]],
+    type: Literal["map", "filter", "split", "concatenate"],
+    data: Iterable[Tuple[ItemIndex, Item, Context]],
+    tolerance: int,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[Tdata]:
+    """Implements the batch mode of the transforms, the transform function is called once
+    per batch of cells with the list of their values (the list of values of the columns of
+    each cell for concatenate) and returns the list of results.
+
+    When a batch fails, it is split in halves until the failed cells are found, so the
+    results (including the errors and when the tolerance is exhausted) are the same as
+    calling the function cell by cell.
+
+    Args:
+        transform_func: User defined python function defined by the user
+        type: type of the transform
+        data: iterable with Column data and context object
+        tolerance: contains the API request data
+        batch_size: number of cells of a batch
+
+    Yields:
+        Tdata objects, data transformed after applying the transform
+    """
+    remaining_tolerance = tolerance
+
+    def run(
+        batch: List[Tuple[ItemIndex, Item, Context]],
+    ) -> Generator[Tdata, None, bool]:
+        """Transform the batch, returns False when the tolerance is exhausted"""
+        nonlocal remaining_tolerance
+
+        values = [value if type == "concatenate" else value[0] for _, value, _ in batch]
+        try:
+            results = transform_func(
+                values,
+                BatchContext(
+                    index=[context.index for _, _, context in batch],
+                    rows=[context.row for _, _, context in batch],
+                ),
+            )
+            if not isinstance(results, list) or len(results) != len(batch):
+                raise BadRequest(
+                    "batch transform function must return a list of the same length as values"
+                )
+            for result in results:
+                if type == "filter" and not isinstance(result, bool):
+                    raise BadRequest(
+                        "filter transform function must return boolean value"
+                    )
+                if type == "split" and not isinstance(result, Iterable):
+                    raise BadRequest("split transform function must return list")
+        except Exception:
+            if len(batch) == 1:
+                yield Tdata(
+                    path=batch[0][0], value=values[0], error=filter_traceback_errors()
+                )
+                remaining_tolerance -= 1
+                return remaining_tolerance != 0
+            results = None
+
+        if results is None:
+            # split outside of the except block so that errors are not chained
+            mid = len(batch) // 2
+            return (yield from run(batch[:mid])) and (yield from run(batch[mid:]))
+
+        for (path, _, _), value, result in zip(batch, values, results):
+            yield Tdata(path=path, value=value, ok=result)
+        return True
+
+    batch = []
+    for item in data:
+        batch.append(item)
+        if len(batch) == batch_size:
+            if not (yield from run(batch)):
+                return
+            batch = []
+    if len(batch) > 0:
+        yield from run(batch)
+
+
+def transform_native(
+    transform_func: NativeTransform,
+    type: Literal["map", "filter", "split", "concatenate"],
+    data: Iterable[Tuple[ItemIndex, Item, Context]],
+    tolerance: int,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[Tdata]:
+    """Implements the native mode of the transforms, the operators are applied to batches
+    of cells (to the list of values of the columns of each cell for concatenate).
+
+    Yields:
+        Tdata objects, data transformed after applying the transform
+    """
+    for batch in chunked(data, batch_size):
+        values = [value if type == "concatenate" else value[0] for _, value, _ in batch]
+        results, errors = transform_func(values)
+        if len(errors) == 0 and (
+            type in ("map", "concatenate")
+            or (type == "filter" and all(r is True or r is False for r in results))
+            or (type == "split" and all(isinstance(r, list) for r in results))
+        ):
+            for (path, _, _), value, result in zip(batch, values, results):
+                yield Tdata(path=path, value=value, ok=result)
+            continue
+
+        for i, ((path, _, _), value, result) in enumerate(zip(batch, values, results)):
+            if i in errors:
+                error = errors[i]
+            elif type == "filter" and not isinstance(result, bool):
+                error = "filter transform function must return boolean value"
+            elif type == "split" and not isinstance(result, list):
+                error = "split transform function must return list"
+            else:
+                yield Tdata(path=path, value=value, ok=result)
+                continue
+
+            yield Tdata(path=path, value=value, error=error)
+            tolerance -= 1
+            if tolerance == 0:
+                return
 
 
 # overriding inbuilt _getitem_ guard function
@@ -217,11 +400,35 @@ def custom_getitem_guard(obj: Any, index: int) -> Any:
     return obj[index]
 
 
-def compile_function(code: str) -> Callable:
+# globals of the functions compiled by `compile_function`, each function gets its own copy
+# so that the functions do not share state with each other or with RestrictedPython
+TRANSFORM_GLOBALS: Dict[str, Any] = {
+    **safe_globals,
+    "_getitem_": custom_getitem_guard,
+    "_getiter_": default_guarded_getiter,
+    "_iter_unpack_sequence_": guarded_iter_unpack_sequence,
+}
+
+# maximum number of compiled functions kept by `compile_function`
+COMPILED_FUNCTIONS_SIZE = 256
+# code objects of the compiled functions keyed by (args, hash of the code), the least
+# recently used is first
+_compiled_functions: OrderedDict[Tuple[str, str], CodeType] = OrderedDict()
+_compiled_functions_lock = threading.Lock()
+
+
+def compile_function(code: str, args: str = "value,context") -> Callable:
     """Executes code in string in a restricted mode using restrictedpython
 
+    Code objects of the compiled functions are kept in a LRU registry keyed by the hash
+    of the code, so previews and executions of the same code (e.g., of a saved
+    transformation) are not compiled again. Every call returns a new function with its
+    own globals, so the state of a function (e.g., a `global` counter) is not shared
+    with the other calls. It is safe to call from multiple threads.
+
     Args:
         code: object that has __getitem__ implementation in python
+        args: comma-separated names of the arguments of the function
 
     Returns:
         Callable function that wraps the code as a function body
@@ -229,67 +436,948 @@ def compile_function(code: str) -> Callable:
     Raises:
         BadRequest: An error occurred when the code has compilation error
     """
-    loc = {}
-    safe_globals.update({"_getitem_": custom_getitem_guard})
-    compiled_result = compile_restricted_function("value,context", code, "<function>")
+    key = (args, hashlib.sha256(code.encode()).hexdigest())
+    with _compiled_functions_lock:
+        func_code = _compiled_functions.get(key)
+        if func_code is not None:
+            _compiled_functions.move_to_end(key)
 
-    if compiled_result.errors:
-        raise BadRequest("\n".join(compiled_result.errors))
+    if func_code is None:
+        loc = {}
+        compiled_result = compile_restricted_function(args, code, "<function>")
 
-    exec(compiled_result.code, safe_globals, loc)
+        if compiled_result.errors:
+            raise BadRequest("\n".join(compiled_result.errors))
 
-    return loc["<function>"]
+        exec(compiled_result.code, dict(TRANSFORM_GLOBALS), loc)
+        func_code = loc["<function>"].__code__
 
+        with _compiled_functions_lock:
+            _compiled_functions[key] = func_code
+            while len(_compiled_functions) > COMPILED_FUNCTIONS_SIZE:
+                _compiled_functions.popitem(last=False)
+    return FunctionType(func_code, dict(TRANSFORM_GLOBALS), "<function>")
 
-@transformation_bp.route(f"/{transformation_bp.name}/test", methods=["POST"])
-def transform():
-    if isinstance(request.json["datapath"], str):
-        request.json["datapath"] = [request.json["datapath"]]
 
-    request_data = transform_request_deserializer(request.json)
-    table = Table.get_by_id(request_data.table_id)
-    table_rows: List[TableRow] = list(
-        TableRow.select().where(TableRow.table == table).order_by(TableRow.index)
+def compile_transform(mode: str, code: str) -> Callable:
+    """Compile the code of a transform with the signature of the mode"""
+    if mode == "native":
+        try:
+            return compile_native(code)
+        except ValueError as e:
+            raise BadRequest(str(e))
+    if mode == "restrictedpython-batch":
+        return compile_function(code, "values,context")
+    return compile_function(code)
+
+
+def run_transform(
+    mode: str,
+    type: Literal["map", "filter", "split", "concatenate"],
+    transform_func: Callable,
+    data: Iterable[Tuple[ItemIndex, Item, Context]],
+    tolerance: int,
+    distinct: bool = False,
+) -> List[Tdata]:
+    """Apply the compiled transform function of the mode to the data"""
+    return list(
+        iter_transform(mode, type, transform_func, data, tolerance, distinct=distinct)
     )
-    transform_func = compile_function(request_data.code)
-    col_index_list = [table.columns.index(column) for column in request_data.datapath]
+
+
+def iter_transform(
+    mode: str,
+    type: Literal["map", "filter", "split", "concatenate"],
+    transform_func: Callable,
+    data: Iterable[Tuple[ItemIndex, Item, Context]],
+    tolerance: int,
+    distinct: bool = False,
+) -> Iterator[Tdata]:
+    """Apply the compiled transform function of the mode to the data lazily, the data is
+    consumed as the results are iterated. With `distinct`, the function is evaluated once
+    per distinct value (see `transform_distinct`).
+    """
+    if distinct:
+        return transform_distinct(mode, type, transform_func, data, tolerance)
+    if mode == "restrictedpython-batch":
+        return transform_batch(transform_func, type, data, tolerance)
+    if mode == "native":
+        return transform_native(transform_func, type, data, tolerance)
+    if type == "map":
+        return transform_map(transform_func, data, tolerance)
+    if type == "filter":
+        return transform_filter(transform_func, data, tolerance)
+    if type == "split":
+        return transform_split(transform_func, data, tolerance)
+    return transform_concatenate(transform_func, data, tolerance)
+
+
+def can_transform_distinct(mode: str, code: str) -> bool:
+    """Whether a transform can be evaluated once per distinct value, i.e., its results
+    only depend on the values of the cells and not on their context (index or row)
+    """
+    return mode == "native" or not uses_context(code)
+
+
+# maximum number of distinct values whose results are kept by `transform_distinct`
+DISTINCT_MEMO_SIZE = 100_000
+
+
+def transform_distinct(
+    mode: str,
+    type: Literal["map", "filter", "split", "concatenate"],
+    transform_func: Callable,
+    data: Iterable[Tuple[ItemIndex, Item, Context]],
+    tolerance: int,
+    batch_size: int = BATCH_SIZE,
+    memo: Optional[Dict[tuple, Tdata]] = None,
+) -> Iterator[Tdata]:
+    """Dictionary-encode the values of the cells (the tuple of values of the columns for
+    concatenate) and evaluate the transform once per distinct value, then broadcast the
+    results to the cells in order, so the results (and the tolerance) are the same as
+    evaluating every cell. The transform must not use the context of the cells (see
+    `can_transform_distinct`).
+
+    Args:
+        memo: results of the distinct values evaluated so far, to share them between calls
+    """
+    if memo is None:
+        memo = {}
+
+    for batch in chunked(data, batch_size):
+        # the types are part of the keys as equal values of different types (e.g., 1 and
+        # 1.0) may have different results
+        keys = [(*value, *(v.__class__ for v in value)) for _, value, _ in batch]
+        # results of the distinct values of the batch, the memo may be evicted below
+        results: Dict[tuple, Tdata] = {}
+        new_items = {}
+        for key, item in zip(keys, batch):
+            if key in results or key in new_items:
+                continue
+            if key in memo:
+                results[key] = memo[key]
+            else:
+                new_items[key] = item
+        if len(new_items) > 0:
+            if len(memo) + len(new_items) > DISTINCT_MEMO_SIZE:
+                memo.clear()
+            for key, tdata in zip(
+                new_items.keys(),
+                iter_transform(mode, type, transform_func, new_items.values(), 0),
+            ):
+                memo[key] = tdata
+                results[key] = tdata
+
+        for (path, _, _), key in zip(batch, keys):
+            tdata = results[key]
+            yield {**tdata, "path": path}
+            if "error" in tdata:
+                tolerance -= 1
+                if tolerance == 0:
+                    return
+
+
+# pool of processes running transforms over large tables in parallel (see
+# `init_transform_pool`), transforms run in the request thread when it is None
+_transform_pool: Optional[ProcessPoolExecutor] = None
+_transform_pool_size = 0
+# number of rows of a shard of a table sent to a process of the pool
+SHARD_SIZE = 5000
+
+
+def init_transform_pool(n_processes: int):
+    """(Re-)create the pool of processes running transforms, 0 to disable it. The
+    processes are started right away so that requests do not wait for them.
+    """
+    global _transform_pool, _transform_pool_size
+    if _transform_pool is not None:
+        _transform_pool.shutdown(cancel_futures=True)
+        _transform_pool = None
+    _transform_pool_size = n_processes
+
+    if n_processes > 0:
+        # spawn instead of fork as the server may have other threads running
+        _transform_pool = ProcessPoolExecutor(
+            n_processes, mp_context=multiprocessing.get_context("spawn")
+        )
+        for future in [_transform_pool.submit(int) for _ in range(n_processes)]:
+            future.result()
+
+
+def _transform_shard(
+    mode: str,
+    type: Literal["map", "filter", "split", "concatenate"],
+    code: str,
+    col_index_list: List[int],
+    rows: List[Tuple[int, List[Union[str, float]]]],
+    tolerance: int,
+    distinct: bool = False,
+) -> List[Tdata]:
+    """Transform a shard of rows in a process of the pool"""
+    transform_func = compile_transform(mode, code)
     data = (
-        (
-            table_row.index,
-            [table_row.row[col_index] for col_index in col_index_list],
-            Context(index=table_row.index, row=table_row.row),
+        (index, [row[ci] for ci in col_index_list], Context(index=index, row=row))
+        for index, row in rows
+    )
+    return run_transform(mode, type, transform_func, data, tolerance, distinct)
+
+
+def transform_parallel(
+    request_data: TransformRequestPayload,
+    rows: Iterable[TableRow],
+    col_index_list: List[int],
+    distinct: bool = False,
+) -> Iterator[Tdata]:
+    """Run a transform over shards of rows in the pool of processes. Results of the shards
+    are merged in the order of the rows, and the merge stops at the cell exhausting the
+    tolerance, so the results are the same as running the transform in one go.
+    """
+    assert _transform_pool is not None
+    tolerance = request_data.tolerance
+    futures: Deque[Future] = deque()
+
+    def merge(shard_data: List[Tdata]) -> Generator[Tdata, None, bool]:
+        nonlocal tolerance
+        for tdata in shard_data:
+            yield tdata
+            if "error" in tdata:
+                tolerance -= 1
+                if tolerance == 0:
+                    return False
+        return True
+
+    try:
+        for shard in chunked(rows, SHARD_SIZE):
+            # the remaining tolerance of a shard is never less than the remaining
+            # tolerance when its results are merged
+            futures.append(
+                _transform_pool.submit(
+                    _transform_shard,
+                    request_data.mode,
+                    request_data.type,
+                    request_data.code,
+                    col_index_list,
+                    [(row.index, row.row) for row in shard],
+                    tolerance,
+                    distinct,
+                )
+            )
+            # bound the number of shards in memory
+            if len(futures) >= 2 * _transform_pool_size:
+                if not (yield from merge(futures.popleft().result())):
+                    return
+        while len(futures) > 0:
+            if not (yield from merge(futures.popleft().result())):
+                return
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def resolve_pipeline(table: Table) -> List[Transformation]:
+    """Get the non-draft transformations of a table in the order of execution.
+
+    A transformation depends on the transformation it is inserted after and on the
+    previous transformations (by `order`) writing the columns it reads or writes. The
+    transformations are sorted topologically, ties are broken by `order`.
+
+    Raises:
+        BadRequest: the dependencies have a cycle or a transformation reads a column
+            that neither exists nor is written by a previous transformation
+    """
+    steps: List[Transformation] = list(
+        Transformation.select()
+        .where((Transformation.table == table) & (Transformation.is_draft == False))
+        .order_by(Transformation.order, Transformation.id)
+    )
+    id2step = {step.id: step for step in steps}
+
+    deps: Dict[int, set] = {step.id: set() for step in steps}
+    for i, step in enumerate(steps):
+        if step.insert_after_id in id2step:
+            deps[step.id].add(step.insert_after_id)
+        columns = set(get_inputpath(step)) | set(get_outputpath(step))
+        for prev_step in steps[:i]:
+            if len(columns.intersection(get_outputpath(prev_step))) > 0:
+                deps[step.id].add(prev_step.id)
+
+    pipeline = []
+    done = set()
+    while len(pipeline) < len(steps):
+        step = next(
+            (s for s in steps if s.id not in done and deps[s.id].issubset(done)), None
         )
-        for table_row in table_rows[: request_data.rows]
+        if step is None:
+            raise BadRequest(
+                "The transformations of the table have cyclic dependencies"
+            )
+        pipeline.append(step)
+        done.add(step.id)
+
+    columns = set(table.columns)
+    for step in pipeline:
+        for column in get_inputpath(step):
+            if column not in columns:
+                raise BadRequest(
+                    f"Transformation {step.name} reads column {column} that does not exist"
+                )
+        columns.update(get_outputpath(step))
+    return pipeline
+
+
+def get_inputpath(step: Transformation) -> List[str]:
+    return [step.datapath] if isinstance(step.datapath, str) else step.datapath
+
+
+def get_outputpath(step: Transformation) -> List[str]:
+    """Get the columns written by a transformation: map and concatenate write to the
+    first output column (the input column for map if there is no output column), split
+    writes to the output columns, and filter writes to the output column if there is
+    one (otherwise, the rows that are filtered out are skipped by the next steps).
+    """
+    if step.outputpath:
+        return step.outputpath if step.type == "split" else step.outputpath[:1]
+    if step.type == "map":
+        return get_inputpath(step)[:1]
+    return []
+
+
+def uses_context(code: str) -> bool:
+    """Whether the code of a transformation may read its context (e.g., other cells of
+    the row). Code that cannot be parsed is assumed to read it.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True
+    return any(
+        isinstance(node, ast.Name) and node.id == "context" for node in ast.walk(tree)
     )
 
-    transformed_data = None
 
-    if request_data.type == "map":
-        if request_data.outputpath and len(request_data.outputpath) != 1:
+def _hash(value: Any) -> str:
+    return hashlib.blake2b(orjson.dumps(value), digest_size=16).hexdigest()
+
+
+def get_step_keys(table: Table, pipeline: List[Transformation]) -> List[str]:
+    """Get the cache keys of the outputs of the transformations of a pipeline.
+
+    The key of a transformation is a hash of its definition and the state of the
+    columns it reads: a hash of the values of a column of the table, or the key of the
+    previous transformation writing the column. Transformations using the context read
+    every column. Keys of previous filters without output columns are included as they
+    decide which rows are transformed. So changing a transformation or its input columns
+    changes its key and the keys of the transformations depending on it.
+
+    Only the columns of the table read by the transformations before they are
+    overwritten are hashed.
+    """
+    columns = list(table.columns)
+    step_incols = []
+    for step in pipeline:
+        reads_context = step.mode != "native" and uses_context(step.code)
+        step_incols.append(list(columns) if reads_context else get_inputpath(step))
+        columns.extend([c for c in get_outputpath(step) if c not in columns])
+
+    # columns of the table whose values are read by the pipeline: the input columns and
+    # the output columns of keep_original (cells that fail are left unchanged by
+    # keep_original, so the output column also depends on its previous values)
+    table_incols: List[str] = []
+    written = set()
+    for step, incols in zip(pipeline, step_incols):
+        outcols = get_outputpath(step) if step.on_error == "keep_original" else []
+        for column in incols + outcols:
+            if (
+                column in table.columns
+                and column not in written
+                and column not in table_incols
+            ):
+                table_incols.append(column)
+        written.update(get_outputpath(step))
+
+    states: Dict[str, str] = dict(
+        zip(
+            table_incols,
+            column_fingerprints(
+                table, [table.columns.index(column) for column in table_incols]
+            ),
+        )
+    )
+    filter_keys = []
+    keys = []
+    for step, incols in zip(pipeline, step_incols):
+        key = _hash(
+            [
+                table.id,
+                step.mode,
+                step.type,
+                step.code,
+                step.on_error,
+                get_inputpath(step),
+                get_outputpath(step),
+                [(column, states.get(column, "")) for column in incols],
+                filter_keys,
+            ]
+        )
+        keys.append(key)
+
+        for column in get_outputpath(step):
+            states[column] = (
+                _hash([key, states.get(column, "")])
+                if step.on_error == "keep_original"
+                else key
+            )
+        if len(get_outputpath(step)) == 0 and step.type == "filter":
+            filter_keys.append(key)
+    return keys
+
+
+# number of rows transformed in memory and written back at once by `execute_pipeline`
+PIPELINE_CHUNK_SIZE = 1000
+
+
+class PipelineError(Exception):
+    """A transformation whose `on_error` is abort fails at a row"""
+
+    def __init__(self, step: str, index: int, error: str):
+        super().__init__(step, index, error)
+        self.step = step
+        self.index = index
+        self.error = error
+
+
+@dataclass
+class PipelineResult:
+    # number of cells that have errors (not aborted)
+    n_errors: int
+    # transformations whose outputs are reused from the cache
+    cached: List[int]
+
+
+def execute_pipeline(
+    table: Table,
+    pipeline: List[Transformation],
+    chunk_size: int = PIPELINE_CHUNK_SIZE,
+    use_cache: bool = True,
+) -> PipelineResult:
+    """Execute the transformations on the rows of the table and store their outputs,
+    adding the output columns that do not exist to the table. The steps are fused: rows
+    are read once, in chunks, and every step is applied to a chunk in memory before it is
+    written back, so the table is scanned once regardless of the number of steps.
+
+    When a step fails at a cell, its output cells are set to blank (`set_to_blank`), to
+    the error (`store_error`), left unchanged (`keep_original`), or the execution stops
+    (`abort`). Each chunk is written in its own transaction with the previous values of
+    the cells it overwrites (`TransformationUndo`), so other writers are not blocked for
+    the whole execution, and the rows and columns of the table are restored if a step
+    aborts or the execution fails.
+
+    Steps that do not use the context of the cells are evaluated once per distinct value
+    of their input cells (see `transform_distinct`).
+
+    With `use_cache`, the outputs of the steps are cached (see `get_step_keys`), and
+    steps whose code and inputs have not changed since a previous execution are not
+    run: their cached outputs are written instead. Outputs are cached and read back a
+    chunk of rows at a time, and an output larger than the budget is not cached.
+
+    Raises:
+        PipelineError: a step whose `on_error` is abort fails
+    """
+    for step in pipeline:
+        if step.mode not in TRANSFORM_MODES:
             raise BadRequest(
-                "For transform type map the outputpath should be a single column"
+                f"Invalid transformation mode {step.mode} of transformation {step.name}"
+            )
+
+    use_cache = use_cache and get_cache_budget() > 0
+    keys = get_step_keys(table, pipeline) if use_cache else []
+    # number of errors of the cached outputs
+    cached = get_cached_outputs(keys) if use_cache else {}
+    cached_keys = [key for key in keys if key in cached]
+    # size of the outputs of the steps that are run and cached so far
+    cache_sizes = {key: 0 for key in keys if key not in cached}
+    n_rows = TableRow.select().where(TableRow.table == table).count()
+    n_chunks = (n_rows + chunk_size - 1) // chunk_size
+
+    steps = []
+    for i, step in enumerate(pipeline):
+        key = keys[i] if use_cache else None
+        if key in cached:
+            steps.append((step, None, key))
+        else:
+            steps.append((step, compile_transform(step.mode, step.code), key))
+
+    # results of the distinct values of the steps that do not use the context, which are
+    # shared between chunks
+    memos: Dict[int, Optional[dict]] = {
+        step.id: {} if can_transform_distinct(step.mode, step.code) else None
+        for step in pipeline
+    }
+
+    columns = list(table.columns)
+    for step in pipeline:
+        for column in get_outputpath(step):
+            if column not in columns:
+                columns.append(column)
+    col2index = {column: ci for ci, column in enumerate(columns)}
+
+    n_errors = sum(cached[key] for key in cached_keys)
+    # columns of the table that are overwritten by the steps, kept to undo the execution
+    overwritten = [
+        ci
+        for ci, column in enumerate(table.columns)
+        if any(column in get_outputpath(step) for step in pipeline)
+    ]
+    with db.atomic():
+        if (
+            TransformationUndo.select()
+            .where(TransformationUndo.table == table)
+            .exists()
+        ):
+            raise BadRequest(
+                "The transformations of the table are being executed or their last execution was interrupted"
+            )
+        table_columns = table.columns
+        TransformationUndo.create(
+            table=table, first_index=-1, data={"table_columns": table_columns}
+        )
+        if columns != table.columns:
+            table.columns = columns
+            table.save(only=[Table.columns])
+        # drop the records of outputs that were partially cached
+        uncache_outputs(list(cache_sizes.keys()))
+
+    try:
+        for chunk in chunked(iter_rows(table, with_links=False), chunk_size):
+            first_index, last_index = chunk[0].index, chunk[-1].index
+            undo_rows = [
+                [
+                    row.index,
+                    len(row.row),
+                    [row.row[ci] if ci < len(row.row) else "" for ci in overwritten],
+                ]
+                for row in chunk
+            ]
+            active = [True] * len(chunk)
+            for row in chunk:
+                row.row.extend([""] * (len(columns) - len(row.row)))
+            cached_outputs = (
+                get_cached_chunks(cached_keys, first_index, last_index)
+                if len(cached_keys) > 0
+                else {}
             )
-        transformed_data = transform_map(transform_func, data, request_data.tolerance)
+            # outputs of the steps over the chunk that are cached
+            outputs = {
+                key: {"rows": [], "filtered": [], "n_errors": 0} for key in cache_sizes
+            }
+
+            for step, func, key in steps:
+                incols = [col2index[c] for c in get_inputpath(step)]
+                outcols = [col2index[c] for c in get_outputpath(step)]
+
+                if func is None:
+                    cached_output = cached_outputs[key]
+                    for ri, row in enumerate(chunk):
+                        if not active[ri]:
+                            continue
+                        if row.index in cached_output["filtered"]:
+                            active[ri] = False
+                        elif row.index in cached_output["rows"]:
+                            for ci, value in zip(
+                                outcols, cached_output["rows"][row.index]
+                            ):
+                                row.row[ci] = value
+                    continue
+
+                output = outputs.get(key)
+                data = (
+                    (
+                        ri,
+                        [row.row[ci] for ci in incols],
+                        Context(index=row.index, row=row.row),
+                    )
+                    for ri, row in enumerate(chunk)
+                    if active[ri]
+                )
+                # a tolerance of 0 never stops the transform
+                if memos[step.id] is not None:
+                    results = transform_distinct(
+                        step.mode, step.type, func, data, 0, memo=memos[step.id]
+                    )
+                else:
+                    results = iter_transform(step.mode, step.type, func, data, 0)
+                for tdata in results:
+                    row = chunk[tdata["path"]]
+                    if "error" in tdata:
+                        if step.on_error == "abort":
+                            raise PipelineError(step.name, row.index, tdata["error"])
+                        n_errors += 1
+                        if output is not None:
+                            output["n_errors"] += 1
+                        if step.on_error != "keep_original":
+                            value = (
+                                tdata["error"] if step.on_error == "store_error" else ""
+                            )
+                            for ci in outcols:
+                                row.row[ci] = value
+                    elif step.type == "split":
+                        result = list(tdata["ok"])
+                        for i, ci in enumerate(outcols):
+                            row.row[ci] = result[i] if i < len(result) else ""
+                    elif len(outcols) > 0:
+                        row.row[outcols[0]] = tdata["ok"]
+                    elif step.type == "filter" and not tdata["ok"]:
+                        active[tdata["path"]] = False
+                        if output is not None:
+                            output["filtered"].append(row.index)
+                        continue
+                    else:
+                        continue
+
+                    if output is not None and (
+                        "ok" in tdata or step.on_error != "keep_original"
+                    ):
+                        output["rows"].append(
+                            [row.index, [row.row[ci] for ci in outcols]]
+                        )
+
+            with db.atomic():
+                TransformationUndo.create(
+                    table=table,
+                    first_index=first_index,
+                    data={"columns": overwritten, "rows": undo_rows},
+                )
+                TableRow.bulk_update(chunk, fields=[TableRow.row])
+                notify_rows_saved(chunk, {"row"})
+
+                for key, output in outputs.items():
+                    cache_sizes[key] += cache_chunk(
+                        table.id,
+                        key,
+                        first_index,
+                        last_index,
+                        n_chunks,
+                        output.pop("n_errors"),
+                        output,
+                    )
+                    if cache_sizes[key] > get_cache_budget():
+                        # the output does not fit in the budget
+                        uncache_outputs([key])
+                        del cache_sizes[key]
+    except BaseException:
+        restore_undo(table.id)
+        uncache_outputs(list(cache_sizes.keys()))
+        table.columns = table_columns
+        raise
+
+    with db.atomic():
+        TransformationUndo.delete().where(TransformationUndo.table == table).execute()
+        if len(cache_sizes) > 0:
+            evict_cached_outputs()
+
+    return PipelineResult(
+        n_errors=n_errors,
+        cached=[step.id for step, func, _ in steps if func is None],
+    )
+
 
-    elif request_data.type == "filter":
+@dataclass
+class ExecuteRequestPayload:
+    table_id: int
+
+
+execute_request_deserializer = get_dataclass_deserializer(ExecuteRequestPayload, {})
+
+
+@transformation_bp.route(f"/{transformation_bp.name}/execute", methods=["POST"])
+def execute():
+    """Execute the non-draft transformations of a table and store their outputs"""
+    request_data = execute_request_deserializer(request.json)
+    table = Table.get_by_id(request_data.table_id)
+    pipeline = resolve_pipeline(table)
+    try:
+        result = execute_pipeline(table, pipeline)
+    except PipelineError as e:
+        raise BadRequest(
+            f"Transformation {e.step} failed at row {e.index} and aborted the execution:\n{e.error}"
+        )
+    return jsonify(
+        {
+            "transformations": [step.id for step in pipeline],
+            "columns": table.columns,
+            "n_errors": result.n_errors,
+            "cached": result.cached,
+        }
+    )
+
+
+@transformation_bp.route(f"/{transformation_bp.name}/test", methods=["POST"])
+def transform():
+    if isinstance(request.json["datapath"], str):
+        request.json["datapath"] = [request.json["datapath"]]
+
+    request_data = transform_request_deserializer(request.json)
+    if request_data.mode not in TRANSFORM_MODES:
+        raise BadRequest(
+            f"Invalid transformation mode {request_data.mode}. Available modes: {TRANSFORM_MODES}"
+        )
+    table = Table.get_by_id(request_data.table_id)
+    transform_func = compile_transform(request_data.mode, request_data.code)
+    col_index_list = [table.columns.index(column) for column in request_data.datapath]
+
+    if request_data.type == "split" and request_data.outputpath is None:
+        raise BadRequest(
+            "transform type split needs to have outputpath defined in the request body"
+        )
+    if request_data.type in ("map", "filter"):
         if request_data.outputpath and len(request_data.outputpath) != 1:
             raise BadRequest(
                 "For transform type map the outputpath should be a single column"
             )
-        transformed_data = transform_filter(
-            transform_func, data, request_data.tolerance
+
+    if request_data.rows is None or request_data.sample == "head":
+        rows = iter_rows(table, with_links=False, limit=request_data.rows)
+    else:
+        rows = sample_rows(
+            table,
+            request_data.rows,
+            request_data.sample,
+            seed=request_data.seed,
+            with_links=False,
         )
+    deadline = None
+    if request_data.deadline_ms is not None:
+        deadline = Deadline(request_data.deadline_ms)
+        rows = deadline.iter(rows)
 
-    elif request_data.type == "split":
-        if request_data.outputpath is None:
-            raise BadRequest(
-                "transform type split needs to have outputpath defined in the request body"
+    profiler = None
+    if request_data.profile:
+        trace_lines = request_data.profile_lines and request_data.mode != "native"
+        profiler = TransformProfiler(
+            transform_func if trace_lines else None, request_data.code
+        )
+        rows = profiler.iter_rows(rows)
+
+    n_rows = table.size if request_data.rows is None else request_data.rows
+    distinct = request_data.distinct and can_transform_distinct(
+        request_data.mode, request_data.code
+    )
+    # rows are transformed in this thread when they are profiled
+    if _transform_pool is not None and n_rows > SHARD_SIZE and profiler is None:
+        transformed_data = transform_parallel(
+            request_data, rows, col_index_list, distinct
+        )
+    else:
+        data = (
+            (
+                table_row.index,
+                [table_row.row[col_index] for col_index in col_index_list],
+                Context(index=table_row.index, row=table_row.row),
             )
-        transformed_data = transform_split(transform_func, data, request_data.tolerance)
+            for table_row in rows
+        )
+        transformed_data = iter_transform(
+            request_data.mode,
+            request_data.type,
+            transform_func,
+            data,
+            request_data.tolerance,
+            distinct=distinct,
+        )
 
-    elif request_data.type == "concatenate":
-        transformed_data = transform_concatenate(
-            transform_func, data, request_data.tolerance
+    if profiler is not None:
+        transformed_data = profiler.iter_results(transformed_data)
+
+    if request.args.get("stream", "false") == "true":
+        return Response(
+            stream_transformed_data(transformed_data, deadline, profiler),
+            mimetype="application/x-ndjson",
         )
+    if deadline is None and profiler is None:
+        return jsonify(list(transformed_data))
+
+    resp: Dict[str, Any] = {"data": list(transformed_data)}
+    if deadline is not None:
+        resp["truncated"] = deadline.expired
+    if profiler is not None:
+        resp["profile"] = profiler.to_dict()
+    return jsonify(resp)
+
+
+class Deadline:
+    """Wall-clock deadline of a transform, rows are not read after it has passed"""
+
+    def __init__(self, ms: int):
+        self.end = time.monotonic() + ms / 1000
+        # whether some rows were left out because the deadline passed
+        self.expired = False
+
+    def iter(self, rows: Iterable[TableRow]) -> Iterator[TableRow]:
+        for row in rows:
+            if time.monotonic() >= self.end:
+                self.expired = True
+                return
+            yield row
+
+
+# upper bounds (in milliseconds) of the buckets of the histogram of the time of the rows
+PROFILE_BUCKETS_MS = [0.01, 0.1, 1, 10, 100, 1000]
+# number of the slowest rows reported by `TransformProfiler`
+PROFILE_TOP_N = 10
+
+
+class TransformProfiler:
+    """Measure the time a transform spends on each row, without the time of reading the
+    rows from the database. In the batch and native modes, the time of a batch is
+    counted on the first row of the batch.
+
+    If the compiled function is given, the time spent on each line of its code is
+    measured as well, by tracing the function (which makes it slower). Line numbers are
+    the line numbers in the code.
+    """
 
-    return jsonify(transformed_data)
+    def __init__(
+        self, transform_func: Optional[Callable] = None, code: Optional[str] = None
+    ):
+        self.n_rows = 0
+        self.total = 0.0
+        self.histogram = [0] * (len(PROFILE_BUCKETS_MS) + 1)
+        # heap of (time, path, value) of the slowest rows
+        self.slowest: List[Tuple[float, int, Any]] = []
+
+        # time spent in reading rows since the last result
+        self.read_time = 0.0
+
+        self.codes = set()
+        if transform_func is not None:
+            # the code of the function and of the functions defined in it
+            codes = [transform_func.__code__]
+            while len(codes) > 0:
+                code_obj = codes.pop()
+                self.codes.add(code_obj)
+                codes.extend(c for c in code_obj.co_consts if isinstance(c, CodeType))
+        # line number => [number of hits, time]
+        self.lines: Dict[int, List[float]] = {}
+        # frame id => (line number, time) of the line being executed
+        self.current_lines: Dict[int, Tuple[int, float]] = {}
+        self.code_lines = dict(enumerate((code or "").splitlines(), start=1))
+
+    def iter_rows(self, rows: Iterable[TableRow]) -> Iterator[TableRow]:
+        it = iter(rows)
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.read_time += time.perf_counter() - start
+            yield row
+
+    def iter_results(self, transformed_data: Iterable[Tdata]) -> Iterator[Tdata]:
+        it = iter(transformed_data)
+        while True:
+            start = time.perf_counter()
+            self.read_time = 0.0
+            if len(self.codes) > 0:
+                # restored afterward so that debuggers and coverage keep working
+                prev_trace = sys.gettrace()
+                sys.settrace(self._trace)
+            try:
+                tdata = next(it)
+            except StopIteration:
+                return
+            finally:
+                if len(self.codes) > 0:
+                    sys.settrace(prev_trace)
+            self.record(tdata, time.perf_counter() - start - self.read_time)
+            yield tdata
+
+    def record(self, tdata: Tdata, elapsed: float):
+        self.n_rows += 1
+        self.total += elapsed
+        self.histogram[bisect.bisect_left(PROFILE_BUCKETS_MS, elapsed * 1000)] += 1
+        item = (elapsed, tdata["path"], tdata["value"])
+        if len(self.slowest) < PROFILE_TOP_N:
+            heapq.heappush(self.slowest, item)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def _trace(self, frame: FrameType, event: str, arg: Any):
+        if event == "call" and frame.f_code in self.codes:
+            return self._trace_lines
+        return None
+
+    def _trace_lines(self, frame: FrameType, event: str, arg: Any):
+        now = time.perf_counter()
+        current = self.current_lines.pop(id(frame), None)
+        if current is not None:
+            self.lines[current[0]][1] += now - current[1]
+        if event == "line":
+            stats = self.lines.setdefault(frame.f_lineno, [0, 0.0])
+            stats[0] += 1
+            self.current_lines[id(frame)] = (frame.f_lineno, time.perf_counter())
+        return self._trace_lines
+
+    def to_dict(self) -> dict:
+        histogram = [
+            {"le_ms": le, "count": count}
+            for le, count in zip(PROFILE_BUCKETS_MS + [None], self.histogram)
+        ]
+        return {
+            "n_rows": self.n_rows,
+            "total_ms": self.total * 1000,
+            "histogram": histogram,
+            "slowest": [
+                {"path": path, "value": value, "time_ms": elapsed * 1000}
+                for elapsed, path, value in sorted(
+                    self.slowest, key=lambda x: x[0], reverse=True
+                )
+            ],
+            "lines": [
+                {
+                    "line": line,
+                    "code": self.code_lines.get(line, ""),
+                    "hits": int(hits),
+                    "time_ms": elapsed * 1000,
+                }
+                for line, (hits, elapsed) in sorted(self.lines.items())
+            ],
+        }
+
+
+# number of results of a transform sent at once by `stream_transformed_data`
+NDJSON_FLUSH_SIZE = 100
+
+
+@stream_with_context
+def stream_transformed_data(
+    transformed_data: Iterable[Tdata],
+    deadline: Optional[Deadline] = None,
+    profiler: Optional[TransformProfiler] = None,
+) -> Iterator[str]:
+    """Send the results of a transform as NDJSON (one result per line) as soon as they are
+    computed, followed by a summary record
+    `{"summary": {"n_rows": .., "n_errors": .., "truncated": .., "profile": ..}}` (the
+    profile is only there if the transform is profiled).
+    """
+    lines = []
+    n_rows = 0
+    n_errors = 0
+    for tdata in transformed_data:
+        n_rows += 1
+        if "error" in tdata:
+            n_errors += 1
+        lines.append(json.dumps(tdata))
+        if len(lines) == NDJSON_FLUSH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    summary = {
+        "n_rows": n_rows,
+        "n_errors": n_errors,
+        "truncated": deadline is not None and deadline.expired,
+    }
+    if profiler is not None:
+        summary["profile"] = profiler.to_dict()
+    lines.append(json.dumps({"summary": summary}))
+    yield "\n".join(lines) + "\n"
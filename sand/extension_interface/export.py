@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from enum import Enum
+from typing import Iterable
 
 import sm.outputs.semantic_model as O
 
@@ -24,17 +25,23 @@ class IExport(ABC):
 
     @abstractmethod
     def export_extra_resources(
-        self, table: Table, rows: list[TableRow], sm: O.SemanticModel
+        self, table: Table, rows: Iterable[TableRow], sm: O.SemanticModel
     ) -> dict[str, str]:
-        """Export extra resources generated automatically by the system"""
+        """Export extra resources generated automatically by the system.
+
+        The rows are streamed from the database every time they are iterated over.
+        """
         pass
 
     @abstractmethod
     def export_data(
         self,
         table: Table,
-        rows: list[TableRow],
+        rows: Iterable[TableRow],
         sm: O.SemanticModel,
     ) -> str:
-        """Export relational data"""
+        """Export relational data.
+
+        The rows are streamed from the database every time they are iterated over.
+        """
         pass
@@ -0,0 +1,211 @@
+"""Built-in operators of the `native` mode of transformations.
+
+The code of a native transformation is a JSON spec of an operator, e.g.,
+`{"op": "regex_extract", "pattern": "(\\d+) m", "group": 1}`, or a list of operators that
+are applied one after another, e.g., `[{"op": "strip"}, {"op": "to_number"}]`. Operators
+are implemented in Python without the sandbox and are applied to a batch of values at
+once, with their regexes compiled once per transformation.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import orjson
+
+
+def op_strip(chars: Optional[str] = None) -> Callable[[Any], Any]:
+    return lambda value: (value if type(value) is str else str(value)).strip(chars)
+
+
+def op_lower() -> Callable[[Any], Any]:
+    return lambda value: (value if type(value) is str else str(value)).lower()
+
+
+def op_upper() -> Callable[[Any], Any]:
+    return lambda value: (value if type(value) is str else str(value)).upper()
+
+
+def op_casefold() -> Callable[[Any], Any]:
+    return lambda value: (value if type(value) is str else str(value)).casefold()
+
+
+def op_title() -> Callable[[Any], Any]:
+    return lambda value: (value if type(value) is str else str(value)).title()
+
+
+def op_regex_extract(pattern: str, group: Union[int, str] = 0) -> Callable[[Any], Any]:
+    """Extract the group of the first match of the pattern, fails if there is no match"""
+    regex = re.compile(pattern)
+
+    def extract(value):
+        m = regex.search(str(value))
+        if m is None:
+            raise ValueError(f"{value!r} does not match {pattern!r}")
+        return m.group(group)
+
+    return extract
+
+
+def op_regex_replace(pattern: str, repl: str, count: int = 0) -> Callable[[Any], Any]:
+    regex = re.compile(pattern)
+    return lambda value: regex.sub(repl, str(value), count)
+
+
+def op_regex_match(pattern: str) -> Callable[[Any], Any]:
+    """Whether the value contains a match of the pattern (for filters)"""
+    regex = re.compile(pattern)
+    return lambda value: regex.search(str(value)) is not None
+
+
+def op_not_empty() -> Callable[[Any], Any]:
+    """Whether the value is not blank (for filters)"""
+    return lambda value: value is not None and str(value).strip() != ""
+
+
+def op_split(sep: Optional[str] = None, maxsplit: int = -1) -> Callable[[Any], Any]:
+    return lambda value: str(value).split(sep, maxsplit)
+
+
+def op_regex_split(pattern: str, maxsplit: int = 0) -> Callable[[Any], Any]:
+    regex = re.compile(pattern)
+    return lambda value: regex.split(str(value), maxsplit)
+
+
+def op_join(sep: str = " ") -> Callable[[Any], Any]:
+    """Join the values of the columns of a cell (for concatenate)"""
+    return lambda value: sep.join(str(v) for v in value)
+
+
+def op_to_number(
+    decimal: str = ".", thousands: Optional[str] = None
+) -> Callable[[Any], Any]:
+    """Parse the value as an integer if possible, otherwise as a float. The thousands
+    separator defaults to "." when the decimal separator is "," and to "," otherwise.
+    """
+    if thousands is None:
+        thousands = "." if decimal == "," else ","
+    if decimal == "":
+        raise ValueError("the decimal separator must not be empty")
+    if decimal == thousands:
+        raise ValueError(
+            f"the decimal and thousands separators must be different, got {decimal!r}"
+        )
+
+    def to_number(value):
+        if isinstance(value, (int, float)):
+            return value
+        text = str(value).strip()
+        if thousands != "":
+            text = text.replace(thousands, "")
+        if decimal != ".":
+            text = text.replace(decimal, ".")
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+    return to_number
+
+
+def op_parse_date(formats: List[str], output: str = "%Y-%m-%d") -> Callable[[Any], Any]:
+    """Parse the value with the first matched format and format it in the output format"""
+    if len(formats) == 0:
+        raise ValueError("parse_date needs at least one format")
+
+    def parse_date(value):
+        text = str(value).strip()
+        for fmt in formats:
+            try:
+                return datetime.strptime(text, fmt).strftime(output)
+            except ValueError:
+                pass
+        raise ValueError(f"{value!r} does not match any of the formats {formats}")
+
+    return parse_date
+
+
+NATIVE_OPS: Dict[str, Callable[..., Callable[[Any], Any]]] = {
+    "strip": op_strip,
+    "lower": op_lower,
+    "upper": op_upper,
+    "casefold": op_casefold,
+    "title": op_title,
+    "regex_extract": op_regex_extract,
+    "regex_replace": op_regex_replace,
+    "regex_match": op_regex_match,
+    "not_empty": op_not_empty,
+    "split": op_split,
+    "regex_split": op_regex_split,
+    "join": op_join,
+    "to_number": op_to_number,
+    "parse_date": op_parse_date,
+}
+
+
+class NativeTransform:
+    """Operators of a spec applied to batches of values"""
+
+    def __init__(self, funcs: List[Callable[[Any], Any]]):
+        self.funcs = funcs
+
+    def __call__(
+        self, values: List[Any], context: Any = None
+    ) -> Tuple[List[Any], Dict[int, str]]:
+        """Transform the values. Each operator is applied to the whole batch before the
+        next one. Returns the results and the errors of the values that fail (keyed by
+        their position in the batch, their results are None).
+        """
+        try:
+            results = values
+            for func in self.funcs:
+                results = [func(value) for value in results]
+            return results, {}
+        except Exception:
+            # the operators are applied again cell by cell to the original values
+            pass
+
+        results = []
+        errors = {}
+        for i, value in enumerate(values):
+            try:
+                for func in self.funcs:
+                    value = func(value)
+                results.append(value)
+            except Exception as e:
+                results.append(None)
+                errors[i] = f"{type(e).__name__}: {e}"
+        return results, errors
+
+
+def compile_native(code: str) -> NativeTransform:
+    """Create the operators of a spec
+
+    Raises:
+        ValueError: the spec is invalid
+    """
+    try:
+        spec = orjson.loads(code)
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"The spec of a native transformation is not valid JSON: {e}")
+    if isinstance(spec, dict):
+        spec = [spec]
+    if not isinstance(spec, list) or len(spec) == 0:
+        raise ValueError(
+            "The spec of a native transformation must be an operator or a non-empty list of operators"
+        )
+
+    funcs = []
+    for op in spec:
+        if not isinstance(op, dict) or op.get("op") not in NATIVE_OPS:
+            raise ValueError(
+                f"Invalid operator {op}. Available operators: {list(NATIVE_OPS.keys())}"
+            )
+        params = {k: v for k, v in op.items() if k != "op"}
+        try:
+            funcs.append(NATIVE_OPS[op["op"]](**params))
+        except (TypeError, ValueError, re.error) as e:
+            raise ValueError(f"Invalid parameters of operator {op['op']}: {e}")
+    return NativeTransform(funcs)
@@ -0,0 +1,82 @@
+"""Sketches summarizing a stream of values in bounded memory (e.g., for profiling columns
+of tables while they are inserted).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import random
+from collections import Counter
+from typing import Hashable, Iterable, List, Tuple
+
+
+class HyperLogLog:
+    """Estimate the number of distinct values with 2^p registers (a relative error of
+    about 1.04 / sqrt(2^p), 1.6% with the default p = 12)
+    """
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, data: bytes):
+        h = int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+        idx = h >> (64 - self.p)
+        # position of the first 1-bit of the remaining bits
+        rank = (64 - self.p) - (h & ((1 << (64 - self.p)) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        n_zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and n_zeros > 0:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / n_zeros)
+        return round(estimate)
+
+
+class TopK:
+    """Most frequent values of a stream, counted exactly until there are more than
+    `capacity` distinct values. Beyond that, the counters are pruned to the `capacity`
+    most frequent values whenever their number doubles, so counts of values seen before
+    being pruned are underestimated.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counter: Counter = Counter()
+        # whether the counts are exact (no counter has been pruned)
+        self.exact = True
+
+    def update(self, values: Iterable[Hashable]):
+        self.counter.update(values)
+        if len(self.counter) > 2 * self.capacity:
+            self.counter = Counter(dict(self.counter.most_common(self.capacity)))
+            self.exact = False
+
+    def top(self, k: int) -> List[Tuple[Hashable, int]]:
+        return self.counter.most_common(k)
+
+
+class Reservoir:
+    """Uniform random sample of at most `size` values of a stream"""
+
+    def __init__(self, size: int = 10000, seed: int = 42):
+        self.size = size
+        self.n = 0
+        self.values: list = []
+        self.random = random.Random(seed)
+
+    def add(self, value):
+        self.n += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            i = self.random.randrange(self.n)
+            if i < self.size:
+                self.values[i] = value
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import tornado
+from tornado import escape, httputil
+from tornado.concurrent import dummy_executor
+from tornado.wsgi import WSGIContainer
+
+# maximum number of chunks of a response produced ahead of the client
+STREAM_QUEUE_SIZE = 16
+
+
+class StreamingWSGIContainer(WSGIContainer):
+    """`WSGIContainer` that sends the chunks of a response to the client as the
+    application produces them, instead of buffering the whole body. A response of a single
+    chunk is sent with its Content-Length as before, longer responses are sent with the
+    chunked transfer encoding (e.g., streamed exports or NDJSON results).
+
+    The application is called and its response is iterated and closed in a single task of
+    the executor, so all chunks of a response are produced by the same thread (database
+    connections are per thread). The chunks are passed to the event loop through a
+    bounded queue so that a slow client also slows down the producer.
+
+    Args:
+        wsgi_application: the application
+        executor: threads running the application, None to run it on the event loop
+        on_response_done: called in the thread that produced a response after it is
+            closed (e.g., to close connections opened by the thread)
+    """
+
+    def __init__(
+        self,
+        wsgi_application: Any,
+        executor: Optional[Any] = None,
+        on_response_done: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(wsgi_application, executor)
+        self.on_response_done = on_response_done
+
+    async def handle_request(self, request: httputil.HTTPServerRequest) -> None:
+        loop = asyncio.get_running_loop()
+        # without threads, the producer runs to the end on the event loop before the
+        # response is written, so the queue can not be bounded
+        threaded = self.executor is not dummy_executor
+        queue: asyncio.Queue = asyncio.Queue(STREAM_QUEUE_SIZE if threaded else 0)
+        cancelled = threading.Event()
+
+        def emit(item: tuple):
+            if threaded:
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+            else:
+                queue.put_nowait(item)
+
+        producer = loop.run_in_executor(
+            self.executor, self._produce, self.environ(request), emit, cancelled
+        )
+        ended = False
+        try:
+            item = await queue.get()
+            if item[0] == "end":
+                ended = True
+                raise item[1]
+            _, status, headers = item
+
+            # read until the second chunk to know whether the body can be sent at once
+            chunks: List[bytes] = []
+            end = None
+            while len(chunks) < 2:
+                item = await queue.get()
+                if item[0] == "end":
+                    ended = True
+                    end = item
+                    break
+                chunks.append(item[1])
+            if end is not None and end[1] is not None:
+                raise end[1]
+
+            status_code_str, reason = status.split(" ", 1)
+            status_code = int(status_code_str)
+            header_set = {k.lower() for (k, v) in headers}
+            if "content-type" not in header_set:
+                headers.append(("Content-Type", "text/html; charset=UTF-8"))
+            if "server" not in header_set:
+                headers.append(("Server", "TornadoServer/%s" % tornado.version))
+
+            start_line = httputil.ResponseStartLine("HTTP/1.1", status_code, reason)
+            header_obj = httputil.HTTPHeaders()
+            assert request.connection is not None
+
+            if end is not None:
+                body = escape.utf8(b"".join(chunks))
+                if status_code != 304 and "content-length" not in header_set:
+                    headers.append(("Content-Length", str(len(body))))
+                for key, value in headers:
+                    header_obj.add(key, value)
+                request.connection.write_headers(start_line, header_obj, chunk=body)
+            else:
+                for key, value in headers:
+                    header_obj.add(key, value)
+                await request.connection.write_headers(
+                    start_line, header_obj, chunk=escape.utf8(b"".join(chunks))
+                )
+                while True:
+                    item = await queue.get()
+                    if item[0] == "end":
+                        ended = True
+                        if item[1] is not None:
+                            # do not finish the response as if it were complete
+                            request.connection.close()  # type: ignore
+                            raise item[1]
+                        break
+                    await request.connection.write(escape.utf8(item[1]))
+        except BaseException:
+            cancelled.set()
+            raise
+        finally:
+            # let the producer stop and close the response
+            while not ended:
+                ended = (await queue.get())[0] == "end"
+            await producer
+
+        request.connection.finish()
+        self._log(status_code, request)
+
+    def _produce(
+        self,
+        environ: Dict[str, Any],
+        emit: Callable[[tuple], None],
+        cancelled: threading.Event,
+    ):
+        """Call the application and emit the status and headers, then the (non-empty)
+        chunks, and finally the end of the response with the error if any
+        """
+        data: Dict[str, Any] = {}
+        response: List[bytes] = []
+
+        def start_response(
+            status: str,
+            headers: List[Tuple[str, str]],
+            exc_info: Optional[Tuple] = None,
+        ) -> Callable[[bytes], Any]:
+            data["status"] = status
+            data["headers"] = headers
+            return response.append
+
+        def emit_response():
+            if not data:
+                raise Exception("WSGI app did not call start_response")
+            if "sent" not in data:
+                data["sent"] = True
+                emit(("headers", data["status"], data["headers"]))
+            body = b"".join(response)
+            response.clear()
+            if len(body) > 0:
+                emit(("chunk", body))
+
+        error = None
+        try:
+            app_response = self.wsgi_application(environ, start_response)
+            try:
+                for chunk in app_response:
+                    response.append(chunk)
+                    emit_response()
+                    if cancelled.is_set():
+                        break
+                emit_response()
+            finally:
+                if hasattr(app_response, "close"):
+                    app_response.close()  # type: ignore
+        except BaseException as e:
+            error = e
+        finally:
+            if self.on_response_done is not None:
+                self.on_response_done()
+            emit(("end", error))
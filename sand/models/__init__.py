@@ -1,8 +1,34 @@
 from sand.models.base import db, init_db
 from sand.models.entity import Value, EntityAR
 from sand.models.project import Project
-from sand.models.semantic_model import SemanticModel
+from sand.models.semantic_model import SemanticModel, SemanticModelVersion
 from sand.models.table import Table, TableRow, Link, ContextPage
-from sand.models.transformation import Transformation
+from sand.models.columnar import ColumnChunk
+from sand.models.cell_link import CellLink, CellCandidateEntity
+from sand.models.cell_text import CellText
+from sand.models.cell_search import CellSearch
+from sand.models.transformation import (
+    Transformation,
+    TransformationCache,
+    TransformationUndo,
+)
+from sand.models.job import Job
+from sand.models.column_stats import ColumnStats
 
-all_tables = [Project, SemanticModel, Table, TableRow, Transformation]
+all_tables = [
+    Project,
+    SemanticModel,
+    SemanticModelVersion,
+    Table,
+    TableRow,
+    Transformation,
+    TransformationCache,
+    TransformationUndo,
+    ColumnChunk,
+    CellLink,
+    CellCandidateEntity,
+    CellText,
+    CellSearch,
+    ColumnStats,
+    Job,
+]
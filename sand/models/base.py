@@ -1,18 +1,110 @@
 import functools
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Callable, Mapping, TypeVar, Union
+from typing import Any, Callable, Literal, Mapping, TypeVar, Union
 
 from peewee import Field, Model, SqliteDatabase
+from playhouse.pool import PooledSqliteDatabase
 from sand.config import CACHE_SIZE
+from sand.models.codec import CodecName, set_codec
 
 # TODO: consider moving to APSWDatabase
 db = SqliteDatabase(None)
+# pool of read-only connections to the same database file for heavy read requests
+read_db = PooledSqliteDatabase(None)
+
+
+def init_db(
+    dbfile: Union[str, Path],
+    busy_timeout: int = 5000,
+    synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL",
+    mmap_size: int = 256 * 1024 * 1024,
+    cache_size: int = -64 * 1024,
+    read_pool_size: int = 8,
+    codec: CodecName = "json",
+):
+    """Initialize database
+
+    The database runs in WAL mode so that readers do not wait behind a writer and
+    vice versa. Connections are per thread (see `connect_db` and `close_db` for
+    managing them per request).
+
+    Args:
+        dbfile: path to the database file
+        busy_timeout: milliseconds to wait for a lock before failing with database is locked
+        synchronous: SQLite synchronous level, NORMAL is safe in WAL mode
+        mmap_size: maximum number of bytes of the database file to memory-map
+        cache_size: page cache size, negative numbers are in KiB and positive numbers are in pages
+        read_pool_size: maximum number of read-only connections used by `read_only_db`, 0 to disable
+        codec: codec of rows, links, and semantic models written to the database (see `sand.models.codec`)
+    """
+    global db
+    set_codec(codec)
+    pragmas = {
+        "foreign_keys": 1,
+        "busy_timeout": busy_timeout,
+        "synchronous": synchronous,
+        "mmap_size": mmap_size,
+        "cache_size": cache_size,
+    }
+    db.init(str(dbfile), pragmas={"journal_mode": "wal", **pragmas})
+
+    if str(dbfile) != ":memory:" and read_pool_size > 0:
+        read_db.init(
+            f"file:{Path(dbfile).absolute()}?mode=ro",
+            uri=True,
+            max_connections=read_pool_size,
+            pragmas={"query_only": 1, **pragmas},
+        )
+    else:
+        read_db.init(None)
 
 
-def init_db(dbfile: Union[str, Path]):
-    """Initialize database"""
-    global db
-    db.init(str(dbfile), pragmas={"foreign_keys": 1})
+def is_memory_db() -> bool:
+    return db.database == ":memory:"
+
+
+def connect_db():
+    """Open a connection for the current thread (e.g., at the beginning of a request).
+    An in-memory database is kept in a single connection for the whole process.
+    """
+    if not is_memory_db():
+        db.connect(reuse_if_open=True)
+
+
+def close_db(*args):
+    """Close the connection of the current thread (e.g., at the end of a request)"""
+    if not is_memory_db() and not db.is_closed():
+        db.close()
+
+
+@contextmanager
+def read_only_db():
+    """Execute queries of the current thread on a read-only connection from the read
+    pool, so that long reads such as exports run on their own WAL snapshot. Can be used
+    as a decorator. It does nothing if the read pool is disabled or the thread is in a
+    transaction (its writes must stay visible).
+    """
+    state = db._state
+    if (
+        read_db.deferred
+        or len(state.transactions) > 0
+        or not read_db.is_closed()  # already in a read-only block
+    ):
+        yield
+        return
+
+    prev_conn = None if state.closed else state.conn
+    read_db.connect()
+    state.set_connection(read_db.connection())
+    try:
+        yield
+    finally:
+        if prev_conn is None:
+            state.reset()
+        else:
+            state.set_connection(prev_conn)
+        read_db.close()
 
 
 class BaseModel(Model):
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from typing import List, Sequence, Set
+
+from peewee import CharField, FloatField, ForeignKeyField, IntegerField, TextField
+
+from sand.models.base import BaseModel, db
+from sand.models.table import (
+    Link,
+    Table,
+    TableRow,
+    TableRowListener,
+    iter_rows,
+    row_listeners,
+)
+
+
+class CellLink(BaseModel):
+    """A link of a cell, normalized from `TableRow.links` so that links can be queried
+    by column or entity without decoding the rows. It is kept in sync with the rows by
+    `CellLinkListener`.
+    """
+
+    table = ForeignKeyField(Table, backref="cell_links", on_delete="CASCADE")
+    row = ForeignKeyField(TableRow, backref="cell_links", on_delete="CASCADE")
+    row_index = IntegerField()
+    column = IntegerField()
+    # position of the link in the list of links of the cell
+    link_index = IntegerField()
+    start = IntegerField()
+    end = IntegerField()
+    url = TextField(null=True)
+    entity_id = CharField(null=True)
+
+    class Meta:
+        indexes = (
+            (("table", "column", "row_index"), False),
+            (("table", "column", "entity_id"), False),
+            (("entity_id",), False),
+            (("row", "column", "link_index"), True),
+        )
+
+
+class CellCandidateEntity(BaseModel):
+    """A candidate entity of a cell link"""
+
+    link = ForeignKeyField(CellLink, backref="candidates", on_delete="CASCADE")
+    table = ForeignKeyField(Table, on_delete="CASCADE")
+    column = IntegerField()
+    # position of the candidate in the list of candidates of the link
+    rank = IntegerField()
+    entity_id = CharField()
+    probability = FloatField()
+
+    class Meta:
+        indexes = (
+            (("link", "rank"), True),
+            (("table", "column", "entity_id"), False),
+            (("entity_id",), False),
+        )
+
+
+def index_row_links(table_id: int, rows: Sequence[TableRow]):
+    """Replace the normalized links of the given rows by their current links"""
+    with db.atomic():
+        for i in range(0, len(rows), 500):
+            CellLink.delete().where(
+                CellLink.row.in_([row.id for row in rows[i : i + 500]])
+            ).execute()
+
+        cell_links: List[CellLink] = []
+        links: List[Link] = []
+        for row in rows:
+            if row.links is None:
+                continue
+            for ci, lst in row.links.items():
+                for li, link in enumerate(lst):
+                    cell_links.append(
+                        CellLink(
+                            table=table_id,
+                            row=row.id,
+                            row_index=row.index,
+                            column=int(ci),
+                            link_index=li,
+                            start=link.start,
+                            end=link.end,
+                            url=link.url,
+                            entity_id=link.entity_id,
+                        )
+                    )
+                    links.append(link)
+        CellLink.bulk_create(cell_links, batch_size=500)
+        if any(len(link.candidate_entities) > 0 for link in links):
+            # sqlite does not return ids of the inserted records so we query them back
+            key2link = {
+                (cell_link.row_id, cell_link.column, cell_link.link_index): cell_link
+                for cell_link in cell_links
+            }
+            for i in range(0, len(rows), 500):
+                query = CellLink.select(
+                    CellLink.id, CellLink.row, CellLink.column, CellLink.link_index
+                ).where(CellLink.row.in_([row.id for row in rows[i : i + 500]]))
+                for r in query:
+                    key2link[r.row_id, r.column, r.link_index].id = r.id
+
+        candidates: List[CellCandidateEntity] = []
+        for cell_link, link in zip(cell_links, links):
+            for rank, candidate in enumerate(link.candidate_entities):
+                candidates.append(
+                    CellCandidateEntity(
+                        link=cell_link.id,
+                        table=table_id,
+                        column=cell_link.column,
+                        rank=rank,
+                        entity_id=candidate.entity_id,
+                        probability=candidate.probability,
+                    )
+                )
+        CellCandidateEntity.bulk_create(candidates, batch_size=500)
+
+
+def index_table_links(table: Table):
+    """Rebuild the normalized links of a table from its rows"""
+    with db.atomic():
+        CellLink.delete().where(CellLink.table == table).execute()
+        batch: List[TableRow] = []
+        for row in iter_rows(table, columns=[]):
+            batch.append(row)
+            if len(batch) == 1000:
+                index_row_links(table.id, batch)
+                batch = []
+        if len(batch) > 0:
+            index_row_links(table.id, batch)
+
+
+class CellLinkListener(TableRowListener):
+    def on_rows_saved(
+        self, table_id: int, rows: Sequence[TableRow], fields: Set[str]
+    ) -> None:
+        if "links" in fields:
+            index_row_links(table_id, rows)
+
+
+row_listeners.append(CellLinkListener())
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from peewee import chunked
+from playhouse.sqlite_ext import FTS5Model, RowIDField, SearchField
+
+from sand.models.base import db
+from sand.models.table import (
+    Table,
+    TableRow,
+    TableRowListener,
+    iter_rows,
+    row_listeners,
+)
+
+# the rowid of a cell in the index is (row id << COLUMN_BITS) | column so that cells of
+# a row are a contiguous range of rowids. Columns beyond the limit are not indexed.
+COLUMN_BITS = 16
+MAX_COLUMNS = 1 << COLUMN_BITS
+
+
+class CellSearch(FTS5Model):
+    """Full-text index over the text of cells. It is kept in sync with the rows by
+    `CellSearchListener`, and entries of deleted rows (including rows deleted by
+    cascading from their table or project) are removed by a trigger on `TableRow`.
+    """
+
+    rowid = RowIDField()
+    text = SearchField()
+    # tokens `t<table id>` and `p<project id>` to restrict a search to a table or a project
+    scope = SearchField()
+
+    class Meta:
+        database = db
+        depends_on = [TableRow]
+        options = {"tokenize": "unicode61 remove_diacritics 2"}
+
+    @classmethod
+    def create_table(cls, safe=True, **options):
+        super().create_table(safe=safe, **options)
+        cls._meta.database.execute_sql(
+            f"CREATE TRIGGER {'IF NOT EXISTS ' if safe else ''}{cls._trigger_name()} "
+            f"AFTER DELETE ON {TableRow._meta.table_name} BEGIN "
+            f"DELETE FROM {cls._meta.table_name} WHERE rowid BETWEEN "
+            f"old.id * {MAX_COLUMNS} AND old.id * {MAX_COLUMNS} + {MAX_COLUMNS - 1}; "
+            "END"
+        )
+
+    @classmethod
+    def drop_table(cls, safe=True, **options):
+        cls._meta.database.execute_sql(
+            f"DROP TRIGGER {'IF EXISTS ' if safe else ''}{cls._trigger_name()}"
+        )
+        super().drop_table(safe=safe, **options)
+
+    @classmethod
+    def _trigger_name(cls):
+        return f"{cls._meta.table_name}_on_row_deleted"
+
+
+@dataclass
+class CellMatch:
+    table: int
+    row: int  # index of the row
+    column: int
+    highlight: str
+
+
+def to_fts_query(text: str) -> Optional[str]:
+    """Convert a user query to a FTS5 query matching cells containing all terms of the
+    query, the last term is matched as a prefix. Terms are quoted so FTS5 operators in
+    the query are treated as text. Returns None if the query has no terms.
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if len(terms) == 0:
+        return None
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_cells(
+    text: str,
+    table: Optional[int] = None,
+    project: Optional[int] = None,
+    limit: int = 100,
+    highlight: Tuple[str, str] = ("<mark>", "</mark>"),
+) -> List[CellMatch]:
+    """Search cells of a table or a project containing the text. Matches are ordered
+    by the table, the row and the column.
+    """
+    query = to_fts_query(text)
+    if query is None:
+        return []
+    if table is not None:
+        query = f'text : ({query}) AND scope : "t{table}"'
+    elif project is not None:
+        query = f'text : ({query}) AND scope : "p{project}"'
+
+    records = list(
+        CellSearch.select(CellSearch.rowid, CellSearch.text.highlight(*highlight))
+        .where(CellSearch.match(query))
+        .order_by(CellSearch.rowid)
+        .limit(limit)
+        .tuples()
+    )
+
+    rows: Dict[int, TableRow] = {}
+    for batch in chunked({rowid >> COLUMN_BITS for rowid, _ in records}, 500):
+        for row in TableRow.select(TableRow.id, TableRow.table, TableRow.index).where(
+            TableRow.id.in_(batch)
+        ):
+            rows[row.id] = row
+
+    matches = []
+    for rowid, hl in records:
+        row = rows[rowid >> COLUMN_BITS]
+        matches.append(
+            CellMatch(
+                table=row.table_id,
+                row=row.index,
+                column=rowid & (MAX_COLUMNS - 1),
+                highlight=hl,
+            )
+        )
+    matches.sort(key=lambda m: (m.table, m.row, m.column))
+    return matches
+
+
+def index_row_search(table_id: int, rows: Sequence[TableRow]):
+    """Replace the indexed text of the cells of the given rows by their current values"""
+    project_id = Table.select(Table.project).where(Table.id == table_id).scalar()
+    scope = f"t{table_id} p{project_id}"
+
+    with db.atomic():
+        row_ids = sorted(row.id for row in rows)
+        if len(row_ids) > 0 and row_ids[-1] - row_ids[0] + 1 == len(row_ids):
+            # ids are contiguous (e.g., newly inserted rows), delete them in one go
+            _delete_rowid_range(row_ids[0], row_ids[-1])
+        else:
+            for row_id in row_ids:
+                _delete_rowid_range(row_id, row_id)
+
+        records = (
+            ((row.id << COLUMN_BITS) | ci, str(value), scope)
+            for row in rows
+            for ci, value in enumerate(row.row[:MAX_COLUMNS])
+            if value is not None and str(value) != ""
+        )
+        for batch in chunked(records, 1000):
+            CellSearch.insert_many(
+                batch, fields=[CellSearch.rowid, CellSearch.text, CellSearch.scope]
+            ).execute()
+
+
+def _delete_rowid_range(start_row_id: int, end_row_id: int):
+    CellSearch.delete().where(
+        CellSearch.rowid.between(
+            start_row_id << COLUMN_BITS, ((end_row_id + 1) << COLUMN_BITS) - 1
+        )
+    ).execute()
+
+
+def index_table_search(table: Table):
+    """Rebuild the full-text index of a table from its rows"""
+    with db.atomic():
+        CellSearch.delete().where(
+            CellSearch.rowid.in_(
+                CellSearch.select(CellSearch.rowid).where(
+                    CellSearch.match(f'scope : "t{table.id}"')
+                )
+            )
+        ).execute()
+        batch: List[TableRow] = []
+        for row in iter_rows(table, with_links=False):
+            batch.append(row)
+            if len(batch) == 1000:
+                index_row_search(table.id, batch)
+                batch = []
+        if len(batch) > 0:
+            index_row_search(table.id, batch)
+
+
+class CellSearchListener(TableRowListener):
+    def on_rows_saved(
+        self, table_id: int, rows: Sequence[TableRow], fields: Set[str]
+    ) -> None:
+        if "row" in fields:
+            index_row_search(table_id, rows)
+
+
+row_listeners.append(CellSearchListener())
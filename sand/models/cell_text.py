@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from hashlib import blake2b
+from typing import Any, List, Sequence, Set
+
+from peewee import ForeignKeyField, IntegerField, chunked
+
+from sand.models.base import BaseModel, db
+from sand.models.table import (
+    Table,
+    TableRow,
+    TableRowListener,
+    iter_rows,
+    row_listeners,
+)
+
+
+def normalize_cell_text(value: Any) -> str:
+    return str(value).strip().casefold()
+
+
+def cell_text_key(value: Any) -> int:
+    """64-bit hash of the normalized text of a cell"""
+    return int.from_bytes(
+        blake2b(normalize_cell_text(value).encode(), digest_size=8).digest(),
+        "little",
+        signed=True,
+    )
+
+
+class CellText(BaseModel):
+    """Hash index over the normalized text of cells to find cells of a column with a
+    given text without scanning the table. As different texts may have the same key,
+    callers must verify the text of the matched cells.
+    """
+
+    table = ForeignKeyField(Table, on_delete="CASCADE")
+    row = ForeignKeyField(TableRow, on_delete="CASCADE")
+    column = IntegerField()
+    key = IntegerField()
+
+    class Meta:
+        indexes = (
+            (("table", "column", "key"), False),
+            (("row", "column"), True),
+        )
+
+
+def find_rows_by_text(table: Table, column: int, text: str) -> List[int]:
+    """Get ids of rows whose cell in the column may match the text (see `CellText`)"""
+    query = CellText.select(CellText.row).where(
+        (CellText.table == table)
+        & (CellText.column == column)
+        & (CellText.key == cell_text_key(text))
+    )
+    return [r.row_id for r in query.iterator()]
+
+
+def index_row_texts(table_id: int, rows: Sequence[TableRow]):
+    with db.atomic():
+        for i in range(0, len(rows), 500):
+            CellText.delete().where(
+                CellText.row.in_([row.id for row in rows[i : i + 500]])
+            ).execute()
+
+        records = (
+            (table_id, row.id, ci, cell_text_key(value))
+            for row in rows
+            for ci, value in enumerate(row.row)
+        )
+        for batch in chunked(records, 1000):
+            CellText.insert_many(
+                batch,
+                fields=[CellText.table, CellText.row, CellText.column, CellText.key],
+            ).execute()
+
+
+def index_table_texts(table: Table):
+    """Rebuild the text index of a table from its rows"""
+    with db.atomic():
+        CellText.delete().where(CellText.table == table).execute()
+        batch: List[TableRow] = []
+        for row in iter_rows(table, with_links=False):
+            batch.append(row)
+            if len(batch) == 1000:
+                index_row_texts(table.id, batch)
+                batch = []
+        if len(batch) > 0:
+            index_row_texts(table.id, batch)
+
+
+class CellTextListener(TableRowListener):
+    def on_rows_saved(
+        self, table_id: int, rows: Sequence[TableRow], fields: Set[str]
+    ) -> None:
+        if "row" in fields:
+            index_row_texts(table_id, rows)
+
+
+row_listeners.append(CellTextListener())
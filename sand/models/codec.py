@@ -0,0 +1,144 @@
+"""Encoding of JSON-like values stored in blob columns (rows and links of tables, semantic
+models).
+
+An encoded value starts with a tag byte telling how the payload is encoded. Values encoded
+by the `json` codec are plain JSON without a tag, the same as values written by older
+versions of SAND, which are read as JSON because JSON never starts with a tag byte.
+"""
+
+from __future__ import annotations
+
+import threading
+from enum import Enum
+from typing import Any, Literal, Optional, Union
+
+import orjson
+from gena.custom_fields import Dict2ListDataClassField
+from peewee import TextField
+
+CodecName = Literal["json", "msgpack", "zstd", "zstd+msgpack"]
+CODECS = ["json", "msgpack", "zstd", "zstd+msgpack"]
+
+MSGPACK_TAG = 0x02
+ZSTD_TAG = 0x03
+ZSTD_MSGPACK_TAG = 0x04
+
+# codec of the values written to the database, set by `init_db`
+_codec: CodecName = "json"
+_zstd = threading.local()
+
+
+def set_codec(codec: CodecName):
+    """Set the codec of the values written to the database"""
+    global _codec
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}. Available codecs: {CODECS}")
+    if codec != "json":
+        # fail early if the optional dependencies are missing
+        _get_msgpack() if "msgpack" in codec else _get_zstd()
+    _codec = codec
+
+
+def get_codec() -> CodecName:
+    return _codec
+
+
+def encode(value: Any, codec: Optional[CodecName] = None) -> bytes:
+    codec = codec or _codec
+    if codec == "json":
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    if codec == "msgpack":
+        return bytes([MSGPACK_TAG]) + _packb(value)
+    if codec == "zstd":
+        return bytes([ZSTD_TAG]) + _get_zstd()[0].compress(
+            orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        )
+    if codec == "zstd+msgpack":
+        return bytes([ZSTD_MSGPACK_TAG]) + _get_zstd()[0].compress(_packb(value))
+    raise ValueError(f"Unknown codec {codec}")
+
+
+def decode(data: Union[bytes, str]) -> Any:
+    if isinstance(data, str) or len(data) == 0:
+        return orjson.loads(data)
+    tag = data[0]
+    if tag == MSGPACK_TAG:
+        return _get_msgpack().unpackb(data[1:])
+    if tag == ZSTD_TAG:
+        return orjson.loads(_get_zstd()[1].decompress(data[1:]))
+    if tag == ZSTD_MSGPACK_TAG:
+        return _get_msgpack().unpackb(_get_zstd()[1].decompress(data[1:]))
+    return orjson.loads(data)
+
+
+def _packb(value: Any) -> bytes:
+    return _get_msgpack().packb(value, default=_msgpack_default)
+
+
+def _msgpack_default(value: Any):
+    # the same as orjson, which serializes enums as their values
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Type is not msgpack serializable: {type(value).__name__}")
+
+
+def _get_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError(
+            "msgpack is required to read or write values encoded by msgpack. Install it with `pip install msgpack`"
+        )
+    return msgpack
+
+
+def _get_zstd():
+    """Get the (compressor, decompressor) of the current thread as they are not thread-safe"""
+    if not hasattr(_zstd, "codec"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "zstandard is required to read or write values compressed by zstd. Install it with `pip install zstandard`"
+            )
+        _zstd.codec = (zstandard.ZstdCompressor(), zstandard.ZstdDecompressor())
+    return _zstd.codec
+
+
+class EncodedJSONField(TextField):
+    """A JSON value stored with the current codec. Like `JSONField`, it is stored as text
+    when the codec is `json`, and its type annotation tells the type of its values.
+    """
+
+    field_type = "JSON"
+
+    def db_value(self, value):
+        if value is None:
+            return None
+        if _codec == "json":
+            return encode(value).decode()
+        return encode(value)
+
+    def python_value(self, value):
+        if value is None:
+            return None
+        return decode(value)
+
+
+class EncodedDict2ListDataClassField(Dict2ListDataClassField):
+    """`Dict2ListDataClassField` stored with the current codec"""
+
+    def db_value(self, value):
+        if value is None:
+            return None
+        return encode(
+            {k: [self.to_tuple(item) for item in lst] for k, lst in value.items()}
+        )
+
+    def python_value(self, value):
+        if value is None:
+            return None
+        return {
+            k: [self.from_tuple(item) for item in lst]
+            for k, lst in decode(value).items()
+        }
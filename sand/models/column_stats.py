@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import math
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import orjson
+from peewee import BooleanField, CharField, FloatField, ForeignKeyField, IntegerField
+from playhouse.sqlite_ext import JSONField
+
+from sand.helpers.sketches import HyperLogLog, Reservoir, TopK
+from sand.models.base import BaseModel, db
+from sand.models.job import Job, update_job_progress
+from sand.models.table import (
+    Table,
+    TableRow,
+    TableRowListener,
+    iter_rows,
+    row_listeners,
+)
+
+# number of most frequent values of a column kept in its stats
+TOP_K = 10
+# number of bins of the histograms of numeric columns
+HISTOGRAM_BINS = 20
+
+
+class ColumnStats(BaseModel):
+    """Profile of the values of a column of a table, computed when the rows are saved
+    (see `ColumnProfiler`). Stats of a table are marked as stale when its rows change and
+    are computed again by a background job (see `run_column_stats_job`).
+    """
+
+    # fmt: off
+    table = ForeignKeyField(Table, backref="column_stats", on_delete="CASCADE")
+    column = IntegerField()
+    n_rows = IntegerField()
+    # number of empty cells (null or blank)
+    n_nulls = IntegerField()
+    # estimated number of distinct non-empty values
+    n_distinct = IntegerField()
+    # inferred type of the non-empty values: integer, number, string, or empty
+    type = CharField()
+    # number of non-empty values of each type
+    type_counts: Dict[str, int] = JSONField()  # type: ignore
+    # most frequent values and their counts
+    top_values: List[list] = JSONField()  # type: ignore
+    # of the numeric values
+    min = FloatField(null=True)
+    max = FloatField(null=True)
+    # bin edges and (estimated) counts of the numeric values
+    histogram: Optional[dict] = JSONField(null=True)  # type: ignore
+    # whether the rows have changed since the stats were computed
+    stale = BooleanField(default=False)
+    # fmt: on
+
+    class Meta:
+        indexes = ((("table", "column"), True),)
+
+    def to_dict(self):
+        return {
+            "column": self.column,
+            "n_rows": self.n_rows,
+            "n_nulls": self.n_nulls,
+            "n_distinct": self.n_distinct,
+            "type": self.type,
+            "type_counts": self.type_counts,
+            "top_values": self.top_values,
+            "min": self.min,
+            "max": self.max,
+            "histogram": self.histogram,
+            "stale": self.stale,
+        }
+
+
+def parse_number(value: Any) -> Tuple[Optional[Union[int, float]], bool]:
+    """Get the numeric value of a cell (numbers or strings of numbers) and whether it is
+    an integer. The value is None if the cell is not a finite number.
+    """
+    if type(value) is int:
+        return value, True
+    if type(value) is float:
+        return (value if math.isfinite(value) else None), False
+    try:
+        return int(value), True
+    except (TypeError, ValueError):
+        pass
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None, False
+    return (number if math.isfinite(number) else None), False
+
+
+class _ColumnProfile:
+    def __init__(self):
+        self.n_rows = 0
+        self.n_nulls = 0
+        self.n_integers = 0
+        self.n_numbers = 0
+        self.n_strings = 0
+        self.hll = HyperLogLog()
+        self.top = TopK()
+        self.min = math.inf
+        self.max = -math.inf
+        self.numbers = Reservoir()
+
+    def update(self, values: List[Any]):
+        self.n_rows += len(values)
+        nonempty = []
+        for value in values:
+            if value is None or (type(value) is str and value.strip() == ""):
+                self.n_nulls += 1
+                continue
+            nonempty.append(value)
+            number, is_integer = parse_number(value)
+            if number is None:
+                self.n_strings += 1
+                continue
+            if is_integer:
+                self.n_integers += 1
+            else:
+                self.n_numbers += 1
+            if number < self.min:
+                self.min = number
+            if number > self.max:
+                self.max = number
+            self.numbers.add(number)
+
+        if (
+            self.top.exact
+            and len(self.top.counter) + len(nonempty) > 2 * self.top.capacity
+        ):
+            # the values may not be counted exactly anymore, the sketch starts with
+            # the distinct values seen so far
+            for value in self.top.counter:
+                self.hll.add(orjson.dumps(value))
+        self.top.update(nonempty)
+        if not self.top.exact:
+            for value in nonempty:
+                self.hll.add(orjson.dumps(value))
+
+    def to_stats(self, table_id: int, column: int) -> ColumnStats:
+        n_numeric = self.n_integers + self.n_numbers
+        if self.n_strings > 0:
+            inferred_type = "string"
+        elif self.n_numbers > 0:
+            inferred_type = "number"
+        elif self.n_integers > 0:
+            inferred_type = "integer"
+        else:
+            inferred_type = "empty"
+
+        return ColumnStats(
+            table=table_id,
+            column=column,
+            n_rows=self.n_rows,
+            n_nulls=self.n_nulls,
+            n_distinct=(len(self.top.counter) if self.top.exact else self.hll.count()),
+            type=inferred_type,
+            type_counts={
+                "integer": self.n_integers,
+                "number": self.n_numbers,
+                "string": self.n_strings,
+            },
+            top_values=[[value, count] for value, count in self.top.top(TOP_K)],
+            min=self.min if n_numeric > 0 else None,
+            max=self.max if n_numeric > 0 else None,
+            histogram=self.histogram() if n_numeric > 0 else None,
+        )
+
+    def histogram(self) -> dict:
+        """Histogram of equal-width bins between the min and max values, the counts are
+        scaled from the sample of the numeric values
+        """
+        n_bins = HISTOGRAM_BINS if self.max > self.min else 1
+        width = (self.max - self.min) / n_bins
+        counts = [0] * n_bins
+        for number in self.numbers.values:
+            i = int((number - self.min) / width) if width > 0 else 0
+            counts[min(i, n_bins - 1)] += 1
+        scale = self.numbers.n / len(self.numbers.values)
+        return {
+            "edges": [self.min + i * width for i in range(n_bins)] + [self.max],
+            "counts": [round(c * scale) for c in counts],
+        }
+
+
+# ids of the tables whose rows are being inserted by a `ColumnProfiler` of the thread
+_filling = threading.local()
+
+
+class ColumnProfiler:
+    """Compute stats of the columns of a table from its rows in a single pass, e.g.,
+    while the rows are inserted. The exact distinct values are counted until there are
+    too many of them, then they are estimated with a HyperLogLog sketch.
+    """
+
+    def __init__(self, n_columns: int):
+        self.columns = [_ColumnProfile() for _ in range(n_columns)]
+
+    @contextmanager
+    def filling(self, table: Table):
+        """Insert the rows of the table in this block: its stats are not invalidated
+        as they are replaced by `save` afterward
+        """
+        tables = getattr(_filling, "tables", None)
+        if tables is None:
+            tables = _filling.tables = set()
+        tables.add(table.id)
+        try:
+            yield
+        finally:
+            tables.discard(table.id)
+
+    def update(self, rows: Sequence[Sequence[Any]]):
+        for ci, column in enumerate(self.columns):
+            column.update([row[ci] if ci < len(row) else None for row in rows])
+
+    def save(self, table: Table) -> List[ColumnStats]:
+        """Replace the stats of the table"""
+        stats = [
+            column.to_stats(table.id, ci) for ci, column in enumerate(self.columns)
+        ]
+        with db.atomic():
+            ColumnStats.delete().where(ColumnStats.table == table).execute()
+            ColumnStats.bulk_create(stats, batch_size=100)
+        return stats
+
+
+def compute_column_stats(table: Table, job: Optional[Job] = None) -> List[ColumnStats]:
+    """(Re-)compute the stats of the columns of a table from its rows. The rows are read
+    and the stats are replaced in one transaction, so the stats are not saved if the
+    rows change in the meantime (the transaction fails to write).
+
+    Args:
+        table: the table
+        job: job computing the stats, stopped if it is requested to cancel
+    """
+    profiler = ColumnProfiler(len(table.columns))
+    with db.atomic():
+        batch = []
+        for row in iter_rows(table, with_links=False):
+            batch.append(row.row)
+            if len(batch) == 1000:
+                profiler.update(batch)
+                batch = []
+                if job is not None:
+                    # only checks whether the job is cancelled, as writing its progress
+                    # would hold the write lock for the rest of the transaction
+                    update_job_progress(job)
+        if len(batch) > 0:
+            profiler.update(batch)
+        return profiler.save(table)
+
+
+def get_column_stats(table: Table) -> Tuple[List[ColumnStats], bool]:
+    """Get the stored stats of the columns of a table, ordered by column, and whether
+    they are stale (the rows changed since they were computed, or they are missing).
+    This does not compute the stats (see `run_column_stats_job`).
+    """
+    stats = list(
+        ColumnStats.select()
+        .where(ColumnStats.table == table)
+        .order_by(ColumnStats.column)
+    )
+    stale = len(stats) != len(table.columns) or any(s.stale for s in stats)
+    return stats, stale
+
+
+def find_column_stats_job(table: Table) -> Optional[Job]:
+    """Get the pending or running job computing the stats of the table if any"""
+    return (
+        Job.select()
+        .where(
+            (Job.type == "column_stats")
+            & (Job.status.in_(["pending", "running"]))
+            & (Job.params["table"] == table.id)
+        )
+        .first()
+    )
+
+
+def run_column_stats_job(job: Job) -> dict:
+    """Compute the stats of the columns of a table. Params of the job: `table` (id)"""
+    table = Table.get_by_id(job.params["table"])
+    update_job_progress(job, n_rows=table.size)
+    compute_column_stats(table, job)
+    return {"table_id": table.id}
+
+
+class ColumnStatsListener(TableRowListener):
+    """Mark the stats of a table as stale when the values of its rows change, except
+    while the rows are inserted with `ColumnProfiler.filling`
+    """
+
+    def on_rows_saved(
+        self, table_id: int, rows: Sequence[TableRow], fields: Set[str]
+    ) -> None:
+        if "row" in fields:
+            self.invalidate(table_id)
+
+    def on_rows_deleted(self, table_id: int, rows: Sequence[TableRow]) -> None:
+        self.invalidate(table_id)
+
+    def invalidate(self, table_id: int):
+        if table_id in getattr(_filling, "tables", ()):
+            return
+        ColumnStats.update(stale=True).where(
+            (ColumnStats.table == table_id) & (ColumnStats.stale == False)
+        ).execute()
+
+
+row_listeners.append(ColumnStatsListener())
@@ -0,0 +1,317 @@
+"""Optional column-major copy of the cells of tables.
+
+When it is enabled (`sand start --column-chunks`), the values of the cells of a table
+are also stored in `ColumnChunk` records, one per column and range of `CHUNK_SIZE` row
+indices, so that operations reading a few columns of a large table (e.g., the hashes
+of the input columns of transformations) do not decode every row. `TableRow` stays the
+source of truth: chunks are built and patched by `ColumnChunkListener` when rows are
+written, and readers fall back to the rows of tables that do not have chunks.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import orjson
+from peewee import ForeignKeyField, IntegerField, chunked
+
+from sand.models.base import BaseModel, BlobField, db
+from sand.models.table import (
+    Table,
+    TableRow,
+    TableRowListener,
+    iter_rows,
+    row_listeners,
+)
+
+# number of row indices covered by a chunk
+CHUNK_SIZE = 4096
+# the chunks of this column store the indices of the rows of the other chunks
+INDEX_COLUMN = -1
+
+# type tags of the encoded values of a chunk
+INT_TAG = b"i"
+FLOAT_TAG = b"d"
+JSON_TAG = b"j"
+
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+# whether the chunks are maintained and read, set by `set_column_chunks`
+_enabled = False
+
+
+def set_column_chunks(enabled: bool):
+    """Enable or disable the column chunks. When they are disabled, the chunks of a
+    table are dropped when its rows change, so that they are never out of date.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def use_column_chunks() -> bool:
+    return _enabled
+
+
+def encode_values(values: Sequence[Any]) -> bytes:
+    """Encode values of a column chunk into a compact typed blob. Columns of only
+    integers or only floats are stored as packed arrays, the others as a JSON list.
+    """
+    if len(values) > 0:
+        if all(type(v) is int and INT64_MIN <= v <= INT64_MAX for v in values):
+            return INT_TAG + array("q", values).tobytes()
+        if all(type(v) is float for v in values):
+            return FLOAT_TAG + array("d", values).tobytes()
+    return JSON_TAG + orjson.dumps(list(values))
+
+
+def decode_values(blob: bytes) -> List[Any]:
+    tag, data = blob[:1], blob[1:]
+    if tag == INT_TAG:
+        return array("q", data).tolist()
+    if tag == FLOAT_TAG:
+        return array("d", data).tolist()
+    if tag == JSON_TAG:
+        return orjson.loads(data)
+    raise ValueError(f"Unknown type tag of a column chunk: {tag!r}")
+
+
+class ColumnChunk(BaseModel):
+    """Values of the cells of a column of a table whose row indices are in
+    [chunk * CHUNK_SIZE, (chunk + 1) * CHUNK_SIZE). The values are aligned with the row
+    indices stored in the chunk of `INDEX_COLUMN`, a missing chunk of a column means
+    that the cells of the chunk have no value (e.g., a column added to a part of the
+    rows).
+    """
+
+    # fmt: off
+    table = ForeignKeyField(Table, backref="column_chunks", on_delete="CASCADE")
+    column = IntegerField()
+    chunk = IntegerField()
+    values: List[Any] = BlobField(serialize=encode_values, deserialize=decode_values)  # type: ignore
+    # fmt: on
+
+    class Meta:
+        indexes = ((("table", "column", "chunk"), True),)
+
+
+def has_column_chunks(table: Union[Table, int]) -> bool:
+    return (
+        ColumnChunk.select()
+        .where((ColumnChunk.table == table) & (ColumnChunk.column == INDEX_COLUMN))
+        .exists()
+    )
+
+
+def build_column_chunks(table: Union[Table, int]):
+    """(Re-)build the column chunks of a table from its rows"""
+    table_id = table if isinstance(table, int) else table.id
+    with db.atomic():
+        ColumnChunk.delete().where(ColumnChunk.table == table_id).execute()
+
+        chunk_no = None
+        rows: Dict[int, List[Any]] = {}
+        for row in iter_rows(table_id, with_links=False):
+            if row.index // CHUNK_SIZE != chunk_no:
+                if chunk_no is not None:
+                    _save_chunks(table_id, chunk_no, rows, {})
+                chunk_no = row.index // CHUNK_SIZE
+                rows = {}
+            rows[row.index] = row.row
+        if chunk_no is not None:
+            _save_chunks(table_id, chunk_no, rows, {})
+
+
+def _save_chunks(
+    table_id: int,
+    chunk_no: int,
+    rows: Dict[int, List[Any]],
+    chunks: Dict[int, ColumnChunk],
+):
+    """Write the chunks of the given rows (row index => values) whose values differ
+    from the existing chunks (column => chunk) of the same range of row indices.
+    """
+    indices = sorted(rows.keys())
+    ncols = max((len(rows[ri]) for ri in indices), default=0)
+    columns: Dict[int, List[Any]] = {INDEX_COLUMN: indices}
+    for ci in range(ncols):
+        columns[ci] = [rows[ri][ci] if ci < len(rows[ri]) else None for ri in indices]
+    for ci in chunks:
+        if ci not in columns:
+            columns[ci] = [None] * len(indices)
+
+    new_chunks = []
+    for ci, values in columns.items():
+        chunk = chunks.get(ci)
+        if chunk is None:
+            new_chunks.append(
+                ColumnChunk(table=table_id, column=ci, chunk=chunk_no, values=values)
+            )
+        elif chunk.values != values:
+            chunk.values = values
+            chunk.save(only=[ColumnChunk.values])
+    if len(new_chunks) > 0:
+        ColumnChunk.bulk_create(new_chunks, batch_size=200)
+
+
+def iter_column(table: Table, column: int) -> Iterator[Tuple[int, Any]]:
+    """Iterate over (row index, value) of the cells of a column ordered by row index.
+    Only the chunks of the column are read if the table has chunks, otherwise its rows.
+    """
+    if not (_enabled and has_column_chunks(table)):
+        for row in iter_rows(table, with_links=False):
+            yield row.index, row.row[column] if column < len(row.row) else None
+        return
+
+    for indices, values in _iter_column_chunks(table, column):
+        if values is None:
+            values = [None] * len(indices)
+        yield from zip(indices, values)
+
+
+def _iter_column_chunks(
+    table: Table, column: int
+) -> Iterator[Tuple[List[int], Optional[List[Any]]]]:
+    """Iterate over (row indices, values or None if the chunk is missing) of the chunks
+    of a column ordered by chunk
+    """
+    query = (
+        ColumnChunk.select(ColumnChunk.chunk, ColumnChunk.column, ColumnChunk.values)
+        .where(
+            (ColumnChunk.table == table)
+            & (ColumnChunk.column.in_([INDEX_COLUMN, column]))
+        )
+        .order_by(ColumnChunk.chunk, ColumnChunk.column)
+    )
+    indices = None
+    for chunk in query.iterator():
+        if chunk.column == INDEX_COLUMN:
+            if indices is not None:
+                yield indices, None
+            indices = chunk.values
+        else:
+            assert indices is not None
+            yield indices, chunk.values
+            indices = None
+    if indices is not None:
+        yield indices, None
+
+
+def column_fingerprints(
+    table: Table, columns: Optional[Sequence[int]] = None
+) -> List[str]:
+    """Get a hash of the values of each of the given columns of a table (all columns by
+    default), which changes when any value of the column changes. If the table has
+    chunks, only the encoded chunks of the columns are read and they are not decoded,
+    otherwise the rows are read once for all columns.
+    """
+    if columns is None:
+        columns = range(len(table.columns))
+    hashers = {ci: hashlib.blake2b(digest_size=16) for ci in columns}
+    if len(hashers) == 0:
+        return []
+
+    if not (_enabled and has_column_chunks(table)):
+        for batch in chunked(iter_rows(table, with_links=False), 1000):
+            for ci, hasher in hashers.items():
+                hasher.update(
+                    orjson.dumps(
+                        [
+                            (row.index, row.row[ci] if ci < len(row.row) else None)
+                            for row in batch
+                        ]
+                    )
+                )
+        return [hashers[ci].hexdigest() for ci in columns]
+
+    query = (
+        ColumnChunk.select(
+            ColumnChunk.column, ColumnChunk.chunk, ColumnChunk.values.cast("BLOB")
+        )
+        .where(
+            (ColumnChunk.table == table)
+            & (ColumnChunk.column.in_([INDEX_COLUMN, *hashers.keys()]))
+        )
+        .order_by(ColumnChunk.chunk, ColumnChunk.column)
+        .tuples()
+    )
+    index_blob = b""
+    for column, chunk_no, blob in query.iterator():
+        if column == INDEX_COLUMN:
+            index_blob = blob
+        else:
+            for part in (chunk_no.to_bytes(8, "little"), index_blob, blob):
+                hashers[column].update(len(part).to_bytes(8, "little"))
+                hashers[column].update(part)
+    return [hashers[ci].hexdigest() for ci in columns]
+
+
+class ColumnChunkListener(TableRowListener):
+    """Patch the column chunks of a table when the values of its rows change. The chunks
+    of a table are built on the first change after enabling them.
+    """
+
+    def on_rows_saved(
+        self, table_id: int, rows: Sequence[TableRow], fields: Set[str]
+    ) -> None:
+        if "row" not in fields:
+            return
+        if not _enabled:
+            self.invalidate(table_id)
+        elif not has_column_chunks(table_id):
+            build_column_chunks(table_id)
+        else:
+            self.patch(table_id, rows, deleted=False)
+
+    def on_rows_deleted(self, table_id: int, rows: Sequence[TableRow]) -> None:
+        if not _enabled:
+            self.invalidate(table_id)
+        elif has_column_chunks(table_id):
+            self.patch(table_id, rows, deleted=True)
+
+    def patch(self, table_id: int, rows: Sequence[TableRow], deleted: bool):
+        """Update the chunks of the given rows, only the modified chunks are written"""
+        chunk2rows: Dict[int, List[TableRow]] = {}
+        for row in rows:
+            chunk2rows.setdefault(row.index // CHUNK_SIZE, []).append(row)
+
+        for chunk_no, chunk_rows in chunk2rows.items():
+            chunks: Dict[int, ColumnChunk] = {
+                chunk.column: chunk
+                for chunk in ColumnChunk.select().where(
+                    (ColumnChunk.table == table_id) & (ColumnChunk.chunk == chunk_no)
+                )
+            }
+            values: Dict[int, List[Any]] = {}
+            if INDEX_COLUMN in chunks:
+                indices = chunks[INDEX_COLUMN].values
+                values = {ri: [] for ri in indices}
+                ncols = max(chunks.keys()) + 1
+                for ci in range(ncols):
+                    if ci in chunks:
+                        for ri, value in zip(indices, chunks[ci].values):
+                            values[ri].append(value)
+                    else:
+                        for ri in indices:
+                            values[ri].append(None)
+
+            for row in chunk_rows:
+                if deleted:
+                    values.pop(row.index, None)
+                else:
+                    values[row.index] = row.row
+
+            if len(values) == 0:
+                ColumnChunk.delete().where(
+                    (ColumnChunk.table == table_id) & (ColumnChunk.chunk == chunk_no)
+                ).execute()
+            else:
+                _save_chunks(table_id, chunk_no, values, chunks)
+
+    def invalidate(self, table_id: int):
+        ColumnChunk.delete().where(ColumnChunk.table == table_id).execute()
+
+
+row_listeners.append(ColumnChunkListener())
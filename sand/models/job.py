@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import time
+from typing import List, Literal, Optional
+
+from peewee import BooleanField, CharField, FloatField, IntegerField
+from playhouse.sqlite_ext import JSONField
+
+from sand.models.base import BaseModel, db
+
+JobStatus = Literal["pending", "running", "succeeded", "failed", "cancelled"]
+
+
+class JobCancelled(Exception):
+    """Raised in a job when it has been requested to cancel"""
+
+
+class Job(BaseModel):
+    """A long-running task (e.g., saving uploaded tables) executed in the background. Its
+    progress is recorded in the database so that it can be polled by any server process.
+    """
+
+    type = CharField()
+    status: JobStatus = CharField(default="pending")  # type: ignore
+    # parameters of the job, depending on its type
+    params: dict = JSONField(default=dict)  # type: ignore
+    # total number of rows to process, 0 if not known yet
+    n_rows = IntegerField(default=0)
+    n_parsed = IntegerField(default=0)
+    n_inserted = IntegerField(default=0)
+    errors: List[str] = JSONField(default=list)  # type: ignore
+    # result of a succeeded job, depending on its type
+    result: Optional[dict] = JSONField(null=True)  # type: ignore
+    cancel_requested = BooleanField(default=False)
+    created_at = FloatField(default=time.time)
+    started_at = FloatField(null=True)
+    finished_at = FloatField(null=True)
+
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self):
+        if self.started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "id": self.id,
+            "type": self.type,
+            "status": self.status,
+            "n_rows": self.n_rows,
+            "n_parsed": self.n_parsed,
+            "n_inserted": self.n_inserted,
+            # number of inserted rows per second
+            "throughput": self.n_inserted / elapsed if elapsed > 0 else 0.0,
+            "errors": self.errors,
+            "result": self.result,
+            "cancel_requested": self.cancel_requested,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def update_job_progress(job: Job, **fields):
+    """Record the progress of a running job. Raises `JobCancelled` if the job has been
+    requested to cancel, so it must be called where the job can stop, and within the
+    transaction of the work being recorded so that the work is rolled back as well.
+    """
+    if Job.select(Job.cancel_requested).where(Job.id == job.id).scalar():
+        raise JobCancelled()
+    for name, value in fields.items():
+        setattr(job, name, value)
+    if len(fields) > 0:
+        job.save(only=[getattr(Job, name) for name in fields])
+
+
+def fail_interrupted_jobs() -> int:
+    """Mark jobs that were pending or running when the server stopped as failed. Returns
+    the number of these jobs.
+    """
+    if not Job.table_exists():
+        # the database is created before jobs were added
+        return 0
+    with db.atomic():
+        return (
+            Job.update(
+                status="failed",
+                errors=["The job was interrupted by a restart of the server"],
+                finished_at=time.time(),
+            )
+            .where(Job.status.in_(["pending", "running"]))
+            .execute()
+        )
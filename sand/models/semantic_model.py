@@ -1,18 +1,21 @@
+from typing import Any, Dict, List, Optional, Union
+
 import orjson
 import sm.outputs.semantic_model as O
-from peewee import CharField, ForeignKeyField, TextField, IntegerField
+from peewee import BooleanField, CharField, ForeignKeyField, TextField, IntegerField
 from playhouse.shortcuts import model_to_dict
-from sand.models.base import BaseModel, BlobField
+from sand.models.base import BaseModel, BlobField, db
+from sand.models.codec import decode, encode
 from sand.models.project import Project
 from sand.models.table import Table
 
 
 def ser_sm(pyvalue: O.SemanticModel):
-    return orjson.dumps(pyvalue.to_dict())
+    return encode(pyvalue.to_dict())
 
 
 def deser_sm(dbvalue: bytes):
-    return O.SemanticModel.from_dict(orjson.loads(dbvalue))
+    return O.SemanticModel.from_dict(decode(dbvalue))
 
 
 class SemanticModel(BaseModel):
@@ -26,3 +29,184 @@ class SemanticModel(BaseModel):
 
     class Meta:
         indexes = ((("table", "name"), True),)
+
+    def save(self, force_insert=False, only=None):
+        with db.atomic():
+            out = super().save(force_insert=force_insert, only=only)
+            if only is None or any(
+                (f if isinstance(f, str) else f.name) == "data" for f in only
+            ):
+                save_version(self)
+        return out
+
+
+# a full snapshot is stored every SNAPSHOT_INTERVAL versions of a model, the versions in
+# between are stored as deltas from their previous version
+SNAPSHOT_INTERVAL = 20
+
+
+class SemanticModelVersion(BaseModel):
+    """History of a semantic model. `SemanticModel.data` is always the current version,
+    previous versions are reconstructed from the latest snapshot before them and the
+    deltas after it (see `reconstruct_version`).
+    """
+
+    semantic_model = ForeignKeyField(
+        SemanticModel, backref="versions", on_delete="CASCADE"
+    )
+    version = IntegerField()
+    # whether data is the full model (`O.SemanticModel.to_dict`) or a delta (`diff_sm_dict`)
+    is_snapshot = BooleanField()
+    data: dict = BlobField(serialize=encode, deserialize=decode)  # type: ignore
+
+    class Meta:
+        indexes = ((("semantic_model", "version"), True),)
+
+
+def diff_sm_dict(prev: dict, curr: dict) -> dict:
+    """Compute the delta between two versions of a semantic model (as dictionaries).
+
+    Nodes and edges of the delta are in the same order as in `curr`: an unchanged
+    node/edge is stored as its position in `prev`, and an added or updated node/edge is
+    stored as is. Nodes and edges of `prev` that are not referenced are removed.
+    """
+    delta = {k: v for k, v in curr.items() if k not in ("nodes", "edges")}
+    for key in ("nodes", "edges"):
+        positions: Dict[bytes, List[int]] = {}
+        for i, item in enumerate(prev[key]):
+            positions.setdefault(_item_key(item), []).append(i)
+        items: List[Any] = []
+        for item in curr[key]:
+            lst = positions.get(_item_key(item))
+            items.append(lst.pop(0) if lst else item)
+        delta[key] = items
+    return delta
+
+
+def patch_sm_dict(prev: dict, delta: dict) -> dict:
+    """Apply a delta computed by `diff_sm_dict` to the previous version"""
+    curr = {k: v for k, v in delta.items() if k not in ("nodes", "edges")}
+    for key in ("nodes", "edges"):
+        curr[key] = [
+            prev[key][item] if isinstance(item, int) else item for item in delta[key]
+        ]
+    return curr
+
+
+def _item_key(item: dict) -> bytes:
+    return orjson.dumps(item, option=orjson.OPT_SORT_KEYS)
+
+
+def save_version(sm: SemanticModel):
+    """Record the current data of the semantic model as its version `sm.version`.
+    Recorded versions that are not older than `sm.version` are replaced.
+    """
+    curr = sm.data.to_dict()
+    with db.atomic():
+        SemanticModelVersion.delete().where(
+            (SemanticModelVersion.semantic_model == sm.id)
+            & (SemanticModelVersion.version >= sm.version)
+        ).execute()
+        records = list(
+            SemanticModelVersion.select(
+                SemanticModelVersion.version, SemanticModelVersion.is_snapshot
+            )
+            .where(SemanticModelVersion.semantic_model == sm.id)
+            .order_by(SemanticModelVersion.version.desc())
+            .limit(SNAPSHOT_INTERVAL)
+        )
+
+        is_snapshot = len(records) == 0 or not any(r.is_snapshot for r in records)
+        data = curr
+        if not is_snapshot:
+            delta = diff_sm_dict(reconstruct_version(sm.id, records[0].version), curr)
+            # a large delta (e.g., most nodes are updated) is not worth it
+            if len(orjson.dumps(delta)) < len(orjson.dumps(curr)) // 2:
+                data = delta
+            else:
+                is_snapshot = True
+
+        SemanticModelVersion.create(
+            semantic_model=sm.id,
+            version=sm.version,
+            is_snapshot=is_snapshot,
+            data=data,
+        )
+
+
+def reconstruct_version(sm_id: int, version: int) -> dict:
+    """Reconstruct a version of a semantic model as a dictionary (see
+    `O.SemanticModel.from_dict`). Raises `SemanticModelVersion.DoesNotExist` if the
+    version is not recorded.
+    """
+    snapshot = (
+        SemanticModelVersion.select(SemanticModelVersion.version)
+        .where(
+            (SemanticModelVersion.semantic_model == sm_id)
+            & (SemanticModelVersion.version <= version)
+            & SemanticModelVersion.is_snapshot
+        )
+        .order_by(SemanticModelVersion.version.desc())
+        .get()
+    )
+    records = list(
+        SemanticModelVersion.select(
+            SemanticModelVersion.version,
+            SemanticModelVersion.is_snapshot,
+            SemanticModelVersion.data,
+        )
+        .where(
+            (SemanticModelVersion.semantic_model == sm_id)
+            & (SemanticModelVersion.version >= snapshot.version)
+            & (SemanticModelVersion.version <= version)
+        )
+        .order_by(SemanticModelVersion.version)
+    )
+    if records[-1].version != version:
+        raise SemanticModelVersion.DoesNotExist(
+            f"Version {version} of semantic model {sm_id} is not recorded"
+        )
+
+    data = records[0].data
+    for record in records[1:]:
+        data = record.data if record.is_snapshot else patch_sm_dict(data, record.data)
+    return data
+
+
+def get_semantic_models(
+    table: Union[Table, int], with_data: bool = True, limit: Optional[int] = None
+) -> List[SemanticModel]:
+    """Get the current version of the semantic models of a table in their creation order.
+
+    A model is updated in place (its version is increased), so a row is the current
+    version of the model with its name and there is no need to aggregate over versions.
+
+    Args:
+        table: the table or its id
+        with_data: whether to fetch and deserialize `data`, it is None when skipped
+        limit: maximum number of models to return
+    """
+    fields = [
+        SemanticModel.id,
+        SemanticModel.table,
+        SemanticModel.name,
+        SemanticModel.description,
+        SemanticModel.version,
+    ]
+    if with_data:
+        fields.append(SemanticModel.data)
+    query = (
+        SemanticModel.select(*fields)
+        .where(SemanticModel.table == table)
+        .order_by(SemanticModel.id)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return list(query)
+
+
+def get_semantic_model(table: Union[Table, int], name: str) -> Optional[SemanticModel]:
+    """Get the current version of a semantic model of a table by its name"""
+    return SemanticModel.get_or_none(
+        (SemanticModel.table == table) & (SemanticModel.name == name)
+    )
@@ -1,19 +1,40 @@
 from __future__ import annotations
+import random
 from dataclasses import asdict, dataclass
-from typing import Optional, NamedTuple, List, Dict, Tuple, Union
+from itertools import groupby
+from typing import (
+    Literal,
+    Optional,
+    NamedTuple,
+    Iterable,
+    Iterator,
+    List,
+    Dict,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 from gena.custom_fields import (
     ListDataClassField,
     DataClassField,
-    Dict2ListDataClassField,
 )
 from rsoup.core import ContentHierarchy
 
-import orjson
-from peewee import CharField, ForeignKeyField, CompositeKey, TextField, IntegerField
+from peewee import (
+    CharField,
+    ForeignKeyField,
+    CompositeKey,
+    TextField,
+    IntegerField,
+    chunked,
+    fn,
+)
 from playhouse.shortcuts import model_to_dict
 from playhouse.sqlite_ext import JSONField
 
-from sand.models.base import BaseModel
+from sand.models.base import BaseModel, db
+from sand.models.codec import EncodedDict2ListDataClassField, EncodedJSONField
 from sand.models.entity import Value
 from sand.models.project import Project
 
@@ -79,17 +100,38 @@ class Table(BaseModel):
         }
 
 
+# name of the fields of a row that storages derived from the rows may depend on
+ROW_FIELDS = frozenset(["row", "links"])
+
+
 class TableRow(BaseModel):
     # fmt: off
     table = ForeignKeyField(Table, backref="rows", on_delete="CASCADE")
     index = IntegerField()  # type: ignore
-    row: List[Union[str, float]] = JSONField(json_dumps=orjson.dumps, json_loads=orjson.loads)  # type: ignore
-    links: Dict[str, List[Link]] = Dict2ListDataClassField(Link)  # type: ignore
+    row: List[Union[str, float]] = EncodedJSONField()  # type: ignore
+    links: Dict[str, List[Link]] = EncodedDict2ListDataClassField(Link)  # type: ignore
     # fmt: on
 
     class Meta:
         indexes = ((("table", "index"), True),)
 
+    def save(self, force_insert=False, only=None):
+        with db.atomic():
+            out = super().save(force_insert=force_insert, only=only)
+            if only is None:
+                fields = ROW_FIELDS
+            else:
+                fields = ROW_FIELDS.intersection(
+                    f if isinstance(f, str) else f.name for f in only
+                )
+            notify_rows_saved([self], fields)
+        return out
+
+    def delete_instance(self, *args, **kwargs):
+        with db.atomic():
+            notify_rows_deleted([self])
+            return super().delete_instance(*args, **kwargs)
+
     def to_dict(self):
         dlinks = {}
         if self.links is not None:
@@ -110,3 +152,185 @@ class TableRow(BaseModel):
             "row": self.row,
             "links": dlinks,
         }
+
+
+def bulk_insert_rows(rows: List[TableRow], batch_size: int = 200):
+    """Insert new rows in batches, set their ids, and notify the listeners"""
+    with db.atomic():
+        TableRow.bulk_create(rows, batch_size=batch_size)
+        # sqlite does not return ids of the inserted records so we query them back
+        for table_id, group in groupby(rows, key=lambda row: row.table_id):
+            index2row = {row.index: row for row in group}
+            indices = list(index2row.keys())
+            for i in range(0, len(indices), 500):
+                query = TableRow.select(TableRow.id, TableRow.index).where(
+                    (TableRow.table == table_id)
+                    & (TableRow.index.in_(indices[i : i + 500]))
+                )
+                for r in query:
+                    index2row[r.index].id = r.id
+        notify_rows_saved(rows)
+
+
+def iter_rows(
+    table: Union[Table, int],
+    columns: Optional[Sequence[int]] = None,
+    with_links: bool = True,
+    start: int = 0,
+    limit: Optional[int] = None,
+    batch_size: int = 1000,
+) -> Iterator[TableRow]:
+    """Stream rows of a table ordered by their index. Rows are fetched in batches using
+    keyset pagination on (table, index) so only one batch is in memory at a time.
+
+    Args:
+        table: the table or its id
+        columns: if provided, `row.row` contains only values of these columns (in the
+            given order) and the rows must not be saved. An empty list skips the values.
+        with_links: whether to fetch the links, `row.links` is None when skipped
+        start: the smallest row index to return
+        limit: maximum number of rows to return
+        batch_size: number of rows fetched per query
+    """
+    fields = [TableRow.id, TableRow.table, TableRow.index]
+    if columns is None or len(columns) > 0:
+        fields.append(TableRow.row)
+    if with_links:
+        fields.append(TableRow.links)
+
+    last_index = start - 1
+    remaining = limit
+    while remaining is None or remaining > 0:
+        n = batch_size if remaining is None else min(batch_size, remaining)
+        batch: List[TableRow] = list(
+            TableRow.select(*fields)
+            .where((TableRow.table == table) & (TableRow.index > last_index))
+            .order_by(TableRow.index)
+            .limit(n)
+        )
+        for row in batch:
+            if columns is not None:
+                row.row = [row.row[ci] for ci in columns] if len(columns) > 0 else []
+            yield row
+
+        if remaining is not None:
+            remaining -= len(batch)
+        if len(batch) < n:
+            break
+        last_index = batch[-1].index
+
+
+def sample_rows(
+    table: Union[Table, int],
+    n: int,
+    method: Literal["random", "stratified"] = "random",
+    seed: Optional[int] = None,
+    with_links: bool = True,
+) -> Iterator[TableRow]:
+    """Sample about n rows of a table without scanning it, the sampled rows are ordered by
+    their index. Row indices are drawn from [0, the largest index] and fetched with the
+    (table, index) index, so fewer rows are returned if some indices have been deleted.
+
+    Args:
+        table: the table or its id
+        n: number of rows to sample
+        method: `random` draws the indices uniformly, `stratified` divides the indices
+            into n equal strata and draws an index from each stratum, so the sample
+            spreads over the whole table
+        seed: seed of the random generator, the same seed samples the same rows
+        with_links: whether to fetch the links, `row.links` is None when skipped
+    """
+    max_index = (
+        TableRow.select(fn.MAX(TableRow.index)).where(TableRow.table == table).scalar()
+    )
+    if max_index is None:
+        return
+    size = max_index + 1
+    if n >= size:
+        yield from iter_rows(table, with_links=with_links)
+        return
+
+    rng = random.Random(seed)
+    if method == "random":
+        indices = sorted(rng.sample(range(size), n))
+    elif method == "stratified":
+        indices = [rng.randrange(k * size // n, (k + 1) * size // n) for k in range(n)]
+    else:
+        raise ValueError(f"Unknown sampling method {method}")
+
+    fields = [TableRow.id, TableRow.table, TableRow.index, TableRow.row]
+    if with_links:
+        fields.append(TableRow.links)
+    for batch in chunked(indices, 500):
+        yield from (
+            TableRow.select(*fields)
+            .where((TableRow.table == table) & (TableRow.index.in_(batch)))
+            .order_by(TableRow.index)
+        )
+
+
+class TableRows(Iterable[TableRow]):
+    """Rows of a table that are streamed (see `iter_rows`) every time they are iterated,
+    so they can be passed to functions expecting a collection of rows without loading
+    all of them into memory.
+    """
+
+    def __init__(self, table: Table, **kwargs):
+        self.table = table
+        self.kwargs = kwargs
+
+    def __iter__(self) -> Iterator[TableRow]:
+        return iter_rows(self.table, **self.kwargs)
+
+    def __len__(self):
+        size = max(self.table.size - self.kwargs.get("start", 0), 0)
+        if self.kwargs.get("limit") is not None:
+            return min(size, self.kwargs["limit"])
+        return size
+
+
+class TableRowListener:
+    """A storage derived from the rows of tables (e.g., the full-text index of cells)
+    that needs to be notified when the rows are modified to stay in sync with them.
+
+    Listeners are called within the transaction that modifies the rows.
+    """
+
+    def on_rows_saved(
+        self, table_id: int, rows: Sequence[TableRow], fields: Set[str]
+    ) -> None:
+        """Called after rows of a table are inserted or updated.
+
+        Args:
+            table_id: id of the table
+            rows: the inserted or updated rows
+            fields: the fields (subset of `ROW_FIELDS`) that may have been changed
+        """
+        pass
+
+    def on_rows_deleted(self, table_id: int, rows: Sequence[TableRow]) -> None:
+        """Called before rows of a table are deleted"""
+        pass
+
+
+row_listeners: List[TableRowListener] = []
+
+
+def notify_rows_saved(rows: Sequence[TableRow], fields: Set[str] = ROW_FIELDS):
+    """Notify the listeners that the rows have been inserted or updated. Functions that
+    bypass `TableRow.save` such as `TableRow.bulk_create` must call this function.
+    """
+    if len(fields) == 0:
+        return
+    for table_id, group in groupby(rows, key=lambda row: row.table_id):
+        group = list(group)
+        for listener in row_listeners:
+            listener.on_rows_saved(table_id, group, fields)
+
+
+def notify_rows_deleted(rows: Sequence[TableRow]):
+    """Notify the listeners that the rows are going to be deleted"""
+    for table_id, group in groupby(rows, key=lambda row: row.table_id):
+        group = list(group)
+        for listener in row_listeners:
+            listener.on_rows_deleted(table_id, group)
@@ -1,16 +1,22 @@
 from __future__ import annotations
-from typing import Literal, Union, List
+import time
+from typing import Dict, Literal, Union, List
 from peewee import (
     CharField,
+    FloatField,
     ForeignKeyField,
     TextField,
     IntegerField,
     BooleanField,
+    Value,
+    chunked,
+    fn,
 )
 from playhouse.sqlite_ext import JSONField
 
-from sand.models.base import BaseModel
-from sand.models.table import Table
+from sand.models.base import BaseModel, BlobField, db
+from sand.models.codec import decode, encode
+from sand.models.table import Table, TableRow, notify_rows_saved
 
 
 class Transformation(BaseModel):
@@ -43,3 +49,240 @@ class Transformation(BaseModel):
             "order": self.order,
             "insert_after": self.insert_after,
         }
+
+
+# maximum total size in bytes of the cached outputs of transformations, the least
+# recently used outputs are evicted when it is exceeded
+_cache_budget = 256 * 1024 * 1024
+
+
+def set_cache_budget(n_bytes: int):
+    """Set the maximum total size in bytes of the cached outputs of transformations"""
+    global _cache_budget
+    _cache_budget = n_bytes
+
+
+def get_cache_budget() -> int:
+    return _cache_budget
+
+
+class TransformationCache(BaseModel):
+    """Output of a transformation of a pipeline over a chunk of rows of a table, so
+    that a pipeline can be re-executed without re-running the transformations whose
+    code and inputs have not changed. The key is a hash of them (see
+    `sand.controllers.transformation.get_step_keys`). An output is stored as one record
+    per chunk of rows so that it is written and read a chunk at a time, and it is
+    cached only when the records of all its chunks are stored.
+    """
+
+    table = ForeignKeyField(Table, backref="transformation_caches", on_delete="CASCADE")
+    key = CharField()
+    # indices of the first and last rows of the chunk
+    first_index = IntegerField()
+    last_index = IntegerField()
+    # number of chunks of the output
+    n_chunks = IntegerField()
+    # number of cells of the chunk that have errors
+    n_errors = IntegerField()
+    # number of bytes of data
+    size = IntegerField()
+    last_used = FloatField()
+    # {"rows": [[row index, output values], ...], "filtered": [row index, ...]}
+    data: dict = BlobField(serialize=encode, deserialize=decode)  # type: ignore
+
+    class Meta:
+        indexes = ((("key", "first_index"), True),)
+
+
+def get_cached_outputs(keys: List[str]) -> Dict[str, int]:
+    """Get the keys whose outputs are cached (the records of all their chunks are
+    stored) with their number of errors, and mark them as recently used. The outputs
+    are read a chunk at a time with `get_cached_chunks`.
+    """
+    n_errors = {}
+    for batch in chunked(keys, 500):
+        query = (
+            TransformationCache.select(
+                TransformationCache.key,
+                fn.COUNT(TransformationCache.id).alias("n_records"),
+                fn.MAX(TransformationCache.n_chunks).alias("n_chunks"),
+                fn.SUM(TransformationCache.n_errors).alias("n_errors"),
+            )
+            .where(TransformationCache.key.in_(batch))
+            .group_by(TransformationCache.key)
+        )
+        for record in query:
+            if record.n_records == record.n_chunks:
+                n_errors[record.key] = record.n_errors
+    for batch in chunked(list(n_errors.keys()), 500):
+        TransformationCache.update(last_used=time.time()).where(
+            TransformationCache.key.in_(batch)
+        ).execute()
+    return n_errors
+
+
+def get_cached_chunks(
+    keys: List[str], first_index: int, last_index: int
+) -> Dict[str, dict]:
+    """Get the cached outputs of the given keys for the rows whose indices are between
+    the first and last indices (inclusive): {key: {"rows": {row index: output values},
+    "filtered": set of row indices}}
+    """
+    outputs = {key: {"rows": {}, "filtered": set()} for key in keys}
+    for batch in chunked(keys, 500):
+        query = TransformationCache.select(
+            TransformationCache.key, TransformationCache.data
+        ).where(
+            TransformationCache.key.in_(batch)
+            & (TransformationCache.first_index <= last_index)
+            & (TransformationCache.last_index >= first_index)
+        )
+        for record in query:
+            output = outputs[record.key]
+            for index, values in record.data["rows"]:
+                if first_index <= index <= last_index:
+                    output["rows"][index] = values
+            output["filtered"].update(
+                index
+                for index in record.data["filtered"]
+                if first_index <= index <= last_index
+            )
+    return outputs
+
+
+def cache_chunk(
+    table_id: int,
+    key: str,
+    first_index: int,
+    last_index: int,
+    n_chunks: int,
+    n_errors: int,
+    data: dict,
+) -> int:
+    """Store the output of a transformation over a chunk of rows (see
+    `TransformationCache`). Returns the number of bytes of the stored data.
+    """
+    blob = encode(data)
+    TransformationCache.insert(
+        table=table_id,
+        key=key,
+        first_index=first_index,
+        last_index=last_index,
+        n_chunks=n_chunks,
+        n_errors=n_errors,
+        size=len(blob),
+        last_used=time.time(),
+        data=Value(blob),  # already encoded
+    ).on_conflict_replace().execute()
+    return len(blob)
+
+
+def uncache_outputs(keys: List[str]):
+    """Remove the cached outputs of the given keys"""
+    for batch in chunked(keys, 500):
+        TransformationCache.delete().where(TransformationCache.key.in_(batch)).execute()
+
+
+def evict_cached_outputs():
+    """Evict the least recently used outputs (all their chunks) that do not fit in the
+    budget
+    """
+    total = TransformationCache.select(fn.SUM(TransformationCache.size)).scalar()
+    if total is None or total <= _cache_budget:
+        return
+    evicted = []
+    query = (
+        TransformationCache.select(
+            TransformationCache.key,
+            fn.SUM(TransformationCache.size).alias("size"),
+        )
+        .group_by(TransformationCache.key)
+        .order_by(fn.MAX(TransformationCache.last_used), fn.MIN(TransformationCache.id))
+    )
+    for record in query:
+        if total <= _cache_budget:
+            break
+        evicted.append(record.key)
+        total -= record.size
+    uncache_outputs(evicted)
+
+
+class TransformationUndo(BaseModel):
+    """Values of the cells of a chunk of rows of a table before they are overwritten by
+    an execution of the transformations of the table, which writes each chunk in its
+    own transaction. The rows are restored from these records if the execution fails
+    (see `restore_undo`), and the records are removed when it succeeds. The record
+    whose `first_index` is -1 has the columns of the table before the execution.
+    """
+
+    table = ForeignKeyField(Table, backref="transformation_undos", on_delete="CASCADE")
+    # index of the first row of the chunk, -1 for the columns of the table
+    first_index = IntegerField()
+    # {"columns": [column indices], "rows": [[row index, row length, values], ...]} or
+    # {"table_columns": [column names]}
+    data: dict = BlobField(serialize=encode, deserialize=decode)  # type: ignore
+
+    class Meta:
+        indexes = ((("table", "first_index"), True),)
+
+
+def restore_undo(table_id: int):
+    """Restore the rows and the columns of a table from its undo records (see
+    `TransformationUndo`) and remove the records. A chunk of rows is restored per
+    transaction, and the columns last, so it can be resumed if it is interrupted.
+    """
+    query = (
+        TransformationUndo.select()
+        .where(
+            (TransformationUndo.table == table_id)
+            & (TransformationUndo.first_index >= 0)
+        )
+        .order_by(TransformationUndo.first_index)
+    )
+    for undo in query.iterator():
+        index2values = {index: (n, values) for index, n, values in undo.data["rows"]}
+        with db.atomic():
+            rows = list(
+                TableRow.select(
+                    TableRow.id, TableRow.table, TableRow.index, TableRow.row
+                ).where(
+                    (TableRow.table == table_id)
+                    & (TableRow.index.in_(list(index2values.keys())))
+                )
+            )
+            for row in rows:
+                n, values = index2values[row.index]
+                row.row = row.row[:n]
+                for ci, value in zip(undo.data["columns"], values):
+                    if ci < n:
+                        row.row[ci] = value
+            TableRow.bulk_update(rows, fields=[TableRow.row], batch_size=200)
+            notify_rows_saved(rows, {"row"})
+            undo.delete_instance()
+
+    with db.atomic():
+        undo = TransformationUndo.get_or_none(
+            (TransformationUndo.table == table_id)
+            & (TransformationUndo.first_index == -1)
+        )
+        if undo is not None:
+            Table.update(columns=undo.data["table_columns"]).where(
+                Table.id == table_id
+            ).execute()
+            undo.delete_instance()
+
+
+def restore_interrupted_executions() -> int:
+    """Restore the tables whose transformations were being executed when the server
+    stopped. Returns the number of these tables.
+    """
+    if not TransformationUndo.table_exists():
+        # the database is created before executions were undoable
+        return 0
+    table_ids = [
+        undo.table_id
+        for undo in TransformationUndo.select(TransformationUndo.table).distinct()
+    ]
+    for table_id in table_ids:
+        restore_undo(table_id)
+    return len(table_ids)
@@ -1,3 +1,17 @@
+import datetime
+import io
+import os
+
+import orjson
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from sand.controllers.helpers import upload
+from sand.models import Job, SemanticModelVersion, Table
+from sand.models.job import fail_interrupted_jobs
+from sand.models.table import iter_rows
+
+
 def test_api_get_entity(client):
     resp = client.get("/api/entities/Q30")
     assert resp.status_code == 200
@@ -88,3 +102,269 @@ def test_api_create_table(client, example_db):
     )
 
     assert resp.status_code == 200
+
+
+def test_api_semantic_model_versions(client, example_db):
+    sm = client.get("/api/semanticmodel?limit=1000&offset=0&table=1").json["items"][0]
+    v0 = sm["data"]
+    assert sm["version"] == 3
+
+    for version in range(4, 32):
+        data = {"nodes": v0["nodes"], "edges": v0["edges"][: version % 7]}
+        resp = client.put(
+            f"/api/semanticmodel/{sm['id']}", json={"version": version, "data": data}
+        )
+        assert resp.status_code == 200
+
+    resp = client.get(f"/api/semanticmodel/{sm['id']}/versions")
+    assert resp.json["versions"] == list(range(3, 32))
+    assert [
+        r.version
+        for r in SemanticModelVersion.select().where(SemanticModelVersion.is_snapshot)
+    ] == [3, 24]
+
+    for version in [3, 4, 9, 23, 24, 31]:
+        resp = client.get(f"/api/semanticmodel/{sm['id']}/versions/{version}")
+        assert resp.status_code == 200
+        data = resp.json["data"]
+        assert data["nodes"] == v0["nodes"]
+        assert data["edges"] == (
+            v0["edges"] if version == 3 else v0["edges"][: version % 7]
+        )
+
+    resp = client.get(f"/api/semanticmodel/{sm['id']}/versions/2")
+    assert resp.status_code == 404
+
+
+def test_api_upload_csv(client, example_db, monkeypatch):
+    monkeypatch.setattr(upload, "UPLOAD_BATCH_SIZE", 7)
+    n_rows = 250
+    content = "id\tname\n" + "".join(
+        f'{i}\t"row\n{i}"\textra\n' if i % 50 == 0 else f"{i}\tr{i}\n"
+        for i in range(n_rows)
+    )
+
+    def post(**form):
+        return client.post(
+            "/api/project/1/upload",
+            data={"file": (io.BytesIO(content.encode()), "big.tsv"), **form},
+            content_type="multipart/form-data",
+        )
+
+    resp = post()
+    table = resp.json["tables"][0]["tables"][0]
+    assert table["header"] == ["id", "name", ""]
+    assert table["size"] == n_rows
+    assert len(table["rows"]) == upload.PREVIEW_SIZE
+    assert table["rows"][:2] == [["0", "row\n0", "extra"], ["1", "r1", ""]]
+
+    resp = post(selected_tables="[0]")
+    table = Table.get_by_id(resp.json["table_ids"][0])
+    assert table.size == n_rows
+    rows = list(iter_rows(table))
+    assert [row.index for row in rows] == list(range(n_rows))
+    assert rows[50].row == ["50", "row\n50", "extra"]
+    assert rows[-1].row == [str(n_rows - 1), f"r{n_rows - 1}", ""]
+
+    # characters split between chunks are decoded
+    file = FileStorage(io.BytesIO("Lào Cai\r\nắ".encode()))
+    assert list(upload.iter_text_lines(file, chunk_size=1)) == ["Lào Cai\r\n", "ắ"]
+
+
+def test_api_upload_job(client, example_db, monkeypatch):
+    monkeypatch.setattr(upload, "UPLOAD_BATCH_SIZE", 7)
+    n_rows = 30
+    content = "id,name\n" + "".join(f"{i},r{i}\n" for i in range(n_rows))
+
+    def post():
+        return client.post(
+            "/api/project/1/upload",
+            data={
+                "file": (io.BytesIO(content.encode()), "job.csv"),
+                "selected_tables": "[0]",
+                "background": "true",
+            },
+            content_type="multipart/form-data",
+        )
+
+    resp = post()
+    job = client.get(f"/api/jobs/{resp.json['job_id']}").json
+    assert job["status"] == "succeeded"
+    assert (job["n_rows"], job["n_parsed"], job["n_inserted"]) == (30, 30, 30)
+    assert not os.path.exists(Job.get_by_id(job["id"]).params["dir"])
+    table = Table.get_by_id(job["result"]["table_ids"][0])
+    assert [row.row for row in iter_rows(table)][-1] == ["29", "r29"]
+
+    # a finished job can not be cancelled
+    assert client.post(f"/api/jobs/{job['id']}/cancel").status_code == 400
+    assert client.get("/api/jobs/1000").status_code == 404
+
+    # cancel the job after the first batch of rows, its table is deleted
+    update_job_progress = upload.update_job_progress
+
+    def cancel_after_first_batch(job, **fields):
+        update_job_progress(job, **fields)
+        if job.n_inserted > 0:
+            Job.update(cancel_requested=True).where(Job.id == job.id).execute()
+
+    monkeypatch.setattr(upload, "update_job_progress", cancel_after_first_batch)
+    n_tables = Table.select().count()
+    job = client.get(f"/api/jobs/{post().json['job_id']}").json
+    assert job["status"] == "cancelled"
+    assert job["cancel_requested"] and job["n_inserted"] == 7
+    assert Table.select().count() == n_tables
+
+    # jobs of a previous run of the server
+    pending_job = Job.create(type="upload", params={})
+    resp = client.post(f"/api/jobs/{pending_job.id}/cancel")
+    assert resp.json["status"] == "pending" and resp.json["cancel_requested"]
+    assert fail_interrupted_jobs() == 1
+    assert Job.get_by_id(pending_job.id).status == "failed"
+
+
+def test_api_upload_arrow(client, example_db, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    monkeypatch.setattr(upload, "UPLOAD_BATCH_SIZE", 7)
+    n_rows = 30
+    data = pa.table(
+        {
+            "id": pa.array(range(n_rows), pa.int64()),
+            "height": pa.array([i / 2 if i % 3 else None for i in range(n_rows)]),
+            "name": pa.array([f"r{i}" for i in range(n_rows)]).dictionary_encode(),
+            "date": pa.array([datetime.date(2020, 1, 1 + i) for i in range(n_rows)]),
+            "tags": pa.array([["a", str(i)] for i in range(n_rows)]),
+        }
+    )
+    expected_rows = [
+        [i, i / 2 if i % 3 else None, f"r{i}", f"2020-01-{1 + i:02d}", f'["a","{i}"]']
+        for i in range(n_rows)
+    ]
+
+    parquet_file = io.BytesIO()
+    pq.write_table(data, parquet_file, row_group_size=10)
+    arrow_file = io.BytesIO()
+    with pa.ipc.new_file(arrow_file, data.schema) as writer:
+        writer.write_table(data, max_chunksize=8)
+    arrow_stream = io.BytesIO()
+    with pa.ipc.new_stream(arrow_stream, data.schema) as writer:
+        writer.write_table(data, max_chunksize=8)
+
+    def post(content: bytes, filename: str, **form):
+        return client.post(
+            "/api/project/1/upload",
+            data={"file": (io.BytesIO(content), filename), **form},
+            content_type="multipart/form-data",
+        )
+
+    for content, filename in [
+        (parquet_file.getvalue(), "t.parquet"),
+        (arrow_file.getvalue(), "t.arrow"),
+        (arrow_stream.getvalue(), "t.feather"),
+    ]:
+        table = post(content, filename).json["tables"][0]["tables"][0]
+        assert table["header"] == ["id", "height", "name", "date", "tags"]
+        assert table["size"] == n_rows
+        assert table["rows"] == expected_rows
+
+        resp = post(content, filename, selected_tables="[0]")
+        rows = list(iter_rows(resp.json["table_ids"][0]))
+        assert [row.row for row in rows] == expected_rows
+
+    # read a subset of columns and row groups
+    opts = {"format": "parquet", "columns": ["name", "id"], "row_groups": [0, 2]}
+    resp = post(
+        parquet_file.getvalue(),
+        "t.parquet",
+        parser_opts=orjson.dumps({"file": opts}).decode(),
+    )
+    table = resp.json["tables"][0]["tables"][0]
+    assert table["header"] == ["name", "id"]
+    assert table["rows"] == [
+        [f"r{i}", i] for i in list(range(10)) + list(range(20, 30))
+    ]
+
+    opts = {"format": "parquet", "columns": ["unknown"]}
+    resp = post(
+        parquet_file.getvalue(),
+        "t.parquet",
+        parser_opts=orjson.dumps({"file": opts}).decode(),
+    )
+    assert resp.status_code == 400
+
+
+def test_api_upload_arrow_without_pyarrow(client, example_db, monkeypatch):
+    monkeypatch.setattr(upload, "has_pyarrow", lambda: False)
+    n_tables = Table.select().count()
+    for filename, form in [
+        ("t.parquet", {}),
+        ("t.feather", {"selected_tables": "[0]", "background": "true"}),
+        (
+            "t.arrow",
+            {"parser_opts": orjson.dumps({"file": {"format": "arrow"}}).decode()},
+        ),
+    ]:
+        resp = client.post(
+            "/api/project/1/upload",
+            data={"file": (io.BytesIO(b"PAR1"), filename), **form},
+            content_type="multipart/form-data",
+        )
+        assert resp.status_code == 400
+        assert "`arrow` extra" in resp.get_data(as_text=True)
+    assert Table.select().count() == n_tables
+
+
+def test_api_upload_json(client, example_db, monkeypatch):
+    monkeypatch.setattr(upload, "UPLOAD_BATCH_SIZE", 7)
+    n_rows = 30
+    records = [
+        {"id": i, "name": f'r{i}\n"{i}"', **({"extra": 1.5} if i == 20 else {})}
+        for i in range(n_rows)
+    ]
+    expected_rows = [
+        [i, f'r{i}\n"{i}"', 1.5 if i == 20 else None] for i in range(n_rows)
+    ]
+
+    def post(content: bytes, filename: str, **form):
+        return client.post(
+            "/api/project/1/upload",
+            data={"file": (io.BytesIO(content), filename), **form},
+            content_type="multipart/form-data",
+        )
+
+    for content, filename in [
+        (orjson.dumps(records, option=orjson.OPT_INDENT_2), "t.json"),
+        (b"\n".join(orjson.dumps(r) for r in records) + b"\n\n", "t.jsonl"),
+    ]:
+        table = post(content, filename).json["tables"][0]["tables"][0]
+        assert table["header"] == ["id", "name", "extra"]
+        assert table["size"] == n_rows
+        assert table["rows"] == expected_rows
+
+        resp = post(content, filename, selected_tables="[0]")
+        rows = list(iter_rows(resp.json["table_ids"][0]))
+        assert [row.row for row in rows] == expected_rows
+
+    # items split between chunks
+    content = ' [ {"a": "ắ"} , {"a": [1, {"b": 2}]}, 3 ]\n'
+    file = FileStorage(io.BytesIO(content.encode()))
+    for chunk_size in [1, 2, 5, 100]:
+        items = list(upload.iter_json_array(file, chunk_size=chunk_size))
+        assert items == [{"a": "ắ"}, {"a": [1, {"b": 2}]}, 3]
+    items = [{"a": 'x\u00e9"\n', "b": [1.5e-3, -20, True, False, None]}] * 3
+    file = FileStorage(io.BytesIO(orjson.dumps(items)))
+    for chunk_size in range(1, 20):
+        assert list(upload.iter_json_array(file, chunk_size=chunk_size)) == items
+
+    # an invalid item fails without reading the rest of the file
+    content = b'[{"a": 1 "b": 2}, ' + b", ".join([b'{"a": 1}'] * 10000) + b"]"
+    file = FileStorage(io.BytesIO(content))
+    with pytest.raises(ValueError):
+        list(upload.iter_json_array(file, chunk_size=64))
+    assert file.stream.tell() <= 128
+    assert list(upload.iter_json_array(FileStorage(io.BytesIO(b"[ ]")))) == []
+
+    for content in [b'{"a": 1}', b'[{"a": 1} {"a": 2}]', b'[{"a": 1}', b"[1]"]:
+        assert post(content, "t.json").status_code == 400
+    assert post(b'[{"a": [1]}]', "t.json").status_code == 400
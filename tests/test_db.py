@@ -0,0 +1,85 @@
+import orjson
+import pytest
+from click.testing import CliRunner
+from peewee import OperationalError
+
+from sand.commands.recode import recode
+from sand.models import Link, Project, Table, TableRow, all_tables
+from sand.models.base import db, init_db, read_db, read_only_db
+from sand.models.codec import CODECS, ZSTD_TAG, decode, encode
+
+
+def test_read_only_db(tmp_path):
+    try:
+        init_db(tmp_path / "sand.db")
+        db.create_tables(all_tables)
+        assert db.execute_sql("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        Project(name="Default", description="The default project").save()
+        with read_only_db():
+            assert [p.name for p in Project.select()] == ["Default"]
+            with pytest.raises(OperationalError):
+                Project(name="Another", description="").save()
+
+        # the thread gets back its read-write connection
+        Project(name="Another", description="").save()
+        assert Project.select().count() == 2
+    finally:
+        db.close()
+        read_db.close_all()
+        init_db(":memory:")
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_codec(codec):
+    if "zstd" in codec:
+        pytest.importorskip("zstandard")
+    if "msgpack" in codec:
+        pytest.importorskip("msgpack")
+
+    value = {"nodes": [{"id": 1, "label": "Tên", "value": 1.5}], "edges": []}
+    assert decode(encode(value, codec)) == value
+    # values written by older versions are plain JSON
+    assert decode(orjson.dumps(value)) == value
+    assert decode(orjson.dumps(value).decode()) == value
+
+
+def test_recode(tmp_path):
+    pytest.importorskip("zstandard")
+    try:
+        init_db(tmp_path / "sand.db")
+        db.create_tables(all_tables)
+        project = Project.create(name="Default", description="")
+        table = Table.create(
+            name="table",
+            description="",
+            columns=["a", "b"],
+            project=project,
+            size=1,
+            context_values=[],
+            context_tree=[],
+        )
+        row = TableRow.create(
+            table=table,
+            index=0,
+            row=["x", 1.5],
+            links={"0": [Link(0, 1, None, "Q30", [])]},
+        )
+        db.close()
+        read_db.close_all()
+
+        result = CliRunner().invoke(
+            recode, ["-d", str(tmp_path / "sand.db"), "--codec", "zstd"]
+        )
+        assert result.exit_code == 0, result.output
+        init_db(tmp_path / "sand.db")
+        raw = db.execute_sql("SELECT row, links FROM tablerow").fetchone()
+        assert all(value[0] == ZSTD_TAG for value in raw)
+
+        row = TableRow.get_by_id(row.id)
+        assert row.row == ["x", 1.5]
+        assert row.links["0"][0].entity_id == "Q30"
+    finally:
+        db.close()
+        read_db.close_all()
+        init_db(":memory:")
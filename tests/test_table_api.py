@@ -0,0 +1,334 @@
+from flask.testing import FlaskClient
+
+from sand.models import Job, Table, TableRow
+from sand.models.cell_link import CellCandidateEntity, CellLink
+from sand.models.cell_search import CellSearch
+from sand.models.column_stats import (
+    ColumnProfiler,
+    ColumnStats,
+    compute_column_stats,
+)
+from sand.models.semantic_model import get_semantic_model, get_semantic_models
+from sand.models.cell_text import find_rows_by_text
+from sand.models.columnar import (
+    ColumnChunk,
+    column_fingerprints,
+    decode_values,
+    encode_values,
+    iter_column,
+    set_column_chunks,
+)
+from sand.models.table import bulk_insert_rows, iter_rows
+
+
+def test_column_fingerprints(client: FlaskClient, example_db):
+    table = Table.get_by_id(1)
+    fingerprints = column_fingerprints(table)
+    assert len(fingerprints) == len(table.columns)
+    assert column_fingerprints(table) == fingerprints
+    assert column_fingerprints(table, [2, 0]) == [fingerprints[2], fingerprints[0]]
+
+    # only the fingerprint of the modified column changes
+    row = TableRow.get((TableRow.table == table) & (TableRow.index == 1))
+    row.row[1] = "Putaleng (updated)"
+    row.save()
+    new_fingerprints = column_fingerprints(table)
+    assert [a != b for a, b in zip(fingerprints, new_fingerprints)] == [
+        ci == 1 for ci in range(len(table.columns))
+    ]
+
+
+def test_column_chunk_encoding():
+    for values in [[1, 2, -3], [1.5, 2.0], ["a", None, 1, 2.5], []]:
+        assert decode_values(encode_values(values)) == values
+    assert encode_values([1, 2, 3])[:1] == b"i"
+    assert encode_values([1.0, 2.0])[:1] == b"d"
+    assert encode_values([1, 2.0])[:1] == b"j"
+
+
+def test_column_chunks(client: FlaskClient, example_db):
+    table = Table.get_by_id(1)
+    names = [value for _, value in iter_column(table, 1)]
+    assert names[:3] == ["Fansipan", "Putaleng", "Pu Si Lung"]
+
+    set_column_chunks(True)
+    try:
+        # the chunks are built on the first change of the rows, not when they are read
+        assert [value for _, value in iter_column(table, 1)] == names
+        assert not ColumnChunk.select().where(ColumnChunk.table == table).exists()
+
+        row = TableRow.get((TableRow.table == table) & (TableRow.index == 1))
+        row.row[1] = "Putaleng (updated)"
+        row.save()
+        names[1] = "Putaleng (updated)"
+        assert ColumnChunk.select().where(ColumnChunk.table == table).count() == (
+            len(table.columns) + 1
+        )
+        assert [value for _, value in iter_column(table, 1)] == names
+
+        # only the chunk and the fingerprint of the modified column change
+        fingerprints = column_fingerprints(table)
+        chunk_ids = {
+            chunk.column: chunk.id
+            for chunk in ColumnChunk.select().where(ColumnChunk.table == table)
+        }
+        row.row[2] = "updated"
+        row.save()
+        assert {
+            chunk.column: chunk.id
+            for chunk in ColumnChunk.select().where(ColumnChunk.table == table)
+        } == chunk_ids
+        assert ColumnChunk.get_by_id(chunk_ids[2]).values[1] == "updated"
+        assert [a != b for a, b in zip(fingerprints, column_fingerprints(table))] == [
+            ci == 2 for ci in range(len(table.columns))
+        ]
+        assert column_fingerprints(table, [2]) == [column_fingerprints(table)[2]]
+
+        row.delete_instance()
+        assert [ri for ri, _ in iter_column(table, 1)] == [0] + list(range(2, 23))
+    finally:
+        set_column_chunks(False)
+
+    # the chunks are dropped when the rows change while they are disabled
+    row = TableRow.get((TableRow.table == table) & (TableRow.index == 2))
+    row.row[1] = "Pu Si Lung (updated)"
+    row.save()
+    assert not ColumnChunk.select().where(ColumnChunk.table == table).exists()
+
+
+def test_iter_rows(client: FlaskClient, example_db):
+    rows = list(iter_rows(1, batch_size=5))
+    assert [row.index for row in rows] == list(range(23))
+
+    rows = list(iter_rows(1, columns=[1, 0], with_links=False, start=3, limit=7))
+    assert [row.index for row in rows] == list(range(3, 10))
+    assert rows[0].row == ["Kỷ Quan San (Bạch Mộc Lương Tử)", "4"]
+    assert rows[0].links is None
+
+
+def test_export_linked_entities(client: FlaskClient, example_db):
+    client.put(
+        "/api/tablerow/update_column_links",
+        json={"table": 1, "column": 1, "text": "Putaleng", "entity_id": "Q30"},
+    )
+    resp = client.get("/api/table/1/export-linked-entities")
+    assert resp.status_code == 200
+    assert resp.get_data(as_text=True) == (
+        "row,col,start,end,url,entity\n" "1,1,0,8,,Q30\n"
+    )
+
+
+def test_column_link_queries(client: FlaskClient, example_db):
+    for text, entity_id in [
+        ("Putaleng", "Q30"),
+        ("Fansipan", "Q30"),
+        ("Pu Si Lung", "drepr:nil"),
+    ]:
+        client.put(
+            "/api/tablerow/update_column_links",
+            json={"table": 1, "column": 1, "text": text, "entity_id": entity_id},
+        )
+    assert CellLink.select().where(CellLink.table == 1).count() == 3
+
+    resp = client.get("/api/table/1/columns/1/links?entity=Q30")
+    assert resp.json == {"rows": [0, 1]}
+    resp = client.get("/api/table/1/columns/1/links?linked=false")
+    assert resp.json == {"rows": list(range(3, 23))}
+
+    resp = client.get("/api/table/1/columns/1/link-stats")
+    assert resp.json == {
+        "n_rows": 23,
+        "n_linked": 2,
+        "n_nil": 1,
+        "n_unlinked": 20,
+        "entities": [{"entity_id": "Q30", "count": 2}],
+    }
+
+    # links are removed with the rows
+    TableRow.get((TableRow.table == 1) & (TableRow.index == 0)).delete_instance()
+    assert CellLink.select().where(CellLink.table == 1).count() == 2
+
+
+def test_find_rows_by_text(client: FlaskClient, example_db):
+    table = Table.get_by_id(1)
+    row_ids = find_rows_by_text(table, 2, "Lai Châu")
+    rows = TableRow.select().where(TableRow.id.in_(row_ids)).order_by(TableRow.index)
+    assert [row.index for row in rows] == [1, 2, 4, 5, 9, 14]
+    # the index is on the normalized text, the endpoint only updates exact matches
+    assert len(find_rows_by_text(table, 2, " lai châu")) == 6
+
+    resp = client.put(
+        "/api/tablerow/update_column_links",
+        json={"table": 1, "column": 2, "text": "Lai Châu", "entity_id": "Q30"},
+    )
+    assert resp.status_code == 200
+    resp = client.get("/api/table/1/columns/2/links?entity=Q30")
+    assert resp.json == {"rows": [1, 2, 4, 5, 9, 14]}
+
+
+def test_update_cell_link_with_candidates(client: FlaskClient, example_db):
+    row = TableRow.get((TableRow.table == 1) & (TableRow.index == 0))
+    resp = client.put(
+        f"/api/tablerow/{row.id}/cells/1",
+        json={
+            "links": [
+                {
+                    "start": 0,
+                    "end": 8,
+                    "url": None,
+                    "entity_id": "Q30",
+                    "candidate_entities": [
+                        {"entity_id": "Q30", "probability": 0.9},
+                        {"entity_id": "Q5", "probability": 0.1},
+                    ],
+                }
+            ]
+        },
+    )
+    assert resp.status_code == 200
+    link = CellLink.get((CellLink.table == 1) & (CellLink.row_index == 0))
+    assert [
+        (c.entity_id, c.rank)
+        for c in link.candidates.order_by(CellCandidateEntity.rank)
+    ] == [
+        ("Q30", 0),
+        ("Q5", 1),
+    ]
+
+
+def test_search_cells(client: FlaskClient, example_db):
+    resp = client.get("/api/table/1/search?q=lai chau")
+    matches = resp.json["matches"]
+    assert [m["row"] for m in matches] == [1, 2, 4, 5, 9, 14]
+    assert {m["column"] for m in matches} == {2}
+    assert matches[0]["highlight"] == "<mark>Lai</mark> <mark>Châu</mark>"
+
+    # the last term is a prefix
+    resp = client.get("/api/project/1/search?q=Fansi")
+    assert [(m["table"], m["row"], m["column"]) for m in resp.json["matches"]] == [
+        (1, 0, 1)
+    ]
+    # operators of FTS5 are treated as text
+    resp = client.get('/api/table/1/search?q=" OR NOT')
+    assert resp.status_code == 200 and resp.json["matches"] == []
+
+    resp = client.get("/api/table/1/search?q=lai chau&limit=2")
+    assert [m["row"] for m in resp.json["matches"]] == [1, 2]
+    for url in ["/api/table/1/search", "/api/project/1/search"]:
+        for limit in ["abc", "0", ""]:
+            resp = client.get(f"{url}?q=lai chau&limit={limit}")
+            assert resp.status_code == 400
+
+    # the index follows updates and deletions of rows
+    row = TableRow.get((TableRow.table == 1) & (TableRow.index == 0))
+    row.row[1] = "Phan Xi Păng"
+    row.save()
+    resp = client.get("/api/table/1/search?q=fansipan")
+    assert resp.json["matches"] == []
+    resp = client.get("/api/table/1/search?q=phan xi pang")
+    assert [m["row"] for m in resp.json["matches"]] == [0]
+
+    row.delete_instance()
+    resp = client.get("/api/table/1/search?q=phan")
+    assert [m["row"] for m in resp.json["matches"]] == [20]
+    Table.get_by_id(1).delete_instance()
+    assert CellSearch.select().count() == 0
+
+
+def test_get_semantic_models(client: FlaskClient, example_db):
+    sms = get_semantic_models(1, with_data=False)
+    assert len(sms) == 1 and sms[0].data is None
+    sm = get_semantic_model(1, sms[0].name)
+    assert sm is not None and sm.data is not None
+
+    resp = client.get("/api/table/1/export-full-model?sm=unknown")
+    assert resp.status_code == 400
+    assert "unknown is not found" in resp.get_data(as_text=True)
+
+
+def test_column_stats(client: FlaskClient, example_db):
+    table = Table.get_by_id(1)
+    # computed when the table is uploaded
+    assert ColumnStats.select().where(ColumnStats.table == table).count() == len(
+        table.columns
+    )
+
+    resp = client.get("/api/table/1/column-stats")
+    assert resp.status_code == 200
+    assert (resp.json["stale"], resp.json["job_id"]) == (False, None)
+    columns = resp.json["columns"]
+    assert [c["column"] for c in columns] == list(range(len(table.columns)))
+    assert columns == [s.to_dict() for s in compute_column_stats(table)]
+
+    rank, name = columns[0], columns[1]
+    assert (rank["type"], rank["n_rows"], rank["n_nulls"]) == ("integer", 23, 0)
+    assert (rank["min"], rank["max"]) == (1, 23)
+    assert sum(rank["histogram"]["counts"]) == 23
+    assert name["type"] == "string" and name["n_distinct"] == 23
+
+    # stats are marked as stale when the rows change, the stored stats are returned
+    # until they are computed again by a job (run inline with the in-memory database)
+    row = TableRow.get((TableRow.table == table) & (TableRow.index == 0))
+    row.row[0] = ""
+    row.save()
+    assert all(s.stale for s in ColumnStats.select().where(ColumnStats.table == table))
+    resp = client.get("/api/table/1/column-stats")
+    assert resp.json["stale"] and resp.json["columns"][0]["n_nulls"] == 0
+    assert resp.json["job_id"] is None
+    assert Job.select().count() == 0
+
+    resp = client.post("/api/table/1/column-stats")
+    assert resp.status_code == 200
+    job = Job.get_by_id(resp.json["job_id"])
+    assert (job.type, job.status) == ("column_stats", "succeeded")
+
+    # no other job is started while one is pending or running
+    pending_job = Job.create(type="column_stats", params={"table": table.id})
+    assert client.post("/api/table/1/column-stats").json["job_id"] == pending_job.id
+    assert client.get("/api/table/1/column-stats").json["job_id"] == pending_job.id
+    pending_job.delete_instance()
+    resp = client.get("/api/table/1/column-stats")
+    assert not resp.json["stale"]
+    rank = resp.json["columns"][0]
+    assert (rank["n_nulls"], rank["min"], rank["stale"]) == (1, 2, False)
+
+
+def test_column_stats_not_invalidated_while_filling(client: FlaskClient, example_db):
+    table = Table.get_by_id(1)
+    rows = [
+        TableRow(table=table, index=table.size + i, row=list(r.row), links={})
+        for i, r in enumerate(iter_rows(table, with_links=False))
+    ]
+    profiler = ColumnProfiler(len(table.columns))
+    with profiler.filling(table):
+        bulk_insert_rows(rows)
+    assert not any(
+        s.stale for s in ColumnStats.select().where(ColumnStats.table == table)
+    )
+    # outside of the block, the listener invalidates the stats again
+    row = rows[0]
+    row.row[0] = ""
+    row.save()
+    assert all(s.stale for s in ColumnStats.select().where(ColumnStats.table == table))
+
+
+def test_column_profiler():
+    profiler = ColumnProfiler(3)
+    n_rows = 20000
+    for i in range(0, n_rows, 1000):
+        profiler.update(
+            [[j, f"v{j}" if j % 2 == 0 else "same", None] for j in range(i, i + 1000)]
+        )
+    ids, values, empty = [c.to_stats(1, ci) for ci, c in enumerate(profiler.columns)]
+
+    # distinct values are estimated when there are too many of them
+    assert abs(ids.n_distinct - n_rows) < 0.05 * n_rows
+    assert abs(values.n_distinct - n_rows / 2) < 0.05 * n_rows / 2
+    assert values.top_values[0] == ["same", n_rows // 2]
+    assert values.type_counts == {"integer": 0, "number": 0, "string": n_rows}
+    # the histogram is estimated from a sample of the values
+    assert (ids.min, ids.max) == (0, n_rows - 1)
+    assert all(
+        abs(c - n_rows / 20) < 0.15 * n_rows / 20 for c in ids.histogram["counts"]
+    )
+    assert (empty.type, empty.n_nulls, empty.n_distinct) == ("empty", n_rows, 0)
@@ -1,5 +1,21 @@
+import sys
+
+import orjson
 from flask.testing import FlaskClient
-from sand.controllers.transformation import compile_function
+import pytest
+from peewee import fn
+from werkzeug.exceptions import BadRequest
+from sand.controllers import transformation
+from sand.helpers import native_ops
+from RestrictedPython import safe_globals
+from sand.controllers.transformation import Context, compile_function, transform_batch
+from sand.models import Table, Transformation, TransformationUndo
+from sand.models.table import iter_rows
+from sand.models.transformation import (
+    TransformationCache,
+    restore_interrupted_executions,
+    set_cache_budget,
+)
 
 
 def test_api_transformation_map_single_line(client: FlaskClient, example_db):
@@ -782,3 +798,656 @@ def test_api_transformation_delete(client: FlaskClient, example_db):
     assert resp.status_code == 200
     assert len(response) == len(response_data)
     assert response == response_data
+
+
+def test_api_transformation_batch_mode(client: FlaskClient, example_db):
+    def run(mode: str, code: str):
+        resp = client.post(
+            "/api/transformation/test",
+            json={
+                "type": "map",
+                "table_id": 1,
+                "mode": mode,
+                "datapath": ["Tên"],
+                "code": code,
+                "tolerance": 3,
+            },
+        )
+        assert resp.status_code == 200
+        return resp.json
+
+    assert run("restrictedpython-batch", "return [v.upper() for v in values]") == run(
+        "restrictedpython", "return value.upper()"
+    )
+
+    # failed cells are reported one by one and the tolerance is the same
+    cell_results = run("restrictedpython", "return 1 // (context.index % 5)")
+    batch_results = run(
+        "restrictedpython-batch", "return [1 // (i % 5) for i in context.index]"
+    )
+    assert [(r["path"], "error" in r) for r in batch_results] == [
+        (r["path"], "error" in r) for r in cell_results
+    ]
+    assert [r["path"] for r in batch_results if "error" in r] == [0, 5, 10]
+    assert batch_results[-1]["path"] == 10
+
+
+def test_transform_batch_small_batches():
+    data = [(i, [i], Context(index=i, row=[i])) for i in range(10)]
+
+    def func(values, context):
+        return [v % 3 == 0 if v != 7 else None for v in values]
+
+    results = list(transform_batch(func, "filter", data, tolerance=2, batch_size=4))
+    assert [r.get("ok") for r in results] == [
+        v % 3 == 0 if v != 7 else None for v in range(10)
+    ]
+    assert [r["path"] for r in results if "error" in r] == [7]
+
+
+def test_api_transformation_parallel(client: FlaskClient, example_db, monkeypatch):
+    def run(tolerance: int):
+        resp = client.post(
+            "/api/transformation/test",
+            json={
+                "type": "map",
+                "table_id": 1,
+                "mode": "restrictedpython",
+                "datapath": ["Tên"],
+                "code": "return 1 // (context.index % 4)",
+                "tolerance": tolerance,
+            },
+        )
+        assert resp.status_code == 200
+        return resp.json
+
+    serial_results = [run(tolerance) for tolerance in [3, 10]]
+    monkeypatch.setattr(transformation, "SHARD_SIZE", 5)
+    transformation.init_transform_pool(2)
+    try:
+        for tolerance, expected in zip([3, 10], serial_results):
+            assert run(tolerance) == expected
+    finally:
+        transformation.init_transform_pool(0)
+    assert [r["path"] for r in serial_results[0] if "error" in r] == [0, 4, 8]
+    assert len(serial_results[1]) == 23
+
+
+def test_api_transformation_execute(client: FlaskClient, example_db):
+    # the transformation of example_db is a draft
+    steps = [
+        {
+            "name": "upper",
+            "type": "map",
+            "datapath": "Tên",
+            "outputpath": ["Upper"],
+            "code": "return value.upper()",
+            "on_error": "abort",
+            "order": 3,
+        },
+        {
+            "name": "short names",
+            "type": "filter",
+            "datapath": ["Upper"],
+            "outputpath": [],
+            "code": "return len(value) < 8",
+            "on_error": "abort",
+            "order": 4,
+        },
+        {
+            "name": "first letter",
+            "type": "map",
+            "datapath": ["Upper"],
+            "outputpath": ["First"],
+            "code": "return value[0] if context.index != 2 else value[100]",
+            "on_error": "store_error",
+            "order": 5,
+        },
+    ]
+    for step in steps:
+        resp = client.post(
+            "/api/transformation",
+            json={
+                "table": 1,
+                "mode": "restrictedpython",
+                "is_draft": False,
+                "insert_after": None,
+                **step,
+            },
+        )
+        assert resp.status_code == 200
+
+    resp = client.post("/api/transformation/execute", json={"table_id": 1})
+    assert resp.status_code == 200
+    assert resp.json["columns"][-2:] == ["Upper", "First"]
+    assert resp.json["n_errors"] == 0
+
+    rows = list(iter_rows(1))
+    assert [row.row[-2:] for row in rows[:4]] == [
+        ["FANSIPAN", ""],
+        ["PUTALENG", ""],
+        ["PU SI LUNG", ""],
+        ["KỶ QUAN SAN (BẠCH MỘC LƯƠNG TỬ)", ""],
+    ]
+    assert rows[10].row[-2:] == ["TÀ XÙA", "T"]
+    assert [row.index for row in rows if row.row[-1] != ""] == [10, 14, 19]
+
+    # the steps write to the same columns when executed again
+    client.put("/api/transformation/4", json={"code": "return value[100]"})
+    resp = client.post("/api/transformation/execute", json={"table_id": 1})
+    assert resp.json["columns"][-2:] == ["Upper", "First"]
+    assert resp.json["n_errors"] == 3
+    assert "IndexError" in list(iter_rows(1, start=10, limit=1))[0].row[-1]
+
+    # abort rolls back everything
+    client.put("/api/transformation/2", json={"code": "return value[100]"})
+    resp = client.post("/api/transformation/execute", json={"table_id": 1})
+    assert resp.status_code == 400
+    assert list(iter_rows(1, start=10, limit=1))[0].row[-2] == "TÀ XÙA"
+
+
+def test_api_transformation_execute_cache(client: FlaskClient, example_db):
+    steps = [
+        ("upper", "map", ["Tên"], ["Upper"], "return value.upper()"),
+        ("short names", "filter", ["Upper"], [], "return len(value) < 8"),
+        ("first letter", "map", ["Upper"], ["First"], "return value[0]"),
+    ]
+    for order, (name, type, datapath, outputpath, code) in enumerate(steps):
+        resp = client.post(
+            "/api/transformation",
+            json={
+                "table": 1,
+                "name": name,
+                "mode": "restrictedpython",
+                "type": type,
+                "datapath": datapath,
+                "outputpath": outputpath,
+                "code": code,
+                "on_error": "set_to_blank",
+                "is_draft": False,
+                "order": order + 3,
+                "insert_after": None,
+            },
+        )
+        assert resp.status_code == 200
+
+    resp = client.post("/api/transformation/execute", json={"table_id": 1})
+    assert resp.json["cached"] == []
+    first = [row.row[-1] for row in iter_rows(1)]
+    assert TransformationCache.select().count() == 3
+
+    resp = client.post("/api/transformation/execute", json={"table_id": 1})
+    assert resp.json["cached"] == [2, 3, 4]
+    assert [row.row[-1] for row in iter_rows(1)] == first
+
+    # only the modified step and the steps after it are run
+    client.put("/api/transformation/3", json={"code": "return len(value) < 10"})
+    resp = client.post("/api/transformation/execute", json={"table_id": 1})
+    assert resp.json["cached"] == [2]
+    rows = list(iter_rows(1))
+    assert rows[0].row[-2:] == ["FANSIPAN", "F"]
+
+    # modifying an input column invalidates the steps reading it
+    rows[0].row[1] = "Phan Xi Păng"
+    rows[0].save()
+    resp = client.post("/api/transformation/execute", json={"table_id": 1})
+    assert resp.json["cached"] == []
+    assert list(iter_rows(1, limit=1))[0].row[-2] == "PHAN XI PĂNG"
+
+    # the least recently used outputs are evicted to fit in the budget
+    sizes = [
+        r.size for r in TransformationCache.select().order_by(TransformationCache.id)
+    ]
+    set_cache_budget(sum(sizes[-3:]))
+    try:
+        client.put("/api/transformation/4", json={"code": "return value[0] "})
+        resp = client.post("/api/transformation/execute", json={"table_id": 1})
+        assert resp.json["cached"] == [2, 3]
+        assert TransformationCache.select().count() == 3
+        resp = client.post("/api/transformation/execute", json={"table_id": 1})
+        assert resp.json["cached"] == [2, 3, 4]
+    finally:
+        set_cache_budget(256 * 1024 * 1024)
+
+
+def test_get_step_keys_input_columns(client: FlaskClient, example_db, monkeypatch):
+    table = Table.get_by_id(1)
+    hashed_columns = []
+
+    def column_fingerprints(table, columns):
+        hashed_columns.append(list(columns))
+        return [str(table.id)] * len(columns)
+
+    monkeypatch.setattr(transformation, "column_fingerprints", column_fingerprints)
+    pipeline = [
+        Transformation(
+            table=table,
+            mode="restrictedpython",
+            type="map",
+            datapath=["Tên"],
+            outputpath=["Upper"],
+            code="return value.upper()",
+            on_error="set_to_blank",
+        ),
+        Transformation(
+            table=table,
+            mode="restrictedpython",
+            type="map",
+            datapath=["Upper"],
+            outputpath=[table.columns[2]],
+            code="return value[0]",
+            on_error="keep_original",
+        ),
+    ]
+    transformation.get_step_keys(table, pipeline)
+    # the new column is not hashed, and the output column of keep_original is
+    assert hashed_columns == [[1, 2]]
+
+    pipeline[1].on_error = "set_to_blank"
+    transformation.get_step_keys(table, pipeline)
+    assert hashed_columns[-1] == [1]
+
+
+def test_execute_pipeline_cache_chunks(client: FlaskClient, example_db):
+    steps = [
+        ("upper", "map", ["Tên"], ["Upper"], "return value.upper()"),
+        ("short names", "filter", ["Upper"], [], "return len(value) < 8"),
+        ("first letter", "map", ["Upper"], ["First"], "return value[0]"),
+    ]
+    for order, (name, type, datapath, outputpath, code) in enumerate(steps):
+        Transformation.create(
+            table=1,
+            name=name,
+            mode="restrictedpython",
+            type=type,
+            datapath=datapath,
+            outputpath=outputpath,
+            code=code,
+            on_error="set_to_blank",
+            is_draft=False,
+            order=order + 3,
+        )
+    table = Table.get_by_id(1)
+    pipeline = transformation.resolve_pipeline(table)
+
+    result = transformation.execute_pipeline(table, pipeline, chunk_size=5)
+    assert result.cached == []
+    rows = [row.row for row in iter_rows(1)]
+    # an output is stored per chunk of rows (23 rows)
+    assert TransformationCache.select().count() == 3 * 5
+
+    # the cached outputs are read by chunks of different sizes
+    for chunk_size in [5, 7, 100]:
+        result = transformation.execute_pipeline(table, pipeline, chunk_size=chunk_size)
+        assert result.cached == [step.id for step in pipeline]
+        assert [row.row for row in iter_rows(1)] == rows
+
+    # an output larger than the budget is not cached
+    pipeline[0].code = "return value.upper() * 10"
+    pipeline[0].save()
+    sizes = {
+        r.key: r.size
+        for r in TransformationCache.select(
+            TransformationCache.key, fn.SUM(TransformationCache.size).alias("size")
+        ).group_by(TransformationCache.key)
+    }
+    set_cache_budget(sum(sizes.values()))
+    try:
+        result = transformation.execute_pipeline(table, pipeline, chunk_size=5)
+        assert result.cached == []
+        keys = transformation.get_step_keys(table, pipeline)
+        assert (
+            not TransformationCache.select()
+            .where(TransformationCache.key == keys[0])
+            .exists()
+        )
+        assert (
+            TransformationCache.select()
+            .where(TransformationCache.key.in_(keys[1:]))
+            .count()
+            == 2 * 5
+        )
+    finally:
+        set_cache_budget(256 * 1024 * 1024)
+
+
+def test_execute_pipeline_undo(client: FlaskClient, example_db, monkeypatch):
+    for order, (name, datapath, outputpath, code, on_error) in enumerate(
+        [
+            ("upper", "Tên", ["Tên"], "return value.upper()", "set_to_blank"),
+            ("lower", "Tên", ["Lower"], "return value.lower()", "set_to_blank"),
+            (
+                "check",
+                "Tên",
+                ["Tên"],
+                "return value if context.index < 20 else value[100]",
+                "abort",
+            ),
+        ]
+    ):
+        Transformation.create(
+            table=1,
+            name=name,
+            mode="restrictedpython",
+            type="map",
+            datapath=datapath,
+            outputpath=outputpath,
+            code=code,
+            on_error=on_error,
+            is_draft=False,
+            order=order + 3,
+        )
+    table = Table.get_by_id(1)
+    pipeline = transformation.resolve_pipeline(table)
+    columns = list(table.columns)
+    rows = [row.row for row in iter_rows(1)]
+
+    # the last step aborts at row 20 after the first 4 chunks are committed
+    with pytest.raises(transformation.PipelineError):
+        transformation.execute_pipeline(table, pipeline, chunk_size=5)
+    assert Table.get_by_id(1).columns == columns
+    assert [row.row for row in iter_rows(1)] == rows
+    assert TransformationUndo.select().count() == 0
+    assert TransformationCache.select().count() == 0
+
+    # an execution interrupted before it is undone is restored on the next start
+    monkeypatch.setattr(transformation, "restore_undo", lambda table_id: None)
+    with pytest.raises(transformation.PipelineError):
+        transformation.execute_pipeline(table, pipeline, chunk_size=5)
+    assert [row.row for row in iter_rows(1)] != rows
+    assert TransformationUndo.select().count() == 1 + 4
+    with pytest.raises(BadRequest):
+        transformation.execute_pipeline(Table.get_by_id(1), pipeline, chunk_size=5)
+
+    assert restore_interrupted_executions() == 1
+    assert Table.get_by_id(1).columns == columns
+    assert [row.row for row in iter_rows(1)] == rows
+    assert TransformationUndo.select().count() == 0
+
+    pipeline[2].code = "return value"
+    result = transformation.execute_pipeline(Table.get_by_id(1), pipeline, chunk_size=5)
+    assert result.n_errors == 0
+    assert [row.row[1:2] + row.row[-1:] for row in iter_rows(1)][:2] == [
+        ["FANSIPAN", "fansipan"],
+        ["PUTALENG", "putaleng"],
+    ]
+    assert TransformationUndo.select().count() == 0
+
+
+def test_api_transformation_stream(client: FlaskClient, example_db, monkeypatch):
+    monkeypatch.setattr(transformation, "NDJSON_FLUSH_SIZE", 4)
+    payload = {
+        "type": "map",
+        "mode": "restrictedpython",
+        "datapath": ["Tên"],
+        "code": "return value[8]",
+        "tolerance": 3,
+        "table_id": 1,
+    }
+    resp = client.post("/api/transformation/test", json=payload)
+    resp_stream = client.post("/api/transformation/test?stream=true", json=payload)
+    assert resp_stream.mimetype == "application/x-ndjson"
+
+    records = [
+        orjson.loads(line) for line in resp_stream.get_data(as_text=True).splitlines()
+    ]
+    assert records[:-1] == resp.json
+    assert records[-1] == {
+        "summary": {"n_rows": len(resp.json), "n_errors": 3, "truncated": False}
+    }
+
+
+def test_api_transformation_sample(client: FlaskClient, example_db):
+    def run(**kwargs):
+        return client.post(
+            "/api/transformation/test",
+            json={
+                "type": "map",
+                "mode": "restrictedpython",
+                "datapath": ["Tên"],
+                "code": "return context.index",
+                "tolerance": 0,
+                "table_id": 1,
+                **kwargs,
+            },
+        )
+
+    resp = run(rows=5, sample="random", seed=1)
+    paths = [r["path"] for r in resp.json]
+    assert len(paths) == 5 and paths == sorted(set(paths))
+    assert [r["path"] for r in run(rows=5, sample="random", seed=1).json] == paths
+
+    # one row from each fifth of the table
+    paths = [r["path"] for r in run(rows=5, sample="stratified").json]
+    assert len(paths) == 5
+    assert all(k * 23 // 5 <= p < (k + 1) * 23 // 5 for k, p in enumerate(paths))
+
+    assert len(run(rows=50, sample="random").json) == 23
+
+    resp = run(deadline_ms=60000)
+    assert resp.json["truncated"] is False and len(resp.json["data"]) == 23
+    resp = run(deadline_ms=0)
+    assert resp.json == {"data": [], "truncated": True}
+
+
+def test_compile_function_registry(monkeypatch):
+    monkeypatch.setattr(transformation, "COMPILED_FUNCTIONS_SIZE", 2)
+    func = compile_function("return value + 1")
+    assert compile_function("return value + 1").__code__ is func.__code__
+    assert compile_function("return value + 1", "value").__code__ is not func.__code__
+
+    # functions do not share globals with each other or with RestrictedPython
+    assert "_getiter_" not in safe_globals
+    assert func.__globals__ is not compile_function("return value + 2").__globals__
+
+    # the least recently used function is evicted
+    assert compile_function("return value + 1").__code__ is not func.__code__
+    assert func(1, None) == 2
+
+
+def test_api_transformation_global_state(client: FlaskClient, example_db):
+    code = """
+global counter
+try:
+    counter = counter + 1
+except NameError:
+    counter = 1
+return counter
+"""
+    for _ in range(2):
+        resp = client.post(
+            "/api/transformation/test",
+            json={
+                "type": "map",
+                "table_id": 1,
+                "mode": "restrictedpython",
+                "datapath": ["Tên"],
+                "code": code,
+                "tolerance": 3,
+                "rows": 3,
+            },
+        )
+        assert resp.status_code == 200
+        # the state of the function is kept during an execution but not across them
+        assert [r["ok"] for r in resp.json] == [1, 2, 3]
+
+
+def test_api_transformation_native(client: FlaskClient, example_db):
+    def run(type: str, code, datapath=["Tên"], **kwargs):
+        return client.post(
+            "/api/transformation/test",
+            json={
+                "type": type,
+                "mode": "native",
+                "datapath": datapath,
+                "code": orjson.dumps(code).decode(),
+                "tolerance": 0,
+                "table_id": 1,
+                "rows": 4,
+                **kwargs,
+            },
+        )
+
+    resp = run("map", [{"op": "upper"}, {"op": "regex_extract", "pattern": r"^P\w+"}])
+    assert [r.get("ok") for r in resp.json] == [None, "PUTALENG", "PU", None]
+    assert "ValueError: 'FANSIPAN' does not match" in resp.json[0]["error"]
+
+    resp = run(
+        "split",
+        {"op": "regex_split", "pattern": r"\s*\(|\)"},
+        outputpath=["name", "alias"],
+    )
+    assert resp.json[3]["ok"] == ["Kỷ Quan San", "Bạch Mộc Lương Tử", ""]
+
+    resp = run("filter", {"op": "regex_match", "pattern": "^P"})
+    assert [r["ok"] for r in resp.json] == [False, True, True, False]
+
+    resp = run("map", {"op": "to_number"}, datapath=["Độ cao tuyệt đối (mét)"])
+    assert all(isinstance(r["ok"], (int, float)) for r in resp.json)
+
+    resp = run("concatenate", {"op": "join", "sep": "|"}, datapath=["Hạng", "Tên"])
+    assert resp.json[0]["ok"] == "1|Fansipan"
+
+    resp = run("map", {"op": "unknown"})
+    assert resp.status_code == 400 and "Invalid operator" in resp.json["message"]
+    resp = run("map", {"op": "regex_extract"})
+    assert resp.status_code == 400
+    resp = run("map", {"op": "to_number", "decimal": ",", "thousands": ","})
+    assert resp.status_code == 400 and "must be different" in resp.json["message"]
+
+
+def test_native_to_number():
+    to_number = native_ops.op_to_number()
+    assert [to_number(v) for v in ["1,500", "1.5", " 12 ", 3]] == [1500, 1.5, 12, 3]
+    # the thousands separator defaults to "." when the decimal separator is ","
+    to_number = native_ops.op_to_number(decimal=",")
+    assert [to_number(v) for v in ["1,5", "1.500", "1.500,25"]] == [1.5, 1500, 1500.25]
+    to_number = native_ops.op_to_number(decimal=",", thousands=" ")
+    assert to_number("1 500,5") == 1500.5
+
+
+def test_native_transform_chain_errors():
+    transform = native_ops.compile_native(
+        orjson.dumps(
+            [
+                {"op": "regex_extract", "pattern": r"(\S+) m", "group": 1},
+                {"op": "to_number"},
+            ]
+        ).decode()
+    )
+    # only the cell whose value fails is reported
+    results, errors = transform(["12 m", "x m", "7 m"])
+    assert results == [12, None, 7]
+    assert list(errors.keys()) == [1] and errors[1].startswith("ValueError")
+
+
+def test_api_transformation_distinct(client: FlaskClient, example_db):
+    def run(code: str, distinct: bool, datapath=["Địa phương"], type="map"):
+        resp = client.post(
+            "/api/transformation/test",
+            json={
+                "type": type,
+                "mode": "restrictedpython",
+                "datapath": datapath,
+                "code": code,
+                "tolerance": 4,
+                "table_id": 1,
+                "distinct": distinct,
+            },
+        )
+        assert resp.status_code == 200
+        return resp.json
+
+    for code in [
+        "return value.upper() if value != 'Lai Châu' else value[100]",
+        # uses the context so it is evaluated per cell
+        "return str(context.index) + value",
+    ]:
+        assert run(code, True) == run(code, False)
+    assert [
+        r["path"]
+        for r in run("return value[100] if value == 'Lai Châu' else value", True)
+        if "error" in r
+    ] == [1, 2, 4, 5]
+
+    code = "return '-'.join(value)"
+    datapath = ["Tên", "Địa phương"]
+    assert run(code, True, datapath, "concatenate") == run(
+        code, False, datapath, "concatenate"
+    )
+
+
+def test_transform_distinct_memo_overflow(monkeypatch):
+    monkeypatch.setattr(transformation, "DISTINCT_MEMO_SIZE", 3)
+    values = ["a", "b", "a", "c", "a", "d", "b", "a"]
+    data = [(i, [v], Context(index=i, row=[v])) for i, v in enumerate(values)]
+    calls = []
+
+    def func(value, context):
+        calls.append(value)
+        return value.upper()
+
+    memo = {}
+    results = list(
+        transformation.transform_distinct(
+            "restrictedpython", "map", func, data, 0, batch_size=2, memo=memo
+        )
+    )
+    assert [(r["path"], r["ok"]) for r in results] == [
+        (i, v.upper()) for i, v in enumerate(values)
+    ]
+    # the memo is evicted when it is full, so some values are evaluated again
+    assert len(memo) <= 3 and len(calls) > len(set(values))
+
+
+def test_api_transformation_profile(client: FlaskClient, example_db):
+    payload = {
+        "type": "map",
+        "mode": "restrictedpython",
+        "datapath": ["Tên"],
+        "code": "x = value.upper()\nfor i in range(100 if context.index == 3 else 1):\n    x = x.lower()\nreturn x",
+        "tolerance": 0,
+        "table_id": 1,
+        "profile": True,
+    }
+    resp = client.post("/api/transformation/test", json=payload)
+    data, profile = resp.json["data"], resp.json["profile"]
+    assert (
+        data
+        == client.post(
+            "/api/transformation/test", json={**payload, "profile": False}
+        ).json
+    )
+    assert profile["n_rows"] == 23
+    assert sum(bucket["count"] for bucket in profile["histogram"]) == 23
+    assert len(profile["slowest"]) == transformation.PROFILE_TOP_N
+    assert profile["lines"] == []
+
+    # the trace function that was set before (e.g., by coverage) is restored
+    prev_trace = sys.gettrace()
+
+    def trace(frame, event, arg):
+        return prev_trace(frame, event, arg) if prev_trace is not None else None
+
+    sys.settrace(trace)
+    try:
+        resp = client.post(
+            "/api/transformation/test", json={**payload, "profile_lines": True}
+        )
+    finally:
+        current_trace = sys.gettrace()
+        sys.settrace(prev_trace)
+    assert current_trace is trace
+    profile = resp.json["profile"]
+    # timings are not deterministic, only the line hits are
+    assert (
+        len({row["path"] for row in profile["slowest"]}) == transformation.PROFILE_TOP_N
+    )
+    assert all(row["value"] == data[row["path"]]["value"] for row in profile["slowest"])
+    assert [(line["line"], line["hits"]) for line in profile["lines"]] == [
+        (1, 23),
+        (2, 23 + 22 + 100),
+        (3, 22 + 100),
+        (4, 23),
+    ]
+    assert profile["lines"][2]["code"] == "    x = x.lower()"
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+from sand.helpers.wsgi import STREAM_QUEUE_SIZE, StreamingWSGIContainer
+
+
+def fetch(container: StreamingWSGIContainer, path: str):
+    async def main():
+        sockets = bind_sockets(0, "127.0.0.1")
+        port = sockets[0].getsockname()[1]
+        server = HTTPServer(container)
+        server.add_sockets(sockets)
+        try:
+            return await AsyncHTTPClient().fetch(
+                f"http://127.0.0.1:{port}{path}", raise_error=False
+            )
+        finally:
+            server.stop()
+
+    return asyncio.run(main())
+
+
+def test_streaming_wsgi_container():
+    n_chunks = 4 * STREAM_QUEUE_SIZE
+    threads = []
+    done = []
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        if environ["PATH_INFO"] == "/single":
+            return [b"single"]
+
+        def generate():
+            try:
+                for i in range(n_chunks):
+                    threads.append(threading.get_ident())
+                    yield f"{i}\n".encode()
+            finally:
+                threads.append(threading.get_ident())
+
+        return generate()
+
+    executor = ThreadPoolExecutor(8)
+    container = StreamingWSGIContainer(
+        app,
+        executor=executor,
+        on_response_done=lambda: done.append(threading.get_ident()),
+    )
+
+    resp = fetch(container, "/stream")
+    assert resp.code == 200
+    assert resp.body.decode() == "".join(f"{i}\n" for i in range(n_chunks))
+    assert "Content-Length" not in resp.headers
+    # the response is produced and closed by a single thread
+    assert len(threads) == n_chunks + 1
+    assert set(threads) == set(done) and len(set(threads)) == 1
+    assert threads[0] != threading.get_ident()
+
+    resp = fetch(container, "/single")
+    assert resp.body == b"single" and resp.headers["Content-Length"] == "6"
+
+    # without threads, the application runs on the event loop
+    threads.clear()
+    resp = fetch(StreamingWSGIContainer(app), "/stream")
+    assert resp.body.decode() == "".join(f"{i}\n" for i in range(n_chunks))
+    assert set(threads) == {threading.get_ident()}
+    executor.shutdown()
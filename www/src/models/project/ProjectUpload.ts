@@ -19,6 +19,8 @@ export interface RawTable {
   header: string[];
   rows: (string | number)[][];
   links: { [columnIndex: string | number]: Link[] }[];
+  // number of rows of the table, only the first rows are sent in `rows` for preview
+  size: number;
 }
 
 export interface UploadingTable {
@@ -52,6 +52,11 @@ export const RawTableComponent = withStyles(styles)(
           search={false}
           pagination={{
             pageSize: 5,
+            // only the previewed rows are paginated, the size of the table is a label
+            showTotal: (total) =>
+              table.size > total
+                ? `${table.size} rows (previewing the first ${total})`
+                : `${table.size} rows`,
             pageSizeOptions: [
               "5",
               "10",